@@ -0,0 +1,220 @@
+"""
+Activity-segment index: (participant, session, activity) -> sample offset ranges per stream.
+
+The activity schedule of every session is in outdir/campaign_datetime.csv. For a stream
+with sorted timestamps, the start/end of each activity is located once with a binary
+search, so a segment lookup is a dict access and the segment itself an iloc slice (a view
+of the frame, no boolean mask over all rows).
+
+Frames that already carry an Activity column can be indexed from the labels instead, in
+one pass over the column; an activity that occurs in several runs (e.g. the 'No Activity'
+periods between tasks) keeps one range per run.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+campaign_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "outdir", "campaign_datetime.csv")
+
+activities = ['Reading', 'Writing', 'Discussion', 'Call']
+
+# Wrangled file conditions -> campaign names in campaign_datetime.csv
+condition_campaign = {"LT": "cold", "HT": "hot"}
+
+
+class ActivitySegments:
+    """Sample ranges [lo, hi) of each activity within one stream frame."""
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Runs of equal consecutive labels, found in one pass; missing labels are skipped."""
+        labels = pd.Series(labels)
+        if isinstance(labels.dtype, pd.CategoricalDtype):
+            # Compare the integer codes; only the label of each run is looked up
+            values, names = labels.cat.codes.to_numpy(), labels.cat.categories
+        else:
+            values, names = labels.to_numpy(dtype=object), None
+        ranges = {}
+        if len(values):
+            change = np.flatnonzero(values[1:] != values[:-1]) + 1
+            bounds = np.concatenate([[0], change, [len(values)]])
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                label = values[lo]
+                if names is not None:
+                    if label < 0:
+                        continue
+                    label = names[label]
+                elif pd.isna(label):
+                    continue
+                ranges.setdefault(label, []).append((int(lo), int(hi)))
+        return cls(ranges)
+
+    @classmethod
+    def from_schedule(cls, times, intervals):
+        """Binary search of each (activity, start, end) interval in sorted times; the end is inclusive."""
+        times = np.asarray(times)
+        ranges = {}
+        for activity, start, end in intervals:
+            lo = int(np.searchsorted(times, start, side='left'))
+            hi = int(np.searchsorted(times, end, side='right'))
+            if hi > lo:
+                ranges.setdefault(activity, []).append((lo, hi))
+        return cls(ranges)
+
+    def activities(self):
+        """Activities in order of first appearance."""
+        return sorted(self.ranges, key=lambda activity: self.ranges[activity][0][0])
+
+    def __contains__(self, activity):
+        return activity in self.ranges
+
+    def take(self, df, activity):
+        """Rows of df for one activity: a slice when it is one run, the runs concatenated otherwise."""
+        runs = self.ranges.get(activity)
+        if not runs:
+            return df.iloc[0:0]
+        if len(runs) == 1:
+            return df.iloc[runs[0][0]:runs[0][1]]
+        return pd.concat([df.iloc[lo:hi] for lo, hi in runs])
+
+    def span(self, activity):
+        """(first, last) row position of an activity, or None if it does not occur."""
+        runs = self.ranges.get(activity)
+        if not runs:
+            return None
+        return runs[0][0], runs[-1][1] - 1
+
+
+def load_campaign_schedule(path=campaign_file):
+    """One row per (participant, session, activity) with tz-aware start and end times."""
+    campaign = pd.read_csv(path)
+    offsets = pd.to_datetime(campaign['DateTime'], utc=False).map(lambda t: t.utcoffset())
+    rows = []
+    for record, offset in zip(campaign.to_dict('records'), offsets):
+        m = re.match(r'^S(\d+)([A-Z])$', record['Participant_ID'])
+        for activity in activities:
+            start, end = record.get(f'{activity}_Start'), record.get(f'{activity}_End')
+            if pd.isna(start) or pd.isna(end):
+                continue
+            rows.append({
+                'participant': int(m.group(1)),
+                'session': m.group(2),
+                'campaign': record['Campaign'].lower(),
+                'activity': activity,
+                'utc_offset': offset,
+                # Activity times are local wall-clock times in the session's UTC offset
+                'start': (pd.Timestamp(start) - offset).tz_localize('UTC'),
+                'end': (pd.Timestamp(end) - offset).tz_localize('UTC'),
+            })
+    return pd.DataFrame(rows)
+
+
+def participant_number(participant):
+    """1 for 'S01', 'P01' or 1; None for an id without digits."""
+    digits = re.sub(r'\D', '', str(participant))
+    return int(digits) if digits else None
+
+
+def _search_values(times, bounds, utc_offset):
+    """Stream times and interval bounds (UTC Timestamps) as comparable numeric arrays."""
+    times = pd.Series(times)
+    if pd.api.types.is_numeric_dtype(times):
+        return times.to_numpy(), np.array([t.value / 1e9 for t in bounds])   # epoch seconds
+    times = pd.DatetimeIndex(times)
+    if times.tz is None:
+        # naive local wall-clock times
+        return times.asi8, np.array([(t + utc_offset).tz_localize(None).value for t in bounds], dtype=np.int64)
+    return times.asi8, np.array([t.value for t in bounds], dtype=np.int64)
+
+
+class SegmentIndex:
+    """
+    Activity segments of every indexed stream, keyed by (participant, session, stream).
+
+    participant may be given as 'S01', 'P01' or 1; session as the campaign letter
+    ('A'/'B'), the campaign name ('cold'/'hot') or the wrangled condition ('LT'/'HT').
+    """
+
+    def __init__(self, schedule=None):
+        self.schedule = schedule
+        self._segments = {}
+        # Built once: (participant, letter or campaign name) -> session letter, and each session's rows
+        self._letters = {}
+        self._sessions = {}
+        if schedule is not None:
+            for (number, letter), rows in schedule.groupby(['participant', 'session'], sort=False):
+                self._sessions[(number, letter)] = rows
+                self._letters[(number, letter)] = letter
+                for name in rows['campaign'].unique():
+                    self._letters.setdefault((number, name), letter)
+
+    @classmethod
+    def from_campaign(cls, path=campaign_file):
+        return cls(load_campaign_schedule(path))
+
+    def _key(self, participant, session, stream):
+        number = participant_number(participant)
+        session = str(session)
+        letter = (self._letters.get((number, session.upper()))
+                  or self._letters.get((number, condition_campaign.get(session.upper(), session.lower()))))
+        return number, letter or session, stream
+
+    def _session_rows(self, participant, session):
+        number, letter, _ = self._key(participant, session, None)
+        rows = self._sessions.get((number, letter))
+        return rows if rows is not None else self.schedule.iloc[0:0]
+
+    def intervals(self, participant, session):
+        """[(activity, start, end)] of one session from the campaign schedule."""
+        rows = self._session_rows(participant, session)
+        return list(rows[['activity', 'start', 'end']].itertuples(index=False, name=None))
+
+    def add_stream(self, participant, session, stream, times=None, labels=None):
+        """Index one stream, from its sorted time column (needs the schedule) or its Activity labels."""
+        if labels is not None:
+            segments = ActivitySegments.from_labels(labels)
+        else:
+            if self.schedule is None:
+                raise ValueError("Indexing by time needs the campaign schedule; pass labels instead.")
+            rows = self._session_rows(participant, session)
+            intervals = list(rows[['activity', 'start', 'end']].itertuples(index=False, name=None))
+            offset = rows['utc_offset'].iloc[0] if len(rows) else pd.Timedelta(0)
+            times, bounds = _search_values(times, [t for _, start, end in intervals for t in (start, end)], offset)
+            intervals = [(activity, bounds[2 * i], bounds[2 * i + 1]) for i, (activity, _, _) in enumerate(intervals)]
+            segments = ActivitySegments.from_schedule(times, intervals)
+        self._segments[self._key(participant, session, stream)] = segments
+        return segments
+
+    def segments(self, participant, session, stream):
+        return self._segments[self._key(participant, session, stream)]
+
+    def ranges(self, participant, session, activity, stream):
+        return self.segments(participant, session, stream).ranges.get(activity, [])
+
+    def take(self, df, participant, session, activity, stream):
+        return self.segments(participant, session, stream).take(df, activity)
+
+
+@lru_cache(maxsize=None)
+def campaign_index(path=campaign_file):
+    """Schedule-backed index shared within a process, or None when the campaign file is missing."""
+    if not os.path.exists(path):
+        return None
+    return SegmentIndex.from_campaign(path)
+
+
+def stream_segments(df, participant, session, stream, time_col="timestamp"):
+    """Activity segments of one stream frame: from its Activity labels, else from the campaign schedule."""
+    if "Activity" in df.columns:
+        return ActivitySegments.from_labels(df["Activity"])
+    index = campaign_index()
+    if index is None or time_col not in df.columns:
+        return ActivitySegments({})
+    return index.add_stream(participant, session, stream, times=df[time_col])
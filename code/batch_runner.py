@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _timed_call(func, item):
+    """Run func(item) and return (item, result, error, seconds); never raises."""
+    t0 = time.perf_counter()
+    try:
+        result, error = func(item), None
+    except Exception as exc:
+        result, error = None, f"{type(exc).__name__}: {exc}"
+    return item, result, error, time.perf_counter() - t0
+
+
+def run_batch(func, items, workers=1, label=os.path.basename, on_done=None):
+    """
+    Apply func to every item, serially (workers=1) or on a process pool.
+    A failing item is reported and the batch carries on. func must be a module-level
+    function (or a functools.partial of one) so that it can be sent to the workers.
+    on_done, if given, is called in this process with each outcome as it completes
+    (e.g. to checkpoint progress). Returns a list of (item, result, error, seconds)
+    in completion order.
+    """
+    items = list(items)
+    workers = max(1, min(workers, len(items) or 1))
+    t0 = time.perf_counter()
+
+    outcomes = []
+
+    def report(outcome):
+        item, _, error, seconds = outcome
+        status = "ok" if error is None else f"FAILED ({error})"
+        print(f"  [{len(outcomes) + 1}/{len(items)}] {label(item)}: {seconds:.2f} s {status}")
+        outcomes.append(outcome)
+        if on_done is not None:
+            on_done(outcome)
+
+    if workers == 1:
+        for item in items:
+            report(_timed_call(func, item))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_timed_call, func, item) for item in items]
+            for future in as_completed(futures):
+                report(future.result())
+
+    wall = time.perf_counter() - t0
+    print_summary(outcomes, wall, workers, label)
+    return outcomes
+
+
+def print_summary(outcomes, wall, workers, label=os.path.basename):
+    busy = sum(seconds for _, _, _, seconds in outcomes)
+    failed = [(item, error) for item, _, error, _ in outcomes if error is not None]
+
+    print(f"\nBatch summary: {len(outcomes)} file(s), {workers} worker(s)")
+    for item, _, error, seconds in sorted(outcomes, key=lambda o: label(o[0])):
+        print(f"  {label(item):<40} {seconds:8.2f} s  {'ok' if error is None else 'FAILED'}")
+    print(f"Total wall time: {wall:.2f} s (sum of per-file times {busy:.2f} s, "
+          f"parallel speedup {busy / wall if wall > 0 else 0:.1f}x)")
+    if failed:
+        print(f"{len(failed)} file(s) failed:")
+        for item, error in failed:
+            print(f"  - {label(item)}: {error}")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark the columnar expand_data against the original row-wise implementation
+(expand_data_rowwise, also the reference of tests/test_expand_data.py).
+
+Usage:
+    python benchmark_expand_data.py --rows 20000 --repeat 3
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from emotibitDataWrangling import expand_data, expected_rates, parse_packets
+
+
+def expand_data_rowwise(df, expected_rates):
+    """Original iterrows implementation, kept verbatim as the reference."""
+    eda_data, ppg_data, temp_data, motion_data = [], [], [], []
+
+    for _, row in df.iterrows():
+        timestamp = row["ts"]  # Base timestamp
+
+        try:
+            sensor_data = json.loads(row["data"])
+        except json.JSONDecodeError:
+            continue  # Skip rows with corrupted JSON
+
+        # EDA
+        if "eda" in sensor_data:
+            interval = 1 / expected_rates["EDA"]
+            times = [timestamp + (interval * i) for i in range(len(sensor_data["eda"]))]
+            for ts, eda, edl in zip(
+                times,
+                sensor_data["eda"],
+                sensor_data.get("edl", [None] * len(sensor_data["eda"]))
+            ):
+                eda_data.append({
+                    "timestamp": ts,
+                    "EDA": round(eda, 2),
+                    "EDL": round(edl, 2) if edl is not None else None
+                })
+
+        # PPG
+        if "pgi" in sensor_data:
+            interval = 1 / expected_rates["PPG"]
+            times = [timestamp + (interval * i) for i in range(len(sensor_data["pgi"]))]
+            for ts, pgi, pgr, pgg in zip(
+                times,
+                sensor_data["pgi"],
+                sensor_data.get("pgr", [None] * len(sensor_data["pgi"])),
+                sensor_data.get("pgg", [None] * len(sensor_data["pgi"]))
+            ):
+                ppg_data.append({
+                    "timestamp": ts,
+                    "PI": round(pgi, 2),
+                    "PR": round(pgr, 2) if pgr is not None else None,
+                    "PG": round(pgg, 2) if pgg is not None else None
+                })
+
+        # Temperature
+        if "thr" in sensor_data:
+            interval = 1 / expected_rates["Temperature"]
+            times = [timestamp + (interval * i) for i in range(len(sensor_data["thr"]))]
+            for ts, thr in zip(times, sensor_data["thr"]):
+                temp_data.append({"timestamp": ts, "Temp": round(thr, 2)})
+
+        # Motion
+        if "acx" in sensor_data:
+            interval = 1 / expected_rates["Motion"]
+            times = [timestamp + (interval * i) for i in range(len(sensor_data["acx"]))]
+            for ts, acx, acy, acz, gyx, gyy, gyz, mgx, mgy, mgz in zip(
+                times,
+                sensor_data["acx"], sensor_data["acy"], sensor_data["acz"],
+                sensor_data["gyx"], sensor_data["gyy"], sensor_data["gyz"],
+                sensor_data["mgx"], sensor_data["mgy"], sensor_data["mgz"]
+            ):
+                motion_data.append({
+                    "timestamp": ts,
+                    "ACC_x": round(acx, 2), "ACC_y": round(acy, 2), "ACC_z": round(acz, 2),
+                    "GY_x": round(gyx, 2),  "GY_y": round(gyy, 2),  "GY_z": round(gyz, 2),
+                    "MG_x": round(mgx, 2),  "MG_y": round(mgy, 2),  "MG_z": round(mgz, 2)
+                })
+
+    return eda_data, ppg_data, temp_data, motion_data
+
+
+def make_raw_rows(n_rows, seed=0, start_ts=1723016400.0):
+    """Synthetic raw EmotiBit rows: one JSON packet per second, as written by the logger."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_rows):
+        packet = {
+            "eda": rng.normal(0.3, 0.05, 15).tolist(),
+            "edl": rng.normal(26500, 50, 15).tolist(),
+            "pgi": rng.normal(153000, 500, 25).tolist(),
+            "pgr": rng.normal(107000, 500, 25).tolist(),
+            "pgg": rng.normal(7200, 50, 25).tolist(),
+        }
+        if i % 2 == 0:
+            packet["thr"] = rng.normal(33.0, 0.1, 15).tolist()
+        for key in ("acx", "acy", "acz", "gyx", "gyy", "gyz", "mgx", "mgy", "mgz"):
+            packet[key] = rng.normal(0, 1, 25).tolist()
+        rows.append({"ts": start_ts + i, "data": json.dumps(packet)})
+    rows[n_rows // 2]["data"] = '{"eda": [0.1, 0.2'  # one corrupted packet
+    return pd.DataFrame(rows)
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EmotiBit JSON-packet expansion.")
+    parser.add_argument("--rows", type=int, default=20000, help="Number of raw rows (1 row = 1 s of data).")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions; the best time is reported.")
+    args = parser.parse_args()
+
+    df = make_raw_rows(args.rows)
+
+    t_old, old = best_of(lambda: expand_data_rowwise(df, expected_rates), args.repeat)
+    t_new, new = best_of(lambda: expand_data(df, expected_rates), args.repeat)
+    t_json, _ = best_of(lambda: parse_packets(df["data"]), args.repeat)
+
+    for name, records, frame in zip(["EDA", "PPG", "Temp", "Motion"], old, new):
+        # Equivalence is checked by tests/test_expand_data.py; this only reports it
+        reference = pd.DataFrame(records, columns=frame.columns).astype(float)
+        n_exact = int((frame.to_numpy() == reference.to_numpy()).all(axis=1).sum())
+        print(f"  {name:<7} {len(frame):>9} samples, {n_exact} rows bit-identical")
+
+    print(f"row-wise : {t_old:8.3f} s")
+    print(f"columnar : {t_new:8.3f} s")
+    print(f"  of which JSON decoding: {t_json:.3f} s")
+    print(f"speedup  : {t_old / t_new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
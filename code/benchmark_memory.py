@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark of the typed stream schema (float32 signals, categorical Activity) and
+the blocked multi-channel filtering and Welch spectra, against the code before them.
+
+A synthetic session is written as Parquet streams; each stream kind is then loaded and
+processed by the cohort feature code (eeg_cohort / emotibit_cohort session_features) in
+a fresh process, once with this tree and once with the reference tree: the code directory
+of a checkout from before the typed schema (--reference), or a git revision of it that is
+extracted to a temporary directory (--before). Reported per run: the in-memory size of the
+loaded frames and the peak RSS above that of a warm-up run on the first minute (Linux/macOS).
+
+Usage:
+    python benchmark_memory.py --minutes 60 --before <revision before the typed schema>
+    python benchmark_memory.py --minutes 60 --reference ../../wepop-before/code
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+here = os.path.dirname(os.path.abspath(__file__))
+session = ("P99", "HT")
+activities = ["Reading", "No Activity", "Writing", "No Activity", "Discussion", "No Activity", "Call"]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def make_session(directory, minutes, seed=0, start_ts=1723016400.0):
+    """EEG (with an Activity column) and EmotiBit eda/ppg/motion streams of one session, as Parquet; returns the base path."""
+    from eeg_features import fs as eeg_fs, channels
+    from emotibitDataWrangling import expected_rates, packet_layout
+    from stream_store import write_stream
+
+    rng = np.random.default_rng(seed)
+    folder = os.path.join(directory, session[0])
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"{session[0]}_{session[1]}")
+
+    n = int(minutes * 60 * eeg_fs)
+    eeg = pd.DataFrame({"timestamp": start_ts + np.arange(n) / eeg_fs})
+    for ch in channels:
+        eeg[ch] = np.round(rng.normal(0, 10, n), 3)
+    eeg["Activity"] = np.array(activities)[np.arange(n) * len(activities) // n]
+    write_stream(eeg, base + "_eeg.parquet")
+
+    for stream, suffix in (("EDA", "eda"), ("PPG", "ppg"), ("Motion", "motion")):
+        rate = expected_rates[stream]
+        n = int(minutes * 60 * rate)
+        t = np.arange(n) / rate
+        df = pd.DataFrame({"timestamp": start_ts + t})
+        for col, _, _ in packet_layout[stream]:
+            if stream == "PPG":
+                values = 1e5 + 500 * np.sin(2 * np.pi * 1.2 * t) + rng.normal(0, 20, n)
+            elif stream == "EDA":
+                values = 0.5 + 0.1 * np.sin(2 * np.pi * t / 60) + rng.normal(0, 0.01, n)
+            else:
+                values = rng.normal(0, 1, n)
+            df[col] = np.round(values, 2)
+        write_stream(df, f"{base}_{suffix}.parquet")
+    return base
+
+
+def run(kind, base):
+    """
+    Load and process one stream kind of the session with the modules on sys.path (this tree,
+    or the reference put first by the caller); returns frame MB and peak RSS MB above the warm-up.
+    """
+    import eeg_cohort
+    import emotibit_cohort
+    from stream_store import read_stream
+
+    def load():
+        if kind == "eeg":
+            return [read_stream(base + "_eeg.parquet")]
+        return [read_stream(base + "_eda.parquet"),
+                read_stream(base + "_ppg.parquet").rename(columns=emotibit_cohort.ppg_columns),
+                read_stream(base + "_motion.parquet")]
+
+    def process(frames):
+        if kind == "eeg":
+            eeg_cohort.session_features(frames[0], *session)
+        else:
+            emotibit_cohort.session_features(*frames, *session)
+
+    # Warm-up on the first minute: lazy imports, BLAS buffers etc. are not part of the session's cost
+    process([df[df["timestamp"] < df["timestamp"].iloc[0] + 60].copy() for df in load()])
+    baseline = peak_rss_mb()
+    frames = load()
+    frame_mb = sum(df.memory_usage(deep=True).sum() for df in frames) / 1e6
+    process(frames)
+    return {"frame_mb": frame_mb, "peak_mb": peak_rss_mb() - baseline}
+
+
+def extract_revision(revision, directory):
+    """The code directory of a git revision, extracted into directory (git archive); returns its path."""
+    top, prefix = subprocess.run(["git", "rev-parse", "--show-toplevel", "--show-prefix"], cwd=here,
+                                 capture_output=True, text=True, check=True).stdout.splitlines()
+    archive = subprocess.run(["git", "archive", "--format=tar", f"{revision}:{prefix}"], cwd=top,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory, filter="data")
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of one session, this tree vs the code before the typed schema.")
+    parser.add_argument("--minutes", type=float, default=60, help="Length of the synthetic session.")
+    reference = parser.add_mutually_exclusive_group()
+    reference.add_argument("--reference", default=None, help="Code directory of a checkout before the typed schema.")
+    reference.add_argument("--before", default=None, help="Git revision before the typed schema (extracted with git archive).")
+    parser.add_argument("--child", nargs=3, metavar=("KIND", "BASE", "CODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, base, code = args.child
+        if code != "-":
+            sys.path.insert(0, os.path.abspath(code))  # ahead of this script's directory
+        if kind == "make":
+            make_session(base, args.minutes)
+        else:
+            print(json.dumps(run(kind, base)))
+        return
+    if not (args.reference or args.before):
+        parser.error("give the code to compare against: --reference DIR or --before REVISION")
+
+    def child(*argv):
+        # A fresh interpreter per run, so one run's peak does not hide the other's. The peak RSS
+        # of a process survives exec, so this process itself never holds a session in memory.
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--minutes", str(args.minutes), "--child",
+                              *argv], capture_output=True, text=True, check=True)
+        return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else None
+
+    with tempfile.TemporaryDirectory() as directory:
+        before = args.reference or extract_revision(args.before, os.path.join(directory, "before"))
+        child("make", directory, "-")
+        base = os.path.join(directory, session[0], f"{session[0]}_{session[1]}")
+        print(f"{args.minutes:g} min session (EEG at 256 Hz; EDA, PPG and motion at the EmotiBit rates), "
+              f"before: {args.before or args.reference}")
+        for kind in ("eeg", "emotibit"):
+            old, new = (json.loads(child(kind, base, code)) for code in (before, "-"))
+            print(f"  {kind:<9} before -> now: frames {old['frame_mb']:8.1f} MB -> {new['frame_mb']:8.1f} MB "
+                  f"({new['frame_mb'] / old['frame_mb']:.0%}),  peak RSS +{old['peak_mb']:7.1f} MB -> "
+                  f"+{new['peak_mb']:7.1f} MB ({new['peak_mb'] / max(old['peak_mb'], 1e-9):.0%})")
+
+
+if __name__ == "__main__":
+    main()
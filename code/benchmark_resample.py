@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark resample_data against the original per-column interp1d implementation
+(resample_data_interp1d, also the reference of tests/test_resample.py).
+
+Usage:
+    python benchmark_resample.py --seconds 7200 --repeat 3
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
+
+from emotibitDataWrangling import resample_data, expected_rates, packet_layout
+
+
+def resample_data_interp1d(df, expected_rate):
+    """Original implementation, kept verbatim as the reference."""
+    if df.empty:
+        return df  # If DataFrame is empty, return as is
+
+    df = df.sort_values(by="timestamp")  # Ensure timestamps are ordered
+
+    # Build a uniform time grid; include the end if it falls exactly on-grid
+    start_t = df["timestamp"].min()
+    end_t = df["timestamp"].max()
+    step = 1.0 / expected_rate
+    time_range = np.arange(start_t, end_t + 0.5 * step, step)
+
+    # Interpolate numeric columns (skip non-numeric)
+    resampled = {"timestamp": time_range}
+    for col in df.columns:
+        if col == "timestamp":
+            continue
+        if not np.issubdtype(df[col].dtype, np.number):
+            # optional: skip non-numeric columns (e.g., categorical flags)
+            continue
+        interp_func = interp1d(
+            df["timestamp"].values,
+            df[col].values,
+            kind="linear",
+            fill_value="extrapolate",
+            assume_sorted=True
+        )
+        resampled[col] = np.round(interp_func(time_range), 2)
+
+    return pd.DataFrame(resampled)
+
+
+def make_expanded_stream(stream, seconds, seed=0, start_ts=1723016400.0):
+    """Jittered, slightly unsorted samples as produced by expand_data for one stream."""
+    rng = np.random.default_rng(seed)
+    rate = expected_rates[stream]
+    n = int(seconds * rate)
+    ts = start_ts + np.arange(n) / rate + rng.normal(0, 0.1 / rate, n)
+    data = {"timestamp": ts}
+    for col, _, _ in packet_layout[stream]:
+        data[col] = np.round(np.cumsum(rng.normal(0, 1, n)), 2)
+    return pd.DataFrame(data)
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resample_data.")
+    parser.add_argument("--seconds", type=int, default=7200, help="Length of the synthetic session.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions; the best time is reported.")
+    args = parser.parse_args()
+
+    total_old = total_new = 0.0
+    for i, stream in enumerate(packet_layout):
+        df = make_expanded_stream(stream, args.seconds, seed=i)
+        rate = expected_rates[stream]
+        t_old, old = best_of(lambda: resample_data_interp1d(df, rate), args.repeat)
+        t_new, new = best_of(lambda: resample_data(df, rate), args.repeat)
+        total_old += t_old
+        total_new += t_new
+        print(f"  {stream:<12} {len(df):>9} samples x {df.shape[1] - 1} col(s): "
+              f"interp1d {t_old:.3f} s, grid {t_new:.3f} s ({t_old / t_new:.1f}x)"
+              f"{', identical' if new.equals(old) else ', DIFFERENT'}")
+
+    print(f"total: interp1d {total_old:.3f} s, grid {total_new:.3f} s, speedup {total_old / total_new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the pipeline stages on seeded synthetic data (synthetic_data),
+at several cohort sizes (participant-sessions):
+
+    wrangle_emotibit  raw EmotiBit packets -> resampled streams   (process_emotibit_files)
+    wrangle_eeg       Muse CSV -> stream and memory-mapped store   (process_eeg_files)
+    env, survey       environment merge, perception survey rounds
+    filter            EEG band-pass/notch, EmotiBit motion band-pass and EDA smoothing
+    psd               Welch spectra of every EEG session and activity
+    features          EEG and EmotiBit cohort feature tables       (run_cohort)
+    align             per-session alignment of all streams         (align_cohort)
+    plot              EmotiBit EDA/SCR/HR figures and EEG band-power figures (PNG, headless)
+
+For every size the raw data is generated (not timed), then every stage is run with
+outputs rebuilt from scratch; stages that depend on others pull them in. Times come from
+the instrumentation records, so each result also carries the per-function breakdown
+(expand_data, resample_data, welch, ...). Everything is written to one JSON file (and a
+CSV of the stage results next to it) together with the library versions and machine;
+--baseline compares a run against an earlier file and flags stages whose time per
+session changed by more than --threshold.
+
+CPU times cover this process only; keep --workers 1 (the default) for comparable runs.
+The older benchmark_*.py scripts compare single functions against their reference
+implementations and are kept for that purpose.
+
+Usage:
+    python benchmark_suite.py --sessions 1 10 100 --minutes 5 --output ../benchmarks/baseline.json
+    python benchmark_suite.py --sessions 1 10 --baseline ../benchmarks/baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import scipy
+
+import eeg_cohort
+import emotibit_cohort
+from activity_index import stream_segments
+from eegDataWrangling import process_eeg_files
+from eeg_data_processing import band_analysis_all_channels
+from eeg_store import session_store
+from eeg_features import channels as eeg_channels, filter_data, fs as eeg_fs, welch_nperseg
+from emotibitDataWrangling import process_emotibit_files
+from env_processing import process_env_files
+from instrumentation import disable, enable, read_records, stage, summarise
+from perception_survey_responses import process_survey
+from plot_backend import set_batch_mode
+from psd_cache import PSDCache
+from stream_store import read_stream
+from synthetic_data import write_dataset
+from time_align import align_cohort
+
+stages = ["wrangle_emotibit", "wrangle_eeg", "env", "survey", "filter", "psd", "features", "align", "plot"]
+
+# Stages whose inputs another stage writes
+requires = {
+    "filter": ["wrangle_emotibit", "wrangle_eeg"],
+    "psd": ["wrangle_eeg"],
+    "features": ["wrangle_emotibit", "wrangle_eeg"],
+    "align": ["wrangle_emotibit", "wrangle_eeg", "env", "survey"],
+    "plot": ["wrangle_emotibit", "wrangle_eeg", "features"],
+}
+
+
+def with_requirements(selected):
+    """The selected stages and the stages they need, in pipeline order."""
+    wanted = set(selected)
+    for name in selected:
+        wanted.update(requires.get(name, []))
+    return [name for name in stages if name in wanted]
+
+
+def run_stage(name, ctx):
+    """Run one benchmark stage; ctx holds the raw inputs, output directories, workers and sizes."""
+    inputs, out, workers = ctx["inputs"], ctx["out"], ctx["workers"]
+    tag = "bench:" + name
+
+    if name == "wrangle_emotibit":
+        with stage(tag, rows=ctx["n_sessions"] * ctx["seconds"]):  # raw packets
+            process_emotibit_files(inputs["emotibit"], out["phys"], workers=workers, force=True)
+    elif name == "wrangle_eeg":
+        with stage(tag, rows=ctx["n_sessions"] * ctx["seconds"] * eeg_fs):
+            process_eeg_files(inputs["eeg"], out["phys"], workers=workers, force=True)
+    elif name == "env":
+        with stage(tag):
+            process_env_files(inputs["env"], out["env"], force=True)
+    elif name == "survey":
+        with stage(tag):
+            process_survey(inputs["survey"], out["survey"])
+    elif name == "filter":
+        # Reading the streams is not part of the stage; one record per session
+        for _, path in eeg_cohort.find_sessions(out["phys"]).items():
+            df = read_stream(path)
+            with stage(tag, rows=len(df)):
+                filter_data(df, eeg_channels)
+        for _, paths in emotibit_cohort.find_sessions(out["phys"]).items():
+            eda, motion = read_stream(paths["eda"]), read_stream(paths["motion"])
+            with stage(tag, rows=len(eda) + len(motion)):
+                emotibit_cohort.preprocess(eda, motion)
+    elif name == "psd":
+        psd_cache = PSDCache()
+        for (participant, condition), path in eeg_cohort.find_sessions(out["phys"]).items():
+            df = filter_data(read_stream(path), eeg_channels)
+            segments = stream_segments(df, participant, condition, "eeg")
+            with stage(tag, rows=len(df)):
+                psd_cache.spectra(participant, condition, "All", df, eeg_channels, eeg_fs, nperseg=welch_nperseg)
+                for activity in segments.activities():
+                    psd_cache.spectra(participant, condition, activity, segments.take(df, activity), eeg_channels,
+                                      eeg_fs, nperseg=welch_nperseg)
+    elif name == "features":
+        with stage(tag):
+            eeg_cohort.run_cohort(out["phys"], out["features"], workers=workers, force=True)
+            emotibit_cohort.run_cohort(out["phys"], out["features"], workers=workers, force=True)
+    elif name == "align":
+        with stage(tag):
+            align_cohort(out["phys"], out["aligned"], env_dir=out["env"], survey_path=out["survey"], workers=workers,
+                         force=True)
+    elif name == "plot":
+        set_batch_mode()
+        rr_cache_dir = os.path.join(out["features"], "rr_cache")
+        for job in emotibit_cohort.find_sessions(out["phys"]).items():
+            with stage(tag):
+                emotibit_cohort.render_session_figures(job, out["figures"], formats=["png"], rr_cache_dir=rr_cache_dir)
+        psd_cache = PSDCache()
+        for (participant, condition), path in eeg_cohort.find_sessions(out["phys"]).items():
+            store = session_store(path, participant, condition)
+            with stage(tag, rows=len(store)):
+                band_analysis_all_channels(store, eeg_channels, eeg_fs, condition, participant, psd_cache,
+                                           save_path=out["figures"])
+    else:
+        raise ValueError(f"Unknown benchmark stage: {name}")
+
+
+def run_size(n_sessions, minutes, seed, workers, selected, work_dir, verbose=False):
+    """Generate n sessions under work_dir and run the stages; returns (stage rows, function rows, generation s)."""
+    t0 = time.perf_counter()
+    inputs = write_dataset(os.path.join(work_dir, "raw"), n_sessions, minutes, seed)
+    generate_s = time.perf_counter() - t0
+
+    out = {name: os.path.join(work_dir, name) for name in ("phys", "env", "features", "aligned", "figures")}
+    out["survey"] = os.path.join(work_dir, "survey", "perception_survey_responses.csv")
+    ctx = {"inputs": inputs, "out": out, "workers": workers, "n_sessions": n_sessions, "seconds": int(minutes * 60)}
+
+    metrics = enable(os.path.join(work_dir, "metrics"))
+    try:
+        for name in selected:
+            print(f"  {n_sessions} session(s): {name}...", flush=True)
+            with contextlib.ExitStack() as quiet:
+                if not verbose:
+                    quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+                run_stage(name, ctx)
+    finally:
+        disable()
+
+    summary = summarise(read_records(metrics))
+    bench = summary["stage"].str.startswith("bench:")
+    results = []
+    for row in summary[bench].to_dict("records"):
+        name = row["stage"][len("bench:"):]
+        results.append({
+            "sessions": n_sessions,
+            "stage": name,
+            "wall_s": row["wall_s"],
+            "cpu_s": row["cpu_s"],
+            "per_session_s": row["wall_s"] / n_sessions,
+            "rows": row["rows"],
+            "rows_per_s": row["rows_per_s"],
+            "peak_rss_mb": row["peak_rss_mb"],
+        })
+    results.sort(key=lambda r: stages.index(r["stage"]))
+    functions = [{"sessions": n_sessions, **row} for row in summary[~bench].to_dict("records")]
+    return results, functions, generate_s
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(baseline_path, results, threshold):
+    """
+    Stage results next to the baseline's, with the ratio of time per session and a flag
+    beyond threshold; returns (table, baseline report).
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    keys = ["sessions", "stage"]
+    old = pd.DataFrame(baseline["results"]).set_index(keys)[["per_session_s"]]
+    new = pd.DataFrame(results).set_index(keys)[["per_session_s"]]
+    table = old.join(new, how="inner", lsuffix="_baseline", rsuffix="_current")
+    table["ratio"] = table["per_session_s_current"] / table["per_session_s_baseline"]
+    table["flag"] = ""
+    table.loc[table["ratio"] > 1 + threshold, "flag"] = "slower"
+    table.loc[table["ratio"] < 1 / (1 + threshold), "flag"] = "faster"
+    return table.round(4), baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic cohorts of several sizes.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100],
+                        help="Cohort sizes (participant-sessions) to run.")
+    parser.add_argument("--minutes", type=float, default=5, help="Length of each synthetic session.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generators.")
+    parser.add_argument("--workers", type=int, default=1, help="Workers of the batch stages (CPU times cover 1 only).")
+    parser.add_argument("--stages", nargs="+", choices=stages, default=stages,
+                        help="Stages to time (the stages they depend on are run too).")
+    parser.add_argument("--output", default="../benchmarks/benchmark_results.json", help="Results file (JSON).")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative change in time per session flagged by --baseline.")
+    parser.add_argument("--keep", default=None, help="Keep the generated data and outputs in this directory.")
+    parser.add_argument("--verbose", action="store_true", help="Show the stages' own output.")
+    args = parser.parse_args()
+
+    selected = with_requirements(args.stages)
+    results, functions, generation = [], [], {}
+    for n_sessions in sorted(set(args.sessions)):
+        work_dir = os.path.join(args.keep, f"sessions_{n_sessions}") if args.keep else tempfile.mkdtemp()
+        try:
+            stage_rows, function_rows, generate_s = run_size(n_sessions, args.minutes, args.seed, args.workers,
+                                                             selected, work_dir, args.verbose)
+        finally:
+            if not args.keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        results += stage_rows
+        functions += function_rows
+        generation[str(n_sessions)] = round(generate_s, 3)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "config": {"sessions": sorted(set(args.sessions)), "minutes": args.minutes, "seed": args.seed,
+                   "workers": args.workers, "stages": selected},
+        "generation_s": generation,
+        "results": results,
+        "functions": functions,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, default=float)
+    pd.DataFrame(results).to_csv(os.path.splitext(args.output)[0] + ".csv", index=False)
+
+    table = pd.DataFrame(results)
+    print(f"\n{'sessions':>8} {'stage':<17} {'wall s':>9} {'s/session':>10} {'rows/s':>14} {'peak MB':>8}")
+    for row in table.itertuples(index=False):
+        rate = "" if row.rows_per_s != row.rows_per_s else f"{row.rows_per_s:,.0f}"
+        print(f"{row.sessions:>8} {row.stage:<17} {row.wall_s:>9.2f} {row.per_session_s:>10.3f} {rate:>14} "
+              f"{row.peak_rss_mb:>8.0f}")
+    print(f"\nResults written to: {args.output}")
+
+    if args.baseline:
+        table, baseline = compare(args.baseline, results, args.threshold)
+        for key in ("environment", "config"):
+            differs = {k: v for k, v in baseline.get(key, {}).items() if report[key].get(k) != v and k != "sessions"}
+            if differs:
+                print(f"Note: the baseline's {key} differs: {differs}")
+        print(f"\nAgainst {args.baseline}:")
+        print(table.to_string())
+        if (table["flag"] == "slower").any():
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, read in 1 MiB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_digest(params):
+    """Stable hash of a JSON-serialisable parameter set (code version, rates, columns...)."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """
+    Record of what produced each output: the content hash of its raw inputs and the
+    hash of the parameters it was built with. An output is current when it still
+    exists and both hashes match; anything else is rebuilt.
+
+    Entries are kept per output file, so changing a parameter only invalidates the
+    outputs that were built with it. Input hashes are cached by (size, mtime) so an
+    unchanged raw file is not re-read on every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.inputs = {}
+        self.outputs = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.inputs = data.get("inputs", {})
+            self.outputs = data.get("outputs", {})
+
+    def _key(self, output):
+        return os.path.relpath(os.path.abspath(output), self.root).replace(os.sep, "/")
+
+    def input_digest(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        cached = self.inputs.get(path)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["sha256"]
+        digest = file_digest(path)
+        self.inputs[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def _entry(self, inputs, params):
+        return {
+            "inputs": {os.path.basename(p): self.input_digest(p) for p in sorted(inputs)},
+            "params": params_digest(params),
+        }
+
+    def is_current(self, output, inputs, params):
+        if not os.path.exists(output):
+            return False
+        return self.outputs.get(self._key(output)) == self._entry(inputs, params)
+
+    def record(self, output, inputs, params):
+        self.outputs[self._key(output)] = self._entry(inputs, params)
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"inputs": self.inputs, "outputs": self.outputs}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
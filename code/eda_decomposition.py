@@ -0,0 +1,174 @@
+"""
+EDA tonic/phasic decomposition and SCR detection.
+
+The tonic level (skin conductance level, SCL) is the lower envelope of the EDA, estimated
+by asymmetric least squares: a Whittaker smoother (second-difference penalty) whose
+weights are refitted so that points above the curve (the responses) barely pull on it.
+Every iteration is one banded (pentadiagonal) Cholesky solve, so a full session costs a
+few O(n) passes. Missing samples (NaN) get zero weight and are bridged by the smoother.
+
+The phasic component is EDA minus tonic. Skin conductance responses (SCRs) are its peaks
+(after a light low-pass) with a prominence of at least min_amplitude; each SCR has an
+onset (the lowest point since the previous SCR, at most max_rise_time back), a peak, an
+amplitude and a rise time. Onsets of all SCRs are found at once from the troughs of the
+signal, so detection is O(n log n) overall.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solveh_banded
+from scipy.signal import butter, find_peaks, sosfiltfilt
+
+from instrumentation import instrumented
+from stream_schema import as_signal
+
+# Highest frequency (Hz) followed by the tonic level
+tonic_cutoff = 0.05
+
+# Weight of the samples above the tonic curve, and refits of the weights
+asymmetry = 0.01
+iterations = 10
+
+# Low-pass (Hz) of the phasic component before peak detection
+phasic_cutoff = 1.0
+
+# Smallest SCR amplitude (µS), and how far back (s) the onset of a response is searched
+min_amplitude = 0.01
+max_rise_time = 10.0
+
+scr_columns = ["onset", "peak", "onset_time", "peak_time", "amplitude", "rise_time"]
+
+
+def smoothing_penalty(fs, cutoff=tonic_cutoff):
+    """Whittaker penalty whose half-power frequency is cutoff Hz at fs Hz: (fs / (2 pi cutoff))^4."""
+    return (fs / (2 * np.pi * cutoff)) ** 4
+
+
+def _penalty_bands(n, penalty):
+    """Upper banded form of penalty * D'D for the second-difference matrix D (n x n, pentadiagonal)."""
+    bands = np.zeros((3, n))
+    bands[2] = 6.0
+    bands[2, [0, -1]] = 1.0
+    bands[2, [1, -2]] = 5.0
+    bands[1, 1:] = -4.0
+    bands[1, [1, -1]] = -2.0
+    bands[0, 2:] = 1.0
+    return penalty * bands
+
+
+def tonic_level(eda, fs, cutoff=tonic_cutoff, p=asymmetry, n_iter=iterations):
+    """Lower-envelope (asymmetric least squares) estimate of the tonic level of eda."""
+    y = np.asarray(eda, dtype=float)
+    n = len(y)
+    valid = np.isfinite(y)
+    if n < 3 or valid.sum() < 3:
+        return np.full(n, np.nanmedian(y) if valid.any() else np.nan)
+    y = np.where(valid, y, 0.0)
+    bands = _penalty_bands(n, smoothing_penalty(fs, cutoff))
+    weights = valid.astype(float)
+    tonic = y
+    for _ in range(n_iter):
+        system = bands.copy()
+        system[2] += weights
+        tonic = solveh_banded(system, weights * y, check_finite=False)
+        updated = np.where(y > tonic, p, 1 - p) * valid
+        if np.array_equal(updated, weights):
+            break
+        weights = updated
+    return tonic
+
+
+def decompose(eda, fs, cutoff=tonic_cutoff):
+    """(tonic, phasic) components of eda."""
+    eda = np.asarray(eda, dtype=float)
+    tonic = tonic_level(eda, fs, cutoff)
+    return tonic, eda - tonic
+
+
+def _lowpass(x, fs, cutoff=phasic_cutoff, order=2):
+    sos = butter(order, cutoff, btype="low", fs=fs, output="sos")
+    return sosfiltfilt(sos, x) if len(x) > 3 * (2 * len(sos) + 1) else x
+
+
+def _group_argmin(values, positions, groups, n_groups):
+    """Position of the smallest value in every group (groups 0..n_groups-1, each non-empty)."""
+    order = np.lexsort((values, groups))
+    _, first = np.unique(groups[order], return_index=True)
+    result = np.empty(n_groups, dtype=np.int64)
+    result[groups[order][first]] = positions[order][first]
+    return result
+
+
+def detect_scrs(phasic, fs, times=None, amplitude=min_amplitude, max_rise=max_rise_time):
+    """
+    SCR table of a phasic component: onset and peak (sample positions and times, from
+    times or seconds from the first sample), amplitude (µS) and rise time (s). The onset
+    is the lowest point since the previous SCR peak, at most max_rise seconds back.
+    """
+    phasic = np.asarray(phasic, dtype=float)
+    empty = pd.DataFrame({c: np.empty(0, dtype=np.int64 if c in ("onset", "peak") else float) for c in scr_columns})
+    valid = np.isfinite(phasic)
+    if valid.sum() < 3:
+        return empty
+    signal = _lowpass(pd.Series(phasic).interpolate(limit_direction="both").to_numpy(), fs)
+
+    peaks, _ = find_peaks(signal, prominence=amplitude)
+    peaks = peaks[valid[peaks]]  # not in a bridged gap
+    if not len(peaks):
+        return empty
+
+    # Candidate onsets of each peak: the troughs in [lower, peak) plus lower itself
+    troughs, _ = find_peaks(-signal)
+    lower = np.maximum(np.concatenate([[0], peaks[:-1]]), peaks - int(max_rise * fs))
+    lo, hi = np.searchsorted(troughs, lower), np.searchsorted(troughs, peaks)
+    counts = hi - lo
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.concatenate([troughs[np.repeat(lo, counts) + within], lower])
+    groups = np.concatenate([np.repeat(np.arange(len(peaks)), counts), np.arange(len(peaks))])
+    onsets = _group_argmin(signal[positions], positions, groups, len(peaks))
+
+    amplitudes = signal[peaks] - signal[onsets]
+    keep = amplitudes >= amplitude
+    peaks, onsets, amplitudes = peaks[keep], onsets[keep], amplitudes[keep]
+
+    t = np.arange(len(phasic)) / fs if times is None else pd.Series(times).to_numpy()
+    return pd.DataFrame({
+        "onset": onsets, "peak": peaks, "onset_time": t[onsets], "peak_time": t[peaks],
+        "amplitude": amplitudes, "rise_time": (peaks - onsets) / fs,
+    })
+
+
+@instrumented()
+def decompose_frame(data, fs, time_col=None, column="EDA"):
+    """
+    data with 'EDA Tonic' and 'EDA Phasic' columns (in the dtype of column; the other
+    columns are shared with data), and the SCR table of the whole recording (onset/peak are
+    row positions in data).
+    """
+    tonic, phasic = decompose(data[column].to_numpy(dtype=float), fs)
+    decomposed = data.assign(**{"EDA Tonic": as_signal(tonic, data[column]),
+                                "EDA Phasic": as_signal(phasic, data[column])})
+    scrs = detect_scrs(phasic, fs, times=data[time_col] if time_col else None)
+    return decomposed, scrs
+
+
+def scrs_in(scrs, index):
+    """SCRs whose peak lies in index (the row positions of a segment of the decomposed frame)."""
+    return scrs[np.isin(scrs["peak"].to_numpy(), np.asarray(index))]
+
+
+def scr_features(segment, scrs, fs):
+    """
+    Per-segment EDA statistics: SCR count, rate (per min), mean amplitude (µS) and rise
+    time (s), mean tonic level (SCL, µS) and phasic area above zero (µS s).
+    """
+    minutes = len(segment) / fs / 60
+    phasic = segment["EDA Phasic"].to_numpy(dtype=float)
+    return {
+        "SCR Count": len(scrs),
+        "SCR Rate": len(scrs) / minutes if minutes > 0 else np.nan,
+        "SCR Mean Amplitude": scrs["amplitude"].mean() if len(scrs) else np.nan,
+        "SCR Mean Rise Time": scrs["rise_time"].mean() if len(scrs) else np.nan,
+        "SCL Mean": np.nanmean(segment["EDA Tonic"]) if len(segment) else np.nan,
+        "Phasic AUC": np.nansum(np.clip(phasic, 0, None)) / fs,
+    }
@@ -1,60 +1,140 @@
 import os
 import re
+import argparse
+from functools import partial
+
 import pandas as pd
 
-def process_eeg_files(input_directory, output_root):
-    # Regex: P##_<condition>_<rest>.csv  → groups: (participant, condition)
-    # Examples matched: P01_HT_Session1.csv, P12_Base_runA.csv
-    fname_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_.+\.csv$')
-
-    for filename in os.listdir(input_directory):
-        if not filename.lower().endswith(".csv"):
-            continue
-
-        m = fname_re.match(filename)
-        if not m:
-            # Fail fast to avoid writing into wrong places
-            raise ValueError(
-                f"Filename '{filename}' does not match pattern "
-                "'P<digits>_<condition>_<rest>.csv' (e.g., 'P01_HT_Session1.csv')."
-            )
-
-        participant = m.group(1)               # e.g., P01
-        condition = m.group(2).upper()         # normalize e.g., HT
-        prefix = f"{participant}_{condition}"  # e.g., P01_HT
-
-        input_path = os.path.join(input_directory, filename)
-
-        # Create one folder per participant
-        participant_dir = os.path.join(output_root, participant)
-        os.makedirs(participant_dir, exist_ok=True)
-
-        # Define output filename (flat per participant)
-        output_filename = f"{prefix}_eeg.csv"
-        output_path = os.path.join(participant_dir, output_filename)
-
-        # Load the CSV
-        df = pd.read_csv(input_path)
-
-        # Drop user/usernames if present
-        cols_to_drop = [col for col in ['user', 'usernames'] if col in df.columns]
-        if cols_to_drop:
-            df.drop(columns=cols_to_drop, inplace=True, errors='ignore')
-
-        # Rename 'ts' → 'timestamp' and move to first column
-        if 'ts' in df.columns:
-            df = df.rename(columns={'ts': 'timestamp'})
-        # If 'timestamp' exists (original or renamed), move it to the front
-        if 'timestamp' in df.columns:
-            other_cols = [c for c in df.columns if c != 'timestamp']
-            df = df[['timestamp'] + other_cols]
-
-        # Save cleaned file into participant folder
-        df.to_csv(output_path, index=False)
-        print(f"Processed and saved: {output_path}")
+from activity_index import stream_segments
+from batch_runner import run_batch
+from build_cache import BuildManifest
+from eeg_store import store_paths, store_version, write_eeg_store
+from instrumentation import instrumented
+from stream_store import formats, default_format, stream_path, write_stream
+
+# Regex: P##_<condition>_<rest>.csv  → groups: (participant, condition)
+# Examples matched: P01_HT_Session1.csv, P12_Base_runA.csv
+fname_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_.+\.csv$')
+
+# Columns removed from the raw Muse export
+drop_columns = ['user', 'usernames']
+
+# Bump when the cleaning logic changes so cached outputs are rebuilt
+eeg_params = {"version": "1", "drop_columns": drop_columns}
+store_params = {**eeg_params, "store": store_version}
+
+manifest_name = ".eeg_manifest.json"
+
+
+def parse_filename(filename):
+    m = fname_re.match(filename)
+    if not m:
+        # Fail fast to avoid writing into wrong places
+        raise ValueError(
+            f"Filename '{filename}' does not match pattern "
+            "'P<digits>_<condition>_<rest>.csv' (e.g., 'P01_HT_Session1.csv')."
+        )
+
+    participant = m.group(1)               # e.g., P01
+    condition = m.group(2).upper()         # normalize e.g., HT
+    return participant, condition
+
+
+def eeg_output_path(input_path, output_root, fmt=default_format):
+    participant, condition = parse_filename(os.path.basename(input_path))
+    # Flat per participant, e.g. P01/P01_HT_eeg.parquet
+    return stream_path(os.path.join(output_root, participant, f"{participant}_{condition}_eeg"), fmt)
+
+
+def eeg_store_header(input_path, output_root):
+    """Header path of the memory-mapped store written next to the stream, e.g. P01/P01_HT_eeg.json."""
+    base = os.path.splitext(eeg_output_path(input_path, output_root, "csv"))[0]
+    return store_paths(base)[2]
+
+
+@instrumented()
+def process_eeg_file(input_path, output_root, fmt=default_format, mmap=True):
+    output_path = eeg_output_path(input_path, output_root, fmt)
+
+    # Create one folder per participant
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # Load the CSV
+    df = pd.read_csv(input_path)
+
+    # Drop user/usernames if present
+    cols_to_drop = [col for col in drop_columns if col in df.columns]
+    if cols_to_drop:
+        df.drop(columns=cols_to_drop, inplace=True, errors='ignore')
+
+    # Rename 'ts' → 'timestamp' and move to first column
+    if 'ts' in df.columns:
+        df = df.rename(columns={'ts': 'timestamp'})
+    # If 'timestamp' exists (original or renamed), move it to the front
+    if 'timestamp' in df.columns:
+        other_cols = [c for c in df.columns if c != 'timestamp']
+        df = df[['timestamp'] + other_cols]
+
+    # Save cleaned file into participant folder
+    write_stream(df, output_path)
+
+    # Memory-mapped copy for random access by time window or activity
+    if mmap:
+        participant, condition = parse_filename(os.path.basename(input_path))
+        write_eeg_store(df, os.path.splitext(output_path)[0],
+                        segments=stream_segments(df, participant, condition, "eeg"))
+    return output_path
+
+
+def process_eeg_files(input_directory, output_root, workers=1, force=False, fmt=default_format, mmap=True):
+    filenames = sorted(f for f in os.listdir(input_directory) if f.lower().endswith(".csv"))
+
+    # Validate every name before anything is written
+    for filename in filenames:
+        parse_filename(filename)
+
+    # Skip files whose raw content and cleaning parameters are unchanged
+    manifest = BuildManifest(os.path.join(output_root, manifest_name))
+    input_paths = [os.path.join(input_directory, f) for f in filenames]
+    stale = [
+        p for p in input_paths
+        if force or not manifest.is_current(eeg_output_path(p, output_root, fmt), [p], eeg_params)
+        or (mmap and not manifest.is_current(eeg_store_header(p, output_root), [p], store_params))
+    ]
+    print(f"{len(input_paths) - len(stale)} of {len(input_paths)} file(s) up to date, "
+          f"processing {len(stale)} with {workers} worker(s)...")
+
+    outcomes = run_batch(partial(process_eeg_file, output_root=output_root, fmt=fmt, mmap=mmap), stale,
+                         workers=workers)
+
+    for input_path, output_path, error, _ in outcomes:
+        if error is None:
+            manifest.record(output_path, [input_path], eeg_params)
+            if mmap:
+                manifest.record(eeg_store_header(input_path, output_root), [input_path], store_params)
+    manifest.save()
+    return outcomes
+
 
 # Set your input and output directories
 indir = "../datasets/raw/eeg/"
 outdir = "../datasets/transformed/phys/"
 
-process_eeg_files(indir, outdir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean Muse EEG CSV files into the per-participant layout.")
+    parser.add_argument("--input", default=indir, help="Directory with raw P##_<cond>_*.csv files.")
+    parser.add_argument("--output", default=outdir, help="Root of the per-participant output folders.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of files processed in parallel.")
+    parser.add_argument("--force", action="store_true", help="Rebuild every output, ignoring the manifest.")
+    parser.add_argument("--format", choices=sorted(formats), default=default_format, help="Output storage format.")
+    parser.add_argument("--no-mmap", action="store_true",
+                        help="Do not write the memory-mapped store (.f32/.i64/.json) next to each stream.")
+    args = parser.parse_args()
+
+    process_eeg_files(args.input, args.output, workers=args.workers, force=args.force, fmt=args.format,
+                      mmap=not args.no_mmap)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Cohort EEG feature extraction.
+
+Finds every <P##>_<cond>_eeg stream under the transformed tree, filters it and computes
+the time/frequency features and band power per activity and channel, on a worker pool.
+Each session is written as a part file; the parts are then combined into one tidy table
+(participant, condition, activity, channel, features...). Sessions whose input and
+parameters are unchanged are skipped, so an interrupted run can simply be restarted.
+
+Usage:
+    python eeg_cohort.py --input ../datasets/transformed/phys/ --output ../datasets/features/ --workers 16
+"""
+
+import argparse
+import os
+import re
+from functools import partial
+from glob import glob
+
+import pandas as pd
+
+from activity_index import stream_segments
+from batch_runner import run_batch
+from build_cache import BuildManifest
+from instrumentation import instrumented
+from eeg_features import (fs, lowcut, highcut, channels, bands, welch_nperseg, filter_data,
+                          extract_features, band_power)
+from eeg_store import session_store
+from psd_cache import PSDCache
+from stream_store import formats, default_format, stream_path, read_stream, write_stream
+
+session_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_eeg(\.[a-z]+)$')
+
+# Preferred input when a session exists in several formats
+format_preference = [".parquet", ".arrow", ".csv"]
+
+# Bump when the feature definitions change so every part is recomputed
+feature_params = {
+    "version": "3",
+    "fs": fs,
+    "filter": [lowcut, highcut, 50.0],
+    "channels": channels,
+    "bands": bands,
+    "nperseg": welch_nperseg,
+}
+
+manifest_name = ".eeg_features_manifest.json"
+
+
+def find_sessions(input_root):
+    """Map (participant, condition) -> EEG stream path, one per session."""
+    sessions = {}
+    for path in sorted(glob(os.path.join(input_root, "*", "*_eeg.*"))):
+        m = session_re.match(os.path.basename(path))
+        if not m or m.group(3) not in format_preference:
+            continue
+        key = (m.group(1), m.group(2).upper())
+        current = sessions.get(key)
+        if current is None or format_preference.index(m.group(3)) < format_preference.index(os.path.splitext(current)[1]):
+            sessions[key] = path
+    return sessions
+
+
+@instrumented("eeg_session_features")
+def session_features(df, participant, condition, segments=None):
+    """
+    Tidy feature rows for the whole session ('All') and for each activity, per channel.
+    segments: ActivitySegments of df's rows (e.g. from its EEG store); found from df otherwise.
+    """
+    filtered = filter_data(df, channels)
+    psd_cache = PSDCache()
+
+    activity_segments = segments if segments is not None else stream_segments(filtered, participant, condition, "eeg")
+    segments = [("All", filtered)]
+    segments += [(activity, activity_segments.take(filtered, activity)) for activity in activity_segments.activities()]
+
+    rows = []
+    for activity, segment in segments:
+        if segment.empty:
+            continue
+        features = extract_features(segment, channels)
+        spectra = psd_cache.spectra(participant, condition, activity, segment, channels, fs, nperseg=welch_nperseg)
+        for ch in channels:
+            rows.append({
+                "participant": participant,
+                "condition": condition,
+                "activity": activity,
+                "channel": ch,
+                "n_samples": len(segment),
+                **features[ch],
+                **band_power(*spectra[ch], bands),
+            })
+    return pd.DataFrame(rows)
+
+
+def part_path(parts_dir, participant, condition, fmt=default_format):
+    return stream_path(os.path.join(parts_dir, f"{participant}_{condition}_eeg_features"), fmt)
+
+
+def process_session(job, parts_dir, fmt=default_format):
+    (participant, condition), path = job
+    # The channels and activity segments from the session's memory-mapped store, not the whole stream file
+    store = session_store(path, participant, condition)
+    table = session_features(store.frame(channels=channels), participant, condition, segments=store.segments)
+    os.makedirs(parts_dir, exist_ok=True)
+    return write_stream(table, part_path(parts_dir, participant, condition, fmt))
+
+
+def run_cohort(input_root, output_dir, workers=1, force=False, fmt=default_format):
+    sessions = find_sessions(input_root)
+    parts_dir = os.path.join(output_dir, "eeg_parts")
+    manifest = BuildManifest(os.path.join(output_dir, manifest_name))
+
+    jobs = [
+        (key, path) for key, path in sessions.items()
+        if force or not manifest.is_current(part_path(parts_dir, *key, fmt), [path], feature_params)
+    ]
+    print(f"{len(sessions) - len(jobs)} of {len(sessions)} EEG session(s) already done, "
+          f"processing {len(jobs)} with {workers} worker(s)...")
+
+    def checkpoint(outcome):
+        (_, path), part, error, _ = outcome
+        if error is None:
+            manifest.record(part, [path], feature_params)
+            manifest.save()
+
+    run_batch(partial(process_session, parts_dir=parts_dir, fmt=fmt), jobs, workers=workers,
+              label=lambda job: os.path.basename(job[1]), on_done=checkpoint)
+
+    parts = [part_path(parts_dir, *key, fmt) for key in sessions]
+    parts = [p for p in parts if os.path.exists(p)]
+    if not parts:
+        print("No EEG features to combine.")
+        return None
+
+    cohort = pd.concat([read_stream(p) for p in parts], ignore_index=True)
+    output_file = write_stream(cohort, stream_path(os.path.join(output_dir, "eeg_cohort_features"), fmt))
+    print(f"Saved cohort EEG features ({len(cohort)} rows, {len(parts)} session(s)) to: {output_file}")
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract EEG features for every participant and session.")
+    parser.add_argument("--input", default="../datasets/transformed/phys/", help="Root of the per-participant streams.")
+    parser.add_argument("--output", default="../datasets/features/", help="Directory for the cohort feature table.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of sessions processed in parallel.")
+    parser.add_argument("--force", action="store_true", help="Recompute every session, ignoring the manifest.")
+    parser.add_argument("--format", choices=sorted(formats), default=default_format, help="Output storage format.")
+    args = parser.parse_args()
+
+    run_cohort(args.input, args.output, workers=args.workers, force=args.force, fmt=args.format)
+
+
+if __name__ == "__main__":
+    main()
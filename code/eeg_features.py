@@ -0,0 +1,77 @@
+import numpy as np
+
+from filter_bank import FilterBank
+from instrumentation import instrumented
+
+# np.trapz was renamed to np.trapezoid in NumPy 2.0
+trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+# Define bandpass filter parameters
+lowcut = 0.5
+highcut = 50.0
+fs = 256  # Assuming a sampling frequency of 256 Hz
+
+# Channels to filter
+channels = ['tp9', 'af7', 'af8', 'tp10']
+
+# Define frequency bands
+bands = {
+    "Delta": (0.5, 4),
+    "Theta": (4, 8),
+    "Alpha": (8, 13),
+    "Beta": (13, 30),
+    "Gamma": (30, 50)
+}
+
+welch_nperseg = 1024
+
+# Band-pass (0.5-50 Hz) and 50 Hz notch, designed once as second-order sections
+eeg_filter_bank = FilterBank(fs, band=(lowcut, highcut), notch=50.0, order=4, quality=30.0)
+
+# Apply filtering to all EEG channels in one call (the same design at another sampling rate when fs is given)
+@instrumented()
+def filter_data(df, channels, fs=fs):
+    bank = eeg_filter_bank if fs == eeg_filter_bank.fs else FilterBank(fs, band=(lowcut, highcut), notch=50.0, order=4,
+                                                                          quality=30.0)
+    return bank.filter_frame(df, channels)
+
+# Define feature extraction functions
+def calculate_time_domain_features(data):
+    return {
+        'mean': np.mean(data),
+        'std_dev': np.std(data),
+        'min': np.min(data),
+        'max': np.max(data),
+        'range': np.max(data) - np.min(data)
+    }
+
+def calculate_frequency_domain_features(data, fs=256):
+    freqs, psd = np.fft.rfftfreq(len(data), 1/fs), np.abs(np.fft.rfft(data))**2
+    return {
+        'mean_psd': np.mean(psd),
+        'max_psd': np.max(psd),
+        'freq_with_max_psd': freqs[np.argmax(psd)]
+    }
+
+# Extract features for each channel and activity
+@instrumented()
+def extract_features(df, channels):
+    features = {}
+    for ch in channels:
+        time_features = calculate_time_domain_features(df[ch])
+        freq_features = calculate_frequency_domain_features(df[ch])
+        features[ch] = {**time_features, **freq_features}
+    return features
+
+# Function to calculate band-specific power from a (cached) Welch spectrum
+def band_power(freqs, psd, bands):
+    band_powers = {}
+    for band, (low, high) in bands.items():
+        band_power = trapezoid(psd[(freqs >= low) & (freqs <= high)], freqs[(freqs >= low) & (freqs <= high)])
+        band_powers[band] = band_power
+    return band_powers
+
+# Function to compute band-specific power
+def compute_band_power(freq, power, band):
+    band_freq = (freq >= band[0]) & (freq <= band[1])
+    return np.sum(power[band_freq])
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped raw EEG store.
+
+A session is kept as three files next to its stream file (e.g. P01/P01_HT_eeg.parquet):
+
+    P01_HT_eeg.f32   float32 samples, channel-major (n_channels x n_samples)
+    P01_HT_eeg.i64   int64 timestamps (epoch nanoseconds), one per sample, sorted
+    P01_HT_eeg.json  header: channels, sample count, time range, nominal rate and the
+                     sample ranges of each activity
+
+EEGStore maps the files read-only, so opening a session reads only the header. A time
+window is located by a binary search in the timestamp index and returned as NumPy views
+into the mapping (no copy, and only the pages touched are read from disk); an activity
+is one view per run. Frames for the pandas feature functions are built on request.
+
+The analysis scripts open a session with session_store(stream_path): the store next to
+the stream, (re)written from it when missing or older than the stream file.
+
+Usage (summary of a store, or of one activity / time window in it):
+    python eeg_store.py --input ../datasets/transformed/phys/P01/P01_HT_eeg --activity Reading
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from activity_index import ActivitySegments, stream_segments
+from eeg_features import channels as eeg_channels
+from stream_store import read_stream
+from timebase import to_epoch_ns
+
+store_version = 1
+data_suffix, index_suffix, header_suffix = ".f32", ".i64", ".json"
+
+
+def store_paths(base):
+    """(data, index, header) paths of the store with the given path without extension."""
+    return base + data_suffix, base + index_suffix, base + header_suffix
+
+
+def write_eeg_store(df, base, channels=None, time_col="timestamp", segments=None, unit="s"):
+    """
+    Write the channels of df (default: the EEG channels present) as a store at base.
+    segments: optional ActivitySegments of df's rows, kept in the header. Returns the
+    header path; the header is written last, so a store with a header is complete.
+
+    Window lookups binary-search the index, so rows without a time are left out and rows
+    out of time order are put in order (a stable sort, so equal times keep their order);
+    the channels and segments follow. The header counts both (dropped_rows, reordered_rows).
+    """
+    channels = [ch for ch in (channels or eeg_channels) if ch in df.columns]
+    data_path, index_path, header_path = store_paths(base)
+    timestamps = to_epoch_ns(df[time_col], unit=unit) if len(df) else np.empty(0, dtype=np.int64)
+    n_rows = len(timestamps)
+
+    # Rows of df in store order: the timed rows, sorted by time; None when that is every row as is
+    order = np.flatnonzero(timestamps != np.iinfo(np.int64).min)  # not NaT
+    reordered = 0
+    if np.any(np.diff(timestamps[order]) < 0):
+        perm = np.argsort(timestamps[order], kind="stable")
+        reordered = int(np.count_nonzero(perm != np.arange(len(perm))))
+        order = order[perm]
+    if len(order) == n_rows and not reordered:
+        order = None
+    else:
+        timestamps = timestamps[order]
+        if segments is not None:
+            segments = _reorder_segments(segments, order, n_rows)
+    n = len(timestamps)
+
+    # One channel at a time into the mapped file, so no transposed copy of the frame is built
+    if n and channels:
+        data = np.memmap(data_path + ".tmp", dtype=np.float32, mode="w+", shape=(len(channels), n))
+        for i, ch in enumerate(channels):
+            values = df[ch].to_numpy(dtype=np.float32)
+            data[i] = values if order is None else values[order]
+        data.flush()
+        del data
+    else:
+        open(data_path + ".tmp", "wb").close()
+    timestamps.astype(np.int64).tofile(index_path + ".tmp")
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(index_path + ".tmp", index_path)
+
+    header = {
+        "version": store_version,
+        "layout": "channel-major",
+        "dtype": "float32",
+        "channels": channels,
+        "n_samples": n,
+        "time_unit": "ns",
+        "dropped_rows": int(n_rows - n),
+        "reordered_rows": reordered,
+        "start_ns": int(timestamps[0]) if n else None,
+        "end_ns": int(timestamps[-1]) if n else None,
+        "fs": float((n - 1) / ((timestamps[-1] - timestamps[0]) / 1e9)) if n > 1 and timestamps[-1] > timestamps[0]
+        else None,
+        "data": os.path.basename(data_path),
+        "index": os.path.basename(index_path),
+        "activities": {str(activity): [[lo, hi] for lo, hi in runs]
+                       for activity, runs in (segments.ranges.items() if segments is not None else [])},
+    }
+    with open(header_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=1)
+    os.replace(header_path + ".tmp", header_path)
+    return header_path
+
+
+def _reorder_segments(segments, order, n_rows):
+    """segments of the rows order[0], order[1], ... of a frame of n_rows rows; runs are split or joined as needed."""
+    position = np.full(n_rows, -1, dtype=np.int64)
+    position[order] = np.arange(len(order))
+    ranges = {}
+    for activity, runs in segments.ranges.items():
+        rows = np.unique(np.concatenate([position[lo:hi] for lo, hi in runs] or [position[:0]]))
+        rows = rows[rows >= 0]
+        if len(rows):
+            breaks = np.flatnonzero(np.diff(rows) > 1) + 1
+            starts = rows[np.concatenate([[0], breaks])]
+            ends = rows[np.concatenate([breaks - 1, [len(rows) - 1]])] + 1
+            ranges[activity] = list(zip(starts.tolist(), ends.tolist()))
+    return ActivitySegments(ranges)
+
+
+def session_store(stream_path, participant=None, session=None, time_col=None):
+    """
+    EEGStore of a session stream file, e.g. P01/P01_HT_eeg.parquet -> P01/P01_HT_eeg.*. The
+    wrangler writes it; when it is missing or older than the stream (annotated files, or a
+    run with --no-mmap) it is written here from the stream, with the activity segments of
+    its labels or the campaign schedule. time_col defaults to timestamp, else DateTime.
+    """
+    base = os.path.splitext(stream_path)[0]
+    header_path = store_paths(base)[2]
+    if not os.path.exists(header_path) or os.path.getmtime(header_path) < os.path.getmtime(stream_path):
+        df = read_stream(stream_path)
+        time_col = time_col or ("timestamp" if "timestamp" in df.columns else "DateTime")
+        write_eeg_store(df, base, time_col=time_col,
+                        segments=stream_segments(df, participant, session, "eeg", time_col=time_col))
+    return EEGStore(base)
+
+
+def _bound_ns(value):
+    """Epoch nanoseconds of a window bound: epoch seconds, a datetime or a string (naive = UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(round(float(value) * 1e9))
+    stamp = pd.Timestamp(value)
+    return (stamp.tz_localize("UTC") if stamp.tzinfo is None else stamp).value
+
+
+class EEGStore:
+    """Read-only, memory-mapped access to one session written by write_eeg_store."""
+
+    def __init__(self, base):
+        self.base = base
+        data_path, index_path, header_path = store_paths(base)
+        with open(header_path, "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.channels = self.header["channels"]
+        n = self.header["n_samples"]
+        if n and self.channels:
+            self.data = np.memmap(data_path, dtype=np.float32, mode="r", shape=(len(self.channels), n))
+            self.timestamps = np.memmap(index_path, dtype=np.int64, mode="r", shape=(n,))
+        else:
+            self.data = np.empty((len(self.channels), 0), dtype=np.float32)
+            self.timestamps = np.empty(0, dtype=np.int64)
+        self.segments = ActivitySegments({activity: [tuple(run) for run in runs]
+                                          for activity, runs in self.header["activities"].items()})
+
+    def __len__(self):
+        return self.header["n_samples"]
+
+    @property
+    def fs(self):
+        return self.header["fs"]
+
+    def positions(self, start=None, end=None):
+        """Sample range [lo, hi) of the window start <= t <= end (either bound may be None)."""
+        start, end = _bound_ns(start), _bound_ns(end)
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, start, side="left"))
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, end, side="right"))
+        return lo, max(hi, lo)
+
+    def _rows(self, channels):
+        """Row selector of the requested channels: a slice (view) when they are adjacent and in order."""
+        if channels is None:
+            return slice(None)
+        rows = [self.channels.index(ch) for ch in ([channels] if isinstance(channels, str) else channels)]
+        if rows == list(range(rows[0], rows[0] + len(rows))):
+            return slice(rows[0], rows[0] + len(rows))
+        return rows  # fancy indexing: a copy
+
+    def window(self, start=None, end=None, channels=None):
+        """(timestamps, signals) of a time window: int64 ns view and (channels x samples) float32 view."""
+        lo, hi = self.positions(start, end)
+        return self.timestamps[lo:hi], self.data[self._rows(channels), lo:hi]
+
+    def activity(self, activity, channels=None):
+        """[(timestamps, signals), ...] views, one per run of the activity (empty if it does not occur)."""
+        rows = self._rows(channels)
+        return [(self.timestamps[lo:hi], self.data[rows, lo:hi]) for lo, hi in self.segments.ranges.get(activity, [])]
+
+    def _frame(self, runs, channels):
+        names = self.channels if channels is None else ([channels] if isinstance(channels, str) else list(channels))
+        timestamps = np.concatenate([t for t, _ in runs]) if runs else np.empty(0, dtype=np.int64)
+        signals = np.concatenate([s for _, s in runs], axis=1) if runs else np.empty((len(names), 0), np.float32)
+        frame = pd.DataFrame({"timestamp": timestamps / 1e9})
+        for i, ch in enumerate(names):
+            frame[ch] = signals[i]
+        return frame
+
+    def frame(self, start=None, end=None, channels=None):
+        """DataFrame (timestamp in epoch seconds, one column per channel) of a time window; a copy."""
+        return self._frame([self.window(start, end, channels)], channels)
+
+    def activity_frame(self, activity, channels=None):
+        """DataFrame of an activity's runs, concatenated; a copy."""
+        return self._frame(self.activity(activity, channels), channels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a memory-mapped EEG store, or one window of it.")
+    parser.add_argument("--input", required=True, help="Store path without extension, e.g. P01/P01_HT_eeg.")
+    parser.add_argument("--activity", default=None, help="Activity to summarise.")
+    parser.add_argument("--start", default=None, help="Window start (epoch seconds or a UTC timestamp).")
+    parser.add_argument("--end", default=None, help="Window end (epoch seconds or a UTC timestamp).")
+    args = parser.parse_args()
+
+    store = EEGStore(args.input)
+    print(f"{args.input}: {len(store)} samples x {len(store.channels)} channels ({', '.join(store.channels)}), "
+          f"fs {store.fs}, activities: {', '.join(store.segments.activities()) or 'none'}")
+
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+
+    if args.activity:
+        runs = store.activity(args.activity)
+    elif args.start or args.end:
+        runs = [store.window(number(args.start), number(args.end))]
+    else:
+        return
+    for timestamps, signals in runs:
+        if not len(timestamps):
+            print("  (no samples)")
+            continue
+        print(f"  {pd.to_datetime(timestamps[0], utc=True)} - {pd.to_datetime(timestamps[-1], utc=True)}: "
+              f"{len(timestamps)} samples, channel means {[round(float(m), 3) for m in signals.mean(axis=1)]}")
+
+
+if __name__ == "__main__":
+    main()
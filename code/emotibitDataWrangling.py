@@ -1,10 +1,17 @@
 import os
 import re
+import argparse
 import pandas as pd
 import numpy as np
 import json
-from scipy.interpolate import interp1d
+from itertools import chain
 from glob import glob
+from functools import partial
+
+from batch_runner import run_batch
+from build_cache import BuildManifest
+from instrumentation import instrumented
+from stream_store import formats, default_format, stream_path, write_stream, StreamWriter
 
 # Expected frequencies for each sensor
 expected_rates = {
@@ -14,108 +21,233 @@ expected_rates = {
     "Motion": 25
 }
 
+# Packet layout per stream: (output column, JSON key, optional).
+# The first key of each stream decides whether a packet carries that stream.
+packet_layout = {
+    "EDA": [("EDA", "eda", False), ("EDL", "edl", True)],
+    "PPG": [("PI", "pgi", False), ("PR", "pgr", True), ("PG", "pgg", True)],
+    "Temperature": [("Temp", "thr", False)],
+    "Motion": [
+        ("ACC_x", "acx", False), ("ACC_y", "acy", False), ("ACC_z", "acz", False),
+        ("GY_x", "gyx", False),  ("GY_y", "gyy", False),  ("GY_z", "gyz", False),
+        ("MG_x", "mgx", False),  ("MG_y", "mgy", False),  ("MG_z", "mgz", False),
+    ],
+}
+
 # ---------- Helpers ----------
+def load_packet(text):
+    try:
+        packet = json.loads(text)
+    except (TypeError, ValueError):
+        return None  # Corrupted JSON (or a missing cell)
+    return packet if isinstance(packet, dict) else None
+
+
+def parse_packets(data):
+    """
+    Decode the raw ``data`` column in one pass into a list of packet dicts.
+    Corrupted rows (bad JSON, empty cells) become None and are skipped by expand_stream.
+    """
+    return [load_packet(text) for text in data.tolist()]
+
+
+def round_decimals(values, decimals=2):
+    """
+    np.round, with near-ties settled by Python's round(). np.round rounds values * 10**decimals,
+    which lands on the wrong side of a tie for inputs such as 0.285 or 9999.985; round() is
+    correctly rounded, as the per-sample loop this replaced was.
+    """
+    out = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if ties.size:
+        out[ties] = [round(v, decimals) for v in values[ties].tolist()]
+    return out
+
+
+@instrumented()
+def expand_stream(ts, packets, fields, rate):
+    """
+    Expand one sensor stream of the parsed packets into a DataFrame.
+    Sample i of a packet gets timestamp ``ts + i / rate``; samples are truncated to the
+    shortest list present in the packet and missing optional keys become NaN.
+    """
+    trigger = fields[0][1]
+    rows = [i for i, p in enumerate(packets) if p is not None and trigger in p]
+    columns = ["timestamp"] + [col for col, _, _ in fields]
+    if not rows:
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    selected = [packets[i] for i in rows]
+    counts = np.fromiter(
+        (min(len(p[key]) for _, key, optional in fields if not optional or key in p) for p in selected),
+        dtype=np.int64, count=len(selected)
+    )
+    total = int(counts.sum())
+
+    # Per-sample timestamps: base ts repeated per sample plus (index within packet) / rate
+    starts = np.cumsum(counts) - counts
+    offsets = np.arange(total) - np.repeat(starts, counts)
+    interval = 1 / rate
+    out = {"timestamp": np.repeat(np.asarray(ts, dtype=float)[rows], counts) + interval * offsets}
+
+    for col, key, optional in fields:
+        chunks = (
+            (p[key] if len(p[key]) == n else p[key][:n]) if key in p else [np.nan] * n
+            for p, n in zip(selected, counts.tolist())
+        )
+        values = np.fromiter(chain.from_iterable(chunks), dtype=float, count=total)
+        out[col] = round_decimals(values, 2)
+
+    return pd.DataFrame(out, columns=columns)
+
+
+@instrumented()
 def expand_data(df, expected_rates):
-    eda_data, ppg_data, temp_data, motion_data = [], [], [], []
-
-    for _, row in df.iterrows():
-        timestamp = row["ts"]  # Base timestamp
-        
-        try:
-            sensor_data = json.loads(row["data"])
-        except json.JSONDecodeError:
-            continue  # Skip rows with corrupted JSON
-
-        # EDA
-        if "eda" in sensor_data:
-            interval = 1 / expected_rates["EDA"]
-            times = [timestamp + (interval * i) for i in range(len(sensor_data["eda"]))]
-            for ts, eda, edl in zip(
-                times,
-                sensor_data["eda"],
-                sensor_data.get("edl", [None] * len(sensor_data["eda"]))
-            ):
-                eda_data.append({
-                    "timestamp": ts,
-                    "EDA": round(eda, 2),
-                    "EDL": round(edl, 2) if edl is not None else None
-                })
-
-        # PPG
-        if "pgi" in sensor_data:
-            interval = 1 / expected_rates["PPG"]
-            times = [timestamp + (interval * i) for i in range(len(sensor_data["pgi"]))]
-            for ts, pgi, pgr, pgg in zip(
-                times,
-                sensor_data["pgi"],
-                sensor_data.get("pgr", [None] * len(sensor_data["pgi"])),
-                sensor_data.get("pgg", [None] * len(sensor_data["pgi"]))
-            ):
-                ppg_data.append({
-                    "timestamp": ts,
-                    "PI": round(pgi, 2),
-                    "PR": round(pgr, 2) if pgr is not None else None,
-                    "PG": round(pgg, 2) if pgg is not None else None
-                })
-
-        # Temperature
-        if "thr" in sensor_data:
-            interval = 1 / expected_rates["Temperature"]
-            times = [timestamp + (interval * i) for i in range(len(sensor_data["thr"]))]
-            for ts, thr in zip(times, sensor_data["thr"]):
-                temp_data.append({"timestamp": ts, "Temp": round(thr, 2)})
-
-        # Motion
-        if "acx" in sensor_data:
-            interval = 1 / expected_rates["Motion"]
-            times = [timestamp + (interval * i) for i in range(len(sensor_data["acx"]))]
-            for ts, acx, acy, acz, gyx, gyy, gyz, mgx, mgy, mgz in zip(
-                times,
-                sensor_data["acx"], sensor_data["acy"], sensor_data["acz"],
-                sensor_data["gyx"], sensor_data["gyy"], sensor_data["gyz"],
-                sensor_data["mgx"], sensor_data["mgy"], sensor_data["mgz"]
-            ):
-                motion_data.append({
-                    "timestamp": ts,
-                    "ACC_x": round(acx, 2), "ACC_y": round(acy, 2), "ACC_z": round(acz, 2),
-                    "GY_x": round(gyx, 2),  "GY_y": round(gyy, 2),  "GY_z": round(gyz, 2),
-                    "MG_x": round(mgx, 2),  "MG_y": round(mgy, 2),  "MG_z": round(mgz, 2)
-                })
-    
-    return eda_data, ppg_data, temp_data, motion_data
-
-
-def resample_data(df, expected_rate):
+    """
+    Expand the raw EmotiBit rows into EDA, PPG, temperature and motion DataFrames.
+    Columnar replacement of the former per-row loop: the JSON column is parsed in bulk and
+    every stream is written straight into preallocated NumPy arrays.
+    """
+    packets = parse_packets(df["data"])
+    ts = df["ts"].to_numpy(dtype=float)
+    return tuple(
+        expand_stream(ts, packets, fields, expected_rates[stream])
+        for stream, fields in packet_layout.items()
+    )
+
+
+def numeric_columns(df):
+    """
+    Columns resampled besides timestamp: the NumPy numeric ones. Extension dtypes (pandas
+    strings, categoricals) are skipped like other non-numeric flags; np.issubdtype raises on them.
+    """
+    return [col for col, dtype in df.dtypes.items()
+            if col != "timestamp" and isinstance(dtype, np.dtype) and np.issubdtype(dtype, np.number)]
+
+
+def interpolate_grid(t, values, grid, method="linear", max_gap=None):
+    """
+    Interpolate the samples ``values`` (n_samples x n_columns, taken at sorted times ``t``)
+    onto ``grid``. The bracketing sample indices are found once with a binary search and
+    applied to all columns together; linear mode uses the same arithmetic as interp1d
+    (linear, fill_value="extrapolate"), so results are identical.
+
+    method: "linear" or "nearest" (nearest sample, ends held).
+    max_gap: optional dropout threshold in seconds. Grid points between two samples more
+        than max_gap apart, or further than max_gap outside the recording, become NaN
+        instead of being bridged or extrapolated.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(t) < 2:
+        return np.repeat(values[:1], len(grid), axis=0)
+
+    hi = np.clip(np.searchsorted(t, grid, side="left"), 1, len(t) - 1)
+    lo = hi - 1
+    t_lo, t_hi = t[lo], t[hi]
+
+    if method == "linear":
+        slope = (values[hi] - values[lo]) / (t_hi - t_lo)[:, None]
+        out = slope * (grid - t_lo)[:, None] + values[lo]
+    elif method == "nearest":
+        out = values[np.where(grid - t_lo > t_hi - grid, hi, lo)]
+    else:
+        raise ValueError(f"Unknown resampling method '{method}', expected 'linear' or 'nearest'.")
+
+    if max_gap is not None:
+        inside_gap = (t_hi - t_lo > max_gap) & (grid > t_lo) & (grid < t_hi)
+        dropout = inside_gap | (grid < t[0] - max_gap) | (grid > t[-1] + max_gap)
+        out[dropout] = np.nan
+    return out
+
+
+@instrumented()
+def resample_data(df, expected_rate, method="linear", max_gap=None):
     if df.empty:
         return df  # If DataFrame is empty, return as is
 
-    df = df.sort_values(by="timestamp")  # Ensure timestamps are ordered
+    # Ensure timestamps are ordered. The frame itself is not sorted: the timestamps are argsorted
+    # (as sort_values does) and the columns gathered as arrays, since frame operations dominate
+    # the cost on the short EDA and temperature streams.
+    t = df["timestamp"].to_numpy(dtype=float)
+    order = np.argsort(t, kind="quicksort")
+    t = t[order]
 
     # Build a uniform time grid; include the end if it falls exactly on-grid
-    start_t = df["timestamp"].min()
-    end_t = df["timestamp"].max()
+    start_t = np.nanmin(t)
+    end_t = np.nanmax(t)
     step = 1.0 / expected_rate
     time_range = np.arange(start_t, end_t + 0.5 * step, step)
 
-    # Interpolate numeric columns (skip non-numeric)
-    resampled = {"timestamp": time_range}
-    for col in df.columns:
-        if col == "timestamp":
-            continue
-        if not np.issubdtype(df[col].dtype, np.number):
-            # optional: skip non-numeric columns (e.g., categorical flags)
-            continue
-        interp_func = interp1d(
-            df["timestamp"].values,
-            df[col].values,
-            kind="linear",
-            fill_value="extrapolate",
-            assume_sorted=True
-        )
-        resampled[col] = np.round(interp_func(time_range), 2)
+    # Interpolate numeric columns (skip non-numeric) in one pass
+    cols = numeric_columns(df)
+    matrix = np.column_stack([df[col].to_numpy(dtype=float)[order] for col in cols]) if cols else np.empty((len(t), 0))
+    values = np.round(interpolate_grid(t, matrix, time_range, method, max_gap), 2)
 
+    resampled = {"timestamp": time_range}
+    resampled.update((col, values[:, j]) for j, col in enumerate(cols))
     return pd.DataFrame(resampled)
 
+
+class StreamResampler:
+    """
+    Incremental counterpart of resample_data for chunked ingestion.
+
+    Expanded chunks are pushed in recording order and the grid rows that can no longer
+    change are returned. Samples newer than ``holdback`` seconds before the latest one
+    are kept back, so packets that overlap a chunk boundary are merged and sorted before
+    the grid around them is interpolated. The grid is anchored on the first sample and
+    finish() emits the tail (including the on-grid end point) like resample_data does.
+    columns (timestamp first) shape the empty float64 frame finish() returns when nothing
+    was pushed, so a writer that starts on it gets the stream's schema.
+    """
+
+    def __init__(self, expected_rate, holdback=2.0, method="linear", max_gap=None, columns=("timestamp",)):
+        self.columns = list(columns)
+        self.step = 1.0 / expected_rate
+        self.holdback = holdback
+        self.method = method
+        self.max_gap = max_gap
+        self.pending = None   # Samples still needed for interpolation
+        self.start_t = None   # Grid origin (first sample)
+        self.delta = None     # Grid spacing as np.arange computes it
+        self.next_k = 0       # Index of the next grid point to emit
+
+    def push(self, df):
+        if df.empty:
+            return df.iloc[0:0]
+        self.pending = df if self.pending is None else pd.concat([self.pending, df], ignore_index=True)
+        self.pending = self.pending.sort_values(by="timestamp", kind="stable", ignore_index=True)
+        if self.start_t is None:
+            self.start_t = self.pending["timestamp"].iloc[0]
+            self.delta = (self.start_t + self.step) - self.start_t
+        return self._emit(self.pending["timestamp"].iloc[-1] - self.holdback)
+
+    def finish(self):
+        if self.pending is None:
+            return pd.DataFrame(columns=self.columns, dtype=float)
+        return self._emit(self.pending["timestamp"].iloc[-1] + 0.5 * self.step, inclusive=False)
+
+    def _emit(self, limit, inclusive=True):
+        t = self.pending["timestamp"].values
+        n_points = max(int(np.floor((limit - self.start_t) / self.delta)) + 2 - self.next_k, 0)
+        grid = self.start_t + self.delta * np.arange(self.next_k, self.next_k + n_points)
+        grid = grid[grid <= limit] if inclusive else grid[grid < limit]
+
+        cols = numeric_columns(self.pending)
+        values = interpolate_grid(t, self.pending[cols].to_numpy(dtype=float), grid, self.method, self.max_gap)
+        resampled = pd.DataFrame(np.round(values, 2), columns=cols)
+        resampled.insert(0, "timestamp", grid)
+
+        # Drop the samples that lie entirely before the next grid point (keep two for extrapolation)
+        self.next_k += len(grid)
+        next_t = self.start_t + self.delta * self.next_k
+        first_needed = max(min(np.searchsorted(t, next_t, side="right") - 1, len(t) - 2), 0)
+        self.pending = self.pending.iloc[first_needed:].reset_index(drop=True)
+
+        return resampled
+
+
 # ---------- IO layout ----------
 indir = "../datasets/raw/emotibit/"
 outdir = "../datasets/transformed/phys/"
@@ -123,11 +255,8 @@ outdir = "../datasets/transformed/phys/"
 # Pattern: P##_<condition>_<anything>.csv  e.g., P01_HT_Loc2.csv
 fname_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_.+\.csv$')
 
-file_list = glob(os.path.join(indir, "*.csv"))
-
-for file in file_list:
-    print(f"Processing {file}...")
 
+def parse_filename(file):
     base = os.path.basename(file)                  # e.g., "P01_HT_Loc2.csv"
     m = fname_re.match(base)
     if not m:
@@ -138,33 +267,155 @@ for file in file_list:
 
     participant = m.group(1)                       # "P01"
     condition = m.group(2).upper()                 # "HT" normalized
-    prefix = f"{participant}_{condition}"          # "P01_HT"
+    return participant, condition
+
+
+# Output file suffix per stream
+stream_suffix = {"EDA": "eda", "PPG": "ppg", "Temperature": "temp", "Motion": "motion"}
+
+# Bump when the expansion/resampling logic changes so cached outputs are rebuilt
+wrangling_version = "2"
+
+manifest_name = ".emotibit_manifest.json"
+
+
+def stream_params(stream, resampling=None):
+    """Everything a stream's output depends on besides the raw file itself."""
+    params = {
+        "version": wrangling_version,
+        "rate": expected_rates[stream],
+        "fields": packet_layout[stream],
+    }
+    if resampling:
+        params["resampling"] = resampling  # Non-default resample_data options
+    return params
+
+
+def output_path(file, outdir, stream, fmt=default_format):
+    participant, condition = parse_filename(file)
+    return stream_path(os.path.join(outdir, participant, f"{participant}_{condition}_{stream_suffix[stream]}"), fmt)
+
+
+@instrumented()
+def process_file(file, outdir, streams=tuple(packet_layout), fmt=default_format, chunksize=None,
+                 resampling=None):
+    """resampling: optional keyword arguments for resample_data (method, max_gap)."""
+    resampling = resampling or {}
 
     # Create ONE folder per participant
-    participant_dir = os.path.join(outdir, participant)
-    os.makedirs(participant_dir, exist_ok=True)
+    participant, _ = parse_filename(file)
+    os.makedirs(os.path.join(outdir, participant), exist_ok=True)
+
+    if chunksize:
+        return process_file_streaming(file, outdir, streams, fmt, chunksize, resampling)
 
     # Load, expand, resample
-    df = pd.read_csv(file)
+    df = pd.read_csv(file, usecols=["ts", "data"])
+    packets = parse_packets(df["data"])
+    ts = df["ts"].to_numpy(dtype=float)
 
-    eda, ppg, temp, motion = expand_data(df, expected_rates)
+    # Save flat files inside the participant dir
+    outputs = []
+    for stream in streams:
+        expanded = expand_stream(ts, packets, packet_layout[stream], expected_rates[stream])
+        resampled = resample_data(expanded, expected_rates[stream], **resampling)
+        outputs.append(write_stream(resampled, output_path(file, outdir, stream, fmt)))
 
-    eda_df = pd.DataFrame(eda)
-    ppg_df = pd.DataFrame(ppg)
-    temp_df = pd.DataFrame(temp)
-    motion_df = pd.DataFrame(motion)
+    return outputs
 
-    eda_df_resampled   = resample_data(eda_df,   expected_rates["EDA"])
-    ppg_df_resampled   = resample_data(ppg_df,   expected_rates["PPG"])
-    temp_df_resampled  = resample_data(temp_df,  expected_rates["Temperature"])
-    motion_df_resampled= resample_data(motion_df,expected_rates["Motion"])
 
-    # Save flat files inside the participant dir
-    eda_df_resampled.to_csv(   os.path.join(participant_dir, f"{prefix}_eda.csv"),    index=False)
-    ppg_df_resampled.to_csv(   os.path.join(participant_dir, f"{prefix}_ppg.csv"),    index=False)
-    temp_df_resampled.to_csv(  os.path.join(participant_dir, f"{prefix}_temp.csv"),   index=False)
-    motion_df_resampled.to_csv(os.path.join(participant_dir, f"{prefix}_motion.csv"), index=False)
+@instrumented()
+def process_file_streaming(file, outdir, streams, fmt, chunksize, resampling=None):
+    """
+    Chunked variant of process_file for recordings larger than RAM: the raw file is read
+    ``chunksize`` rows at a time and every stream is resampled and appended as it goes,
+    so memory is bounded by the chunk size rather than the recording length.
+    """
+    resamplers = {
+        stream: StreamResampler(expected_rates[stream], **(resampling or {}),
+                                columns=["timestamp"] + [col for col, _, _ in packet_layout[stream]])
+        for stream in streams
+    }
+    writers = {stream: StreamWriter(output_path(file, outdir, stream, fmt)) for stream in streams}
+    try:
+        for chunk in pd.read_csv(file, usecols=["ts", "data"], chunksize=chunksize):
+            packets = parse_packets(chunk["data"])
+            ts = chunk["ts"].to_numpy(dtype=float)
+            for stream in streams:
+                expanded = expand_stream(ts, packets, packet_layout[stream], expected_rates[stream])
+                writers[stream].write(resamplers[stream].push(expanded))
+        for stream in streams:
+            writers[stream].write(resamplers[stream].finish())
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return [writer.path for writer in writers.values()]
+
+
+def _process_job(job, outdir, fmt, chunksize, resampling):
+    file, streams = job
+    return process_file(file, outdir, streams, fmt, chunksize, resampling)
+
+
+def process_emotibit_files(input_directory, output_root, workers=1, force=False, fmt=default_format,
+                           chunksize=None, resampling=None):
+    file_list = sorted(glob(os.path.join(input_directory, "*.csv")))
+
+    # Fail fast on unexpected names, before anything is written
+    for file in file_list:
+        parse_filename(file)
+
+    # Only rebuild the streams whose raw file or parameters changed
+    manifest = BuildManifest(os.path.join(output_root, manifest_name))
+    jobs = []
+    for file in file_list:
+        stale = tuple(
+            stream for stream in packet_layout
+            if force or not manifest.is_current(output_path(file, output_root, stream, fmt), [file],
+                                                stream_params(stream, resampling))
+        )
+        if stale:
+            jobs.append((file, stale))
+    print(f"{len(file_list) - len(jobs)} of {len(file_list)} file(s) up to date, "
+          f"processing {len(jobs)} with {workers} worker(s)...")
+
+    job = partial(_process_job, outdir=output_root, fmt=fmt, chunksize=chunksize, resampling=resampling)
+    outcomes = run_batch(job, jobs, workers=workers, label=lambda job: os.path.basename(job[0]))
+
+    for (file, streams), _, error, _ in outcomes:
+        if error is None:
+            for stream in streams:
+                manifest.record(output_path(file, output_root, stream, fmt), [file], stream_params(stream, resampling))
+    manifest.save()
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand and resample raw EmotiBit CSV files.")
+    parser.add_argument("--input", default=indir, help="Directory with raw P##_<cond>_*.csv files.")
+    parser.add_argument("--output", default=outdir, help="Root of the per-participant output folders.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of files processed in parallel.")
+    parser.add_argument("--force", action="store_true", help="Rebuild every output, ignoring the manifest.")
+    parser.add_argument("--format", choices=sorted(formats), default=default_format, help="Output storage format.")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream each raw file in chunks of this many rows instead of loading it whole.")
+    parser.add_argument("--resample", choices=["linear", "nearest"], default="linear", help="Resampling method.")
+    parser.add_argument("--max-gap", type=float, default=None,
+                        help="Mark grid points inside dropouts longer than this many seconds as NaN.")
+    args = parser.parse_args()
+
+    resampling = {}
+    if args.resample != "linear":
+        resampling["method"] = args.resample
+    if args.max_gap is not None:
+        resampling["max_gap"] = args.max_gap
+
+    process_emotibit_files(args.input, args.output, workers=args.workers, force=args.force, fmt=args.format,
+                           chunksize=args.chunksize, resampling=resampling)
+
+    print("Processing complete!")
 
-    print(f"Saved processed data in {participant_dir}")
 
-print("Processing complete!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Cohort EmotiBit feature extraction.
+
+Finds every participant/condition with _eda, _ppg and _motion streams under the
+transformed tree and computes the features_summary feature set (EDA peaks/mean/std,
+HR, HRV, velocity, jerk, gyro energy), SCR statistics from the tonic/phasic
+decomposition (see eda_decomposition) and the HRV metric suite (SDNN, RMSSD, pNN50,
+LF/HF; see hrv) per activity on a worker pool. Each session is written as a part
+file and the parts are combined into one cohort feature table. Sessions whose streams
+and parameters are unchanged are skipped. The time spent and the samples processed per
+session are appended to emotibit_throughput.csv. With --figures, the EDA, SCR QC and
+HR/HRV figures of every session are rendered in parallel (headless, decimated to the
+figure's pixel width; PNG, plus EPS with --eps). The PPG beats of a session are
+detected once and kept in <output>/rr_cache for the figures and later runs.
+
+Usage:
+    python emotibit_cohort.py --input ../datasets/transformed/phys/ --output ../datasets/features/ --workers 16
+"""
+
+import argparse
+import os
+import re
+import time
+from functools import partial
+from glob import glob
+
+import pandas as pd
+
+from activity_index import stream_segments
+from batch_runner import run_batch
+from build_cache import BuildManifest
+from emotibitDataWrangling import expected_rates
+from emotibit_features import (lowcut, highcut, bandpass_filter, smooth_signal, extract_eda_features,
+                               extract_ppg_features, compute_motion_features, feature_summary, calculate_heart_rate)
+from eda_decomposition import decompose_frame, scrs_in, scr_features
+from emotibit_plots import activity_intervals, plot_eda_with_annotations, plot_hr_and_hrv_with_annotations, plot_scr_qc
+from plot_backend import render_parallel
+from hrv import RRCache, hrv_metrics
+from instrumentation import instrumented
+from ppg_beats import beats_in
+from stream_store import formats, default_format, stream_path, read_stream, write_stream
+from timebase import local_tz
+
+stream_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_(eda|ppg|motion)(\.[a-z]+)$')
+
+# Preferred input when a stream exists in several formats
+format_preference = [".parquet", ".arrow", ".csv"]
+
+# Wrangler column names -> names used by the feature functions
+ppg_columns = {"PI": "PGI", "PR": "PGR", "PG": "PGG"}
+
+# Motion is resampled to 25 Hz, so the 20 Hz high cut of the 50 Hz analysis is capped below Nyquist
+motion_rate = expected_rates["Motion"]
+motion_band = (lowcut, min(highcut, 0.45 * motion_rate))
+
+# Bump when the feature definitions change so every part is recomputed
+feature_params = {
+    "version": "6",
+    "rates": {"EDA": expected_rates["EDA"], "PPG": expected_rates["PPG"], "Motion": motion_rate},
+    "motion_band": motion_band,
+}
+
+manifest_name = ".emotibit_features_manifest.json"
+
+
+def find_sessions(input_root):
+    """Map (participant, condition) -> {'eda': path, 'ppg': path, 'motion': path} for complete sessions."""
+    sessions = {}
+    for path in sorted(glob(os.path.join(input_root, "*", "*_*_*.*"))):
+        m = stream_re.match(os.path.basename(path))
+        if not m or m.group(4) not in format_preference:
+            continue
+        streams = sessions.setdefault((m.group(1), m.group(2).upper()), {})
+        current = streams.get(m.group(3))
+        if current is None or format_preference.index(m.group(4)) < format_preference.index(os.path.splitext(current)[1]):
+            streams[m.group(3)] = path
+    return {key: streams for key, streams in sessions.items() if len(streams) == 3}
+
+
+def preprocess(eda, motion):
+    """Same noise removal as Emotibit_data_processing, at each stream's own rate; detect_beats band-limits the PPG."""
+    for axis in ['ACC_x', 'ACC_y', 'ACC_z', 'GY_x', 'GY_y', 'GY_z']:
+        motion[axis] = bandpass_filter(motion[axis], motion_band[0], motion_band[1], motion_rate)
+    eda['EDA'] = smooth_signal(eda['EDA'])
+    return eda, motion
+
+
+def activity_segments(df, participant, condition, stream):
+    """('All', df) followed by one segment per activity (from the labels or the campaign schedule)."""
+    segments = stream_segments(df, participant, condition, stream)
+    return [("All", df)] + [(activity, segments.take(df, activity)) for activity in segments.activities()]
+
+
+@instrumented("emotibit_session_features")
+def session_features(eda, ppg, motion, participant, condition, rr_cache=None):
+    # Tonic/phasic decomposition and SCRs of the whole session, from the unsmoothed EDA
+    decomposed, scrs = decompose_frame(eda, expected_rates["EDA"], time_col="timestamp")
+    eda, motion = preprocess(decomposed, motion)
+    # Beats of the whole session once; every activity takes the beats inside its samples
+    rr_cache = rr_cache or RRCache()
+    beats = rr_cache.beats(participant, condition, ppg, expected_rates["PPG"], time_col="timestamp")
+    ppg_segments = dict(activity_segments(ppg, participant, condition, "ppg"))
+    motion_segments = dict(activity_segments(motion, participant, condition, "motion"))
+
+    rows = []
+    for activity, eda_segment in activity_segments(eda, participant, condition, "eda"):
+        if activity not in ppg_segments or activity not in motion_segments:
+            continue
+        activity_beats = beats_in(beats, ppg_segments[activity].index)
+        rows.append({
+            "participant": participant,
+            "condition": condition,
+            "activity": activity,
+            **feature_summary(
+                extract_eda_features(eda_segment),
+                extract_ppg_features(ppg_segments[activity], fs=expected_rates["PPG"], beats=activity_beats),
+                compute_motion_features(motion_segments[activity], fs=motion_rate),
+            ),
+            **scr_features(eda_segment, scrs_in(scrs, eda_segment.index), expected_rates["EDA"]),
+            **hrv_metrics(activity_beats),
+        })
+    return pd.DataFrame(rows)
+
+
+def part_path(parts_dir, participant, condition, fmt=default_format):
+    return stream_path(os.path.join(parts_dir, f"{participant}_{condition}_emotibit_features"), fmt)
+
+
+def process_session(job, parts_dir, fmt=default_format, rr_cache_dir=None):
+    (participant, condition), paths = job
+    t0 = time.process_time()
+    eda = read_stream(paths["eda"])
+    ppg = read_stream(paths["ppg"]).rename(columns=ppg_columns)
+    motion = read_stream(paths["motion"])
+    table = session_features(eda, ppg, motion, participant, condition, RRCache(rr_cache_dir))
+
+    os.makedirs(parts_dir, exist_ok=True)
+    part = write_stream(table, part_path(parts_dir, participant, condition, fmt))
+    return {"part": part, "n_samples": len(eda) + len(ppg) + len(motion), "cpu_s": time.process_time() - t0}
+
+
+@instrumented()
+def render_session_figures(job, figures_dir, formats=None, rr_cache_dir=None):
+    """EDA, SCR QC and HR/HRV figures of one session, with the activities from the labels or the campaign schedule."""
+    (participant, condition), paths = job
+    eda = read_stream(paths["eda"], columns=["timestamp", "EDA"])
+    ppg = read_stream(paths["ppg"], columns=["timestamp", "PI"]).rename(columns=ppg_columns)
+    for df in (eda, ppg):
+        # Naive local time, as in the annotated files, so the axes show the local clock
+        df["DateTime"] = pd.to_datetime(df["timestamp"], unit="s", utc=True).dt.tz_convert(local_tz).dt.tz_localize(None)
+    decomposed, scrs = decompose_frame(eda, expected_rates["EDA"], time_col="timestamp")
+    eda["EDA"] = smooth_signal(eda["EDA"])
+
+    os.makedirs(figures_dir, exist_ok=True)
+    title = f"{condition} Trial"
+    eda_segments = stream_segments(eda, participant, condition, "eda")
+    written = plot_eda_with_annotations(eda, participant, title, activity_intervals(eda["DateTime"], eda_segments),
+                                        save_path=figures_dir, formats=formats)
+    written += plot_scr_qc(decomposed, scrs, participant, condition, save_path=figures_dir, formats=formats,
+                           segments=eda_segments)
+
+    # The beats found by the feature extraction, when the RR cache has them
+    beats = RRCache(rr_cache_dir).beats(participant, condition, ppg, expected_rates["PPG"], channels=["PGI"])
+    time_stamps, heart_rate, hrv_time_stamps, hrv_values = calculate_heart_rate(ppg, fs=expected_rates["PPG"],
+                                                                                beats=beats)
+    if len(heart_rate) and len(hrv_values):
+        written += plot_hr_and_hrv_with_annotations(time_stamps, heart_rate, hrv_time_stamps, hrv_values, ppg, title,
+                                                    save_path=figures_dir, participant_id=participant, formats=formats,
+                                                    segments=stream_segments(ppg, participant, condition, "ppg"))
+    return written
+
+
+def run_cohort(input_root, output_dir, workers=1, force=False, fmt=default_format, figures_dir=None,
+               figure_formats=None):
+    sessions = find_sessions(input_root)
+    parts_dir = os.path.join(output_dir, "emotibit_parts")
+    rr_cache_dir = os.path.join(output_dir, "rr_cache")
+    manifest = BuildManifest(os.path.join(output_dir, manifest_name))
+
+    jobs = [
+        (key, paths) for key, paths in sessions.items()
+        if force or not manifest.is_current(part_path(parts_dir, *key, fmt), paths.values(), feature_params)
+    ]
+    print(f"{len(sessions) - len(jobs)} of {len(sessions)} EmotiBit session(s) already done, "
+          f"processing {len(jobs)} with {workers} worker(s)...")
+
+    throughput = []
+    throughput_file = os.path.join(output_dir, "emotibit_throughput.csv")
+
+    def checkpoint(outcome):
+        ((participant, condition), paths), result, error, seconds = outcome
+        if error is None:
+            manifest.record(result["part"], paths.values(), feature_params)
+            manifest.save()
+            row = {
+                "run": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+                "participant": participant,
+                "condition": condition,
+                "workers": workers,
+                "wall_s": round(seconds, 3),
+                "cpu_s": round(result["cpu_s"], 3),
+                "n_samples": result["n_samples"],
+                "samples_per_s": round(result["n_samples"] / seconds) if seconds > 0 else None,
+            }
+            throughput.append(row)
+            # Appended as each session completes, like the manifest, so an interrupted run keeps its rows
+            os.makedirs(output_dir, exist_ok=True)
+            pd.DataFrame([row]).to_csv(throughput_file, mode="a", index=False, header=not os.path.exists(throughput_file))
+
+    run_batch(partial(process_session, parts_dir=parts_dir, fmt=fmt, rr_cache_dir=rr_cache_dir), jobs, workers=workers,
+              label=lambda job: "{}_{}".format(*job[0]), on_done=checkpoint)
+
+    if throughput:
+        per_participant = pd.DataFrame(throughput).groupby("participant")[["wall_s", "n_samples"]].sum()
+        print("\nThroughput per participant:")
+        for participant, row in per_participant.iterrows():
+            print(f"  {participant}: {row['n_samples']:.0f} samples in {row['wall_s']:.2f} s "
+                  f"({row['n_samples'] / max(row['wall_s'], 1e-9):,.0f} samples/s)")
+
+    if figures_dir:
+        print(f"\nRendering figures for {len(sessions)} session(s) into {figures_dir}...")
+        render_parallel(partial(render_session_figures, figures_dir=figures_dir, formats=figure_formats,
+                                rr_cache_dir=rr_cache_dir),
+                        list(sessions.items()), workers=workers, label=lambda job: "{}_{}".format(*job[0]))
+
+    parts = [part_path(parts_dir, *key, fmt) for key in sessions]
+    parts = [p for p in parts if os.path.exists(p)]
+    if not parts:
+        print("No EmotiBit features to combine.")
+        return None
+
+    cohort = pd.concat([read_stream(p) for p in parts], ignore_index=True)
+    output_file = write_stream(cohort, stream_path(os.path.join(output_dir, "emotibit_cohort_features"), fmt))
+    print(f"Saved cohort EmotiBit features ({len(cohort)} rows, {len(parts)} session(s)) to: {output_file}")
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract EmotiBit features for every participant and session.")
+    parser.add_argument("--input", default="../datasets/transformed/phys/", help="Root of the per-participant streams.")
+    parser.add_argument("--output", default="../datasets/features/", help="Directory for the cohort feature table.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of sessions processed in parallel.")
+    parser.add_argument("--force", action="store_true", help="Recompute every session, ignoring the manifest.")
+    parser.add_argument("--format", choices=sorted(formats), default=default_format, help="Output storage format.")
+    parser.add_argument("--figures", default=None, help="Directory for the per-session EDA and HR/HRV figures.")
+    parser.add_argument("--eps", action="store_true", help="Also write the figures as EPS (slow for long sessions).")
+    args = parser.parse_args()
+
+    run_cohort(args.input, args.output, workers=args.workers, force=args.force, fmt=args.format,
+               figures_dir=args.figures, figure_formats=["png", "eps"] if args.eps else ["png"])
+
+
+if __name__ == "__main__":
+    main()
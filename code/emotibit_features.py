@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, filtfilt, savgol_filter, find_peaks
+
+from instrumentation import instrumented
+from ppg_beats import detect_beats, heart_rate_features, quality_flags
+from stream_schema import as_signal
+
+
+# Define a band-pass filter function for accelerometer and gyroscope data
+def bandpass_filter(data, lowcut, highcut, fs, order=4):
+    nyquist = 0.5 * fs
+    low = lowcut / nyquist
+    high = highcut / nyquist
+    b, a = butter(order, [low, high], btype='band')
+    return as_signal(filtfilt(b, a, data), data)
+
+# Define a smoothing function using Savitzky-Golay filter for EDA and PPG data
+def smooth_signal(data, window_length=51, polyorder=3):
+    return savgol_filter(data, window_length, polyorder)
+
+# Noise removal parameters for accelerometer (ACC) and gyroscope (GY) data
+fs = 50  # Assuming a sampling rate of 50 Hz for Emotibit data
+lowcut = 0.1  # Low cutoff frequency (Hz)
+highcut = 20  # High cutoff frequency (Hz)
+
+# Feature extraction for physiological signals
+
+# Function to extract EDA features: Peaks, mean, and standard deviation
+@instrumented()
+def extract_eda_features(data):
+    eda_peaks, _ = find_peaks(data['EDA'], height=0.05)  # Detect peaks in EDA signal
+    eda_mean = np.mean(data['EDA'])
+    eda_std = np.std(data['EDA'])
+    return len(eda_peaks), eda_mean, eda_std
+
+# Function to calculate heart rate (HR) from PPG signal using the beat table (band-limited PPG, clean RR intervals)
+@instrumented()
+def extract_ppg_features(data, fs=50, beats=None):
+    if beats is None:
+        beats = detect_beats(data, fs, channels=['PGI'])
+    return heart_rate_features(beats)
+
+# Function to compute velocity and jerk for accelerometer data
+@instrumented()
+def compute_motion_features(data, fs=50):
+    # Calculate velocity by integrating acceleration
+    acc_magnitude = np.sqrt(data['ACC_x']**2 + data['ACC_y']**2 + data['ACC_z']**2)
+    velocity = np.cumsum(acc_magnitude.astype(float)) / fs  # float64 running sum over long sessions
+
+    # Calculate jerk (rate of change of acceleration)
+    jerk = np.diff(acc_magnitude) * fs
+    
+    # Calculate rotational energy using gyroscope data
+    gyro_energy = np.sqrt(data['GY_x']**2 + data['GY_y']**2 + data['GY_z']**2)
+    
+    return np.mean(velocity), np.std(jerk), np.mean(gyro_energy)
+
+# Compile extracted features into one record (the features_summary layout)
+def feature_summary(eda_features, ppg_features, motion_features):
+    return {
+        'EDA Peaks': eda_features[0],
+        'EDA Mean': eda_features[1],
+        'EDA Std Dev': eda_features[2],
+        'HR': ppg_features[0],
+        'HRV': ppg_features[1],
+        'Velocity Mean': motion_features[0],
+        'Jerk Std Dev': motion_features[1],
+        'Gyro Energy Mean': motion_features[2],
+    }
+
+def calculate_heart_rate(data, fs=50, beats=None):
+    """Calculate heart rate (HR) and HRV (rolling SDNN of 5 intervals) from the clean RR intervals of the PPG beats."""
+    if beats is None:
+        beats = detect_beats(data, fs, channels=['PGI'])
+    beats = beats[(beats['channel'] == 'PGI').to_numpy() & ((beats['quality'] & quality_flags['first']) == 0).to_numpy()]
+    clean = (beats['quality'] == 0).to_numpy()
+    rr_intervals = beats['rr'].to_numpy()
+    heart_rate = 60 / rr_intervals[clean]
+    time_stamps = data['DateTime'].iloc[beats['sample'].to_numpy()[clean]]
+    # Artefactual intervals break the rolling window instead of entering it
+    hrv_values = pd.Series(np.where(clean, rr_intervals, np.nan)).rolling(window=5).std().dropna()
+    hrv_time_stamps = data['DateTime'].iloc[beats['sample'].to_numpy()[hrv_values.index]]
+    return time_stamps, heart_rate, hrv_time_stamps, hrv_values
@@ -0,0 +1,159 @@
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+
+from activity_index import ActivitySegments
+from instrumentation import instrumented
+from plot_backend import decimate, save_figure, show_or_close
+from stream_schema import relabel
+
+
+def activity_intervals(times, segments):
+    """(activity, start_time, end_time, duration in minutes) for every activity in segments."""
+    intervals = []
+    for activity in segments.activities():
+        activity_times = segments.take(times, activity)
+        start_time = activity_times.min()
+        end_time = activity_times.max()
+
+        if pd.notnull(start_time) and pd.notnull(end_time):
+            duration = (end_time - start_time).seconds // 60  # Convert to minutes
+            intervals.append((activity, start_time, end_time, duration))
+    return intervals
+
+
+def filter_activity_data_with_intervals(data):
+    """
+    Filters activities while maintaining the 'No Activity' periods as 'Perception Survey'.
+    Also calculates the duration for each segment. The relabelling renames a category, so
+    the returned frame shares every column except Activity with data.
+    """
+    data = data.assign(Activity=relabel(data['Activity'], {'No Activity': 'Perception Survey'}))
+    segments = ActivitySegments.from_labels(data['Activity'])
+    return data, activity_intervals(data['DateTime'], segments)
+
+
+@instrumented()
+def plot_eda_with_annotations(data, participant_id, title, activity_intervals, save_path=None, formats=None):
+    """Plot EDA data with annotations for activities and save the plot."""
+    fig, ax = plt.subplots(figsize=(15, 7))
+    # Only the points the axes can show (min/max per pixel column), not every sample of the session
+    times, eda = decimate(data['DateTime'], data['EDA'], ax)
+    ax.plot(times, eda, label='EDA', color='#0000FF', alpha=0.8, linewidth=1.5)
+    ax.set_title(f'EDA Levels for {participant_id} during {title}', fontsize=16)
+    ax.set_xlabel('Time')
+    ax.set_ylabel('EDA (µS)')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax.tick_params(axis='x', labelrotation=45)
+
+    for activity, start_time, end_time, duration in activity_intervals:
+        ax.axvspan(start_time, end_time, facecolor='gray' if activity == 'Perception Survey' else 'green', alpha=0.2)
+        if activity != 'Perception Survey':
+            mid_time = start_time + (end_time - start_time) / 2
+            ax.annotate(f'{activity} ({duration} mins)', xy=(mid_time, data['EDA'].max() * 0.97),
+                        fontsize=8, ha='center', color='darkred', fontweight='bold')
+
+    fig.tight_layout()
+    paths = save_figure(fig, save_path, f"{participant_id}_{title.replace(' ', '_')}_EDA", formats)
+    if paths:
+        print(f"Saved EDA plots as: {' and '.join(paths)}")
+
+    show_or_close(fig)
+    return paths
+
+
+def annotate_activities(ax, data, y_max, segments=None):
+    """Annotate activities within the plot frame."""
+    if segments is None:
+        segments = ActivitySegments.from_labels(data['Activity'])
+    for activity in ['Reading', 'Writing', 'Discussion', 'Call']:
+        span = segments.span(activity)
+        if span is not None:
+            start_time = data['DateTime'].iloc[span[0]]
+            end_time = data['DateTime'].iloc[span[1]]
+            duration = (end_time - start_time).seconds // 60
+            mid_time = start_time + (end_time - start_time) / 2
+            ax.axvspan(start_time, end_time, facecolor='green', alpha=0.2)
+            ax.text(mid_time, y_max, f"{activity} ({duration} mins)",
+                    ha='center', va='top', fontsize=9, color='darkred', fontweight='bold')
+
+
+@instrumented()
+def plot_hr_and_hrv_with_annotations(time_stamps, heart_rate, hrv_time_stamps, hrv_values, data, title, save_path=None,
+                                     participant_id='', formats=None, segments=None):
+    """Plot HR and HRV trends with activity annotations."""
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10))
+    if segments is None:
+        segments = ActivitySegments.from_labels(data['Activity'])
+
+    ax1.plot(*decimate(time_stamps, heart_rate, ax1), label='Heart Rate (BPM)', color='darkgrey')
+    ax1.set_title(f"Heart Rate and HRV Trends for {participant_id} during {title}", fontsize=16)
+    ax1.set_xlabel("Time")
+    ax1.set_ylabel("Heart Rate (BPM)")
+    ax1.grid(True)
+    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax1.tick_params(axis='x', labelrotation=45)
+    annotate_activities(ax1, data, max(heart_rate) * 0.99, segments)
+
+    ax2.plot(*decimate(hrv_time_stamps, hrv_values, ax2), label='HRV (SDNN)', color='red')
+    ax2.set_xlabel("Time")
+    ax2.set_ylabel("HRV (SDNN)")
+    ax2.grid(True)
+    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax2.tick_params(axis='x', labelrotation=45)
+    annotate_activities(ax2, data, max(hrv_values) * 0.99, segments)
+
+    fig.tight_layout()
+    paths = save_figure(fig, save_path, f"{participant_id}_{title.replace(' ', '_')}_HR_HRV", formats)
+    if paths:
+        print(f"Saved HR and HRV plots for {title}.")
+    show_or_close(fig)
+    return paths
+
+
+# Shading and labels of the activities in the SCR QC figure
+activity_styles = {
+    'Reading': ('tab:blue', '$A_R$'),
+    'Writing': ('limegreen', '$A_W$'),
+    'Discussion': ('grey', '$A_D$'),
+    'Call': ('palevioletred', '$A_C$'),
+}
+
+
+@instrumented()
+def plot_scr_qc(data, scrs, participant_id, title, save_path=None, formats=None, segments=None, time_col='DateTime'):
+    """Phasic EDA with the detected SCR peaks and the activities (the <participant>_<title>_qc_plot figure)."""
+    if segments is None:
+        segments = ActivitySegments.from_labels(data['Activity'])
+    times = pd.Series(data[time_col])
+    if pd.api.types.is_datetime64_any_dtype(times):
+        minutes = ((times - times.iloc[0]).dt.total_seconds() / 60).to_numpy()
+    else:
+        minutes = (times.to_numpy(dtype=float) - times.iloc[0]) / 60
+    phasic = data['EDA Phasic'].to_numpy(dtype=float)
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    y_max = np.nanmax(phasic) if len(phasic) else 1.0
+    for activity, (color, label) in activity_styles.items():
+        span = segments.span(activity)
+        if span is not None:
+            start, end = minutes[span[0]], minutes[span[1]]
+            ax.axvspan(start, end, facecolor=color, alpha=0.1)
+            ax.text((start + end) / 2, y_max * 0.95, label, ha='center', va='top', fontsize=10)
+    ax.plot(*decimate(minutes, phasic, ax), label='Phasic', color='blue', linewidth=0.8)
+    peaks = scrs['peak'].to_numpy()
+    ax.scatter(minutes[peaks], phasic[peaks], color='red', s=8, zorder=3, label='SCR Peaks')
+    ax.set_title(f'{participant_id}_{title}: Phasic Component with SCR Peaks')
+    ax.set_xlabel('Time (minutes)')
+    ax.set_ylabel('Phasic (µS)')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.legend(loc='upper left')
+
+    fig.tight_layout()
+    paths = save_figure(fig, save_path, f"{participant_id}_{title}_qc_plot", formats)
+    if paths:
+        print(f"Saved SCR QC plot as: {' and '.join(paths)}")
+    show_or_close(fig)
+    return paths
@@ -7,104 +7,207 @@ Usage:
 """
 
 import pandas as pd
+import numpy as np
 import glob
 import os
 import argparse
 
+from build_cache import BuildManifest
+from instrumentation import instrumented
+from timebase import detect_format, local_tz, parse_times, utc_format, write_csv
+
+# Bump when the merge/conversion logic changes so cached outputs are rebuilt
+env_version = "1"
+manifest_name = ".env_manifest.json"
+
+# Rows read per chunk when merging; memory use is bounded by this, not by the number of files
+default_chunksize = 100_000
+
+# Distinct values tracked per column by the quality check; beyond this only a lower bound is reported
+max_tracked_unique = 1_000_000
+
+# Columns kept from the sensor exports
+keep_columns = [
+    'Time',
+    'AirTemperature',
+    'Relative Humidity',
+    'Air velocity',
+    'Luxmetro_1',
+    'Net_Rad_1',
+    'RTD/Tpav',
+    'RTD/T60cm',
+    'RTD/T110cm',
+    'RTD/T130cm',
+    'RTD/T10cm',
+    'RTD/Tglobe'
+]
+
+# Session label -> file pattern; each session is merged into env_<label>.csv
+sessions = {
+    'HT': 'HT*.csv',
+    'LT': 'LT*.csv'
+}
+
 
 def find_csv_files(directory, pattern):
     return glob.glob(os.path.join(directory, pattern))
 
 
+class QualityCounter:
+    """Missing-value and distinct-value counts per column, updated one chunk at a time."""
+
+    def __init__(self, cols):
+        self.cols = list(cols)
+        self.missing = {col: 0 for col in self.cols}
+        self.distinct = {col: np.empty(0, dtype=np.uint64) for col in self.cols}
+        self.saturated = set()
+        self.seen = set()
+
+    def update(self, df):
+        for col in self.cols:
+            if col not in df.columns:
+                continue
+            self.seen.add(col)
+            values = df[col]
+            self.missing[col] += int(values.isnull().sum())
+            if col in self.saturated:
+                continue
+            hashes = pd.util.hash_pandas_object(values.dropna(), index=False).to_numpy()
+            self.distinct[col] = np.union1d(self.distinct[col], hashes)
+            if len(self.distinct[col]) > max_tracked_unique:
+                self.saturated.add(col)
+                self.distinct[col] = self.distinct[col][:max_tracked_unique + 1]
+
+    def issues(self):
+        issues = []
+        for col in self.cols:
+            if col not in self.seen:
+                continue
+            n_unique = len(self.distinct[col])
+            if self.missing[col] > 0 or n_unique <= 1:
+                issues.append((col, self.missing[col], f">{max_tracked_unique}" if col in self.saturated else n_unique))
+        return issues
+
+
 def check_data_quality(df, cols):
-    issues = []
-    for col in cols:
-        if col not in df.columns:
-            continue
-        n_missing = int(df[col].isnull().sum())
-        n_unique = int(df[col].nunique(dropna=True))
-        if n_missing > 0 or n_unique <= 1:
-            issues.append((col, n_missing, n_unique))
-    return issues
-
-
-def convert_time_to_utc(df, time_col='Time'):
-    df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
-    df[time_col] = df[time_col].dt.tz_localize('Europe/Berlin', ambiguous='NaT', nonexistent='NaT')
-    df[time_col] = df[time_col].dt.tz_convert('UTC')
-    df[time_col] = df[time_col].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    counter = QualityCounter(cols)
+    counter.update(df)
+    return counter.issues()
+
+
+def convert_time_to_utc(df, time_col='Time', time_format=None):
+    # Local (CEST) strings -> datetime64[ns, UTC]; formatted as '%Y-%m-%dT%H:%M:%SZ' only when written
+    df[time_col] = parse_times(df[time_col], fmt=time_format, tz=local_tz)
     df.rename(columns={time_col: 'datetime'}, inplace=True)
     return df
 
 
-def process_session_files(input_dir, output_dir, label, pattern, keep_columns):
-    files = find_csv_files(input_dir, pattern)
+def output_columns(files, keep_columns):
+    """Columns of the merged output, in the order pd.concat of the per-file frames would give."""
+    columns = []
+    for fpath in files:
+        header = pd.read_csv(fpath, nrows=0).columns
+        available = [col for col in keep_columns if col in header]
+        if 'Time' in available:
+            available = ['datetime'] + [col for col in available if col != 'Time']
+        columns += [col for col in available if col not in columns]
+    return columns
+
+
+def read_chunks(fpath, keep_columns, chunksize=default_chunksize):
+    """keep_columns of one file, in chunks: only those columns are parsed, with explicit dtypes."""
+    header = pd.read_csv(fpath, nrows=0).columns
+    available_cols = [col for col in keep_columns if col in header]
+    missing_cols = [col for col in keep_columns if col not in header]
+    dtypes = {col: (str if col == 'Time' else 'float64') for col in available_cols}
+    chunks = pd.read_csv(fpath, usecols=available_cols, dtype=dtypes, chunksize=chunksize)
+    return available_cols, missing_cols, chunks
+
+
+@instrumented()
+def process_session_files(input_dir, output_dir, label, pattern, keep_columns, manifest=None, time_format=None,
+                          chunksize=default_chunksize):
+    files = sorted(find_csv_files(input_dir, pattern))
     if not files:
         print(f"No files found for pattern '{pattern}' in {input_dir}.")
         return
 
-    dfs = []
+    output_file = os.path.join(output_dir, f"env_{label}.csv")
+    params = {"version": env_version, "pattern": pattern, "keep_columns": keep_columns, "time_format": time_format}
+    if manifest is not None and manifest.is_current(output_file, files, params):
+        print(f"\nSession '{label}': {len(files)} file(s) unchanged, keeping {output_file}")
+        return
+
     print(f"\nProcessing session '{label}': {len(files)} file(s) found.")
+    os.makedirs(output_dir, exist_ok=True)
+    columns = output_columns(files, keep_columns)
+    tmp_file = output_file + ".tmp"
+    first = True
     for fpath in files:
         print(f"  Reading file: {os.path.basename(fpath)}")
-        df = pd.read_csv(fpath)
-
-        available_cols = [col for col in keep_columns if col in df.columns]
-        missing_cols = [col for col in keep_columns if col not in df.columns]
+        available_cols, missing_cols, chunks = read_chunks(fpath, keep_columns, chunksize)
         if missing_cols:
             print(f"    Warning: missing columns: {missing_cols}")
-        df = df[available_cols].copy()
-
-        if 'Time' in df.columns:
-            df = convert_time_to_utc(df)
-            df = df[['datetime'] + [col for col in df.columns if col != 'datetime']]
 
-        issues = check_data_quality(df, df.columns)
+        # Each chunk is converted, checked and appended, so only one chunk is in memory at a time
+        file_format = time_format
+        quality = None
+        for df in chunks:
+            df = df[available_cols]
+            if 'Time' in df.columns:
+                if file_format is None:
+                    file_format = detect_format(df['Time'].drop_duplicates().iloc[:100])
+                df = convert_time_to_utc(df, time_format=file_format)
+                df = df[['datetime'] + [col for col in df.columns if col != 'datetime']]
+            if quality is None:
+                quality = QualityCounter(df.columns)
+            quality.update(df)
+            write_csv(df.reindex(columns=columns), tmp_file, date_format=utc_format, index=False,
+                      mode='w' if first else 'a', header=first)
+            first = False
+
+        issues = quality.issues() if quality is not None else []
         if issues:
             print("    Data quality issues:")
             for col, n_missing, n_unique in issues:
                 print(f"      - {col}: missing={n_missing}, unique={n_unique}")
 
-        dfs.append(df)
-
-    combined = pd.concat(dfs, ignore_index=True)
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, f"env_{label}.csv")
-    combined.to_csv(output_file, index=False)
+    if first:
+        # Only empty files: still write the header
+        write_csv(pd.DataFrame(columns=columns), tmp_file, index=False)
+    os.replace(tmp_file, output_file)
     print(f"✅ Saved combined data for '{label}' to: {output_file}")
 
+    if manifest is not None:
+        manifest.record(output_file, files, params)
+
+
+def process_env_files(input_dir, output_dir, force=False, time_format=None, chunksize=default_chunksize):
+    """Merge the sensor files of every session into output_dir/env_<label>.csv; unchanged sessions are kept."""
+    manifest = BuildManifest(os.path.join(output_dir, manifest_name))
+    if force:
+        manifest.outputs.clear()
+
+    for label, pattern in sessions.items():
+        process_session_files(input_dir, output_dir, label, pattern, keep_columns, manifest=manifest,
+                              time_format=time_format, chunksize=chunksize)
+
+    manifest.save()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Convert CEST to UTC and merge environmental sensor CSV files.")
     parser.add_argument("--input", required=True, help="Path to input directory with CSV files.")
     parser.add_argument("--output", required=True, help="Path to output directory to save merged CSV files.")
+    parser.add_argument("--force", action="store_true", help="Rebuild every output, ignoring the manifest.")
+    parser.add_argument("--chunksize", type=int, default=default_chunksize,
+                        help="Rows read per chunk; bounds memory use regardless of the number of files.")
+    parser.add_argument("--time-format", default=None,
+                        help="strftime format of the 'Time' column (detected from the first rows if omitted).")
     args = parser.parse_args()
 
-    input_dir = args.input
-    output_dir = args.output
-
-    keep_columns = [
-        'Time',
-        'AirTemperature',
-        'Relative Humidity',
-        'Air velocity',
-        'Luxmetro_1',
-        'Net_Rad_1',
-        'RTD/Tpav',
-        'RTD/T60cm',
-        'RTD/T110cm',
-        'RTD/T130cm',
-        'RTD/T10cm',
-        'RTD/Tglobe'
-    ]
-
-    sessions = {
-        'HT': 'HT*.csv',
-        'LT': 'LT*.csv'
-    }
-
-    for label, pattern in sessions.items():
-        process_session_files(input_dir, output_dir, label, pattern, keep_columns)
+    process_env_files(args.input, args.output, force=args.force, time_format=args.time_format,
+                      chunksize=args.chunksize)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfiltfilt, tf2sos
+
+# Largest channels x samples block filtered in one call (bounds the float64 working copies)
+max_block_elements = 1_000_000
+
+
+@lru_cache(maxsize=None)
+def design_sos(fs, band=None, notch=None, order=4, quality=30.0):
+    """
+    Second-order sections for a Butterworth band-pass (band=(low, high) Hz) followed by
+    an optional notch (Hz). Designs are cached per configuration.
+    """
+    nyquist = 0.5 * fs
+    sections = []
+    if band is not None:
+        low, high = band
+        sections.append(butter(order, [low / nyquist, high / nyquist], btype='band', output='sos'))
+    if notch is not None:
+        b, a = iirnotch(notch / nyquist, quality)
+        sections.append(tf2sos(b, a))
+    if not sections:
+        raise ValueError("A filter bank needs a band, a notch or both.")
+    return np.vstack(sections)
+
+
+class FilterBank:
+    """
+    Zero-phase band-pass + notch filter for multi-channel signals.
+
+    The coefficients are designed once, as a single cascade of second-order sections,
+    and every channel is filtered in one sosfiltfilt call along the sample axis.
+    """
+
+    def __init__(self, fs, band=None, notch=None, order=4, quality=30.0):
+        self.fs = fs
+        self.band = tuple(band) if band is not None else None
+        self.notch = notch
+        self.sos = design_sos(fs, self.band, notch, order, quality)
+
+    def apply(self, data, axis=-1):
+        """Filter an array along axis (the time axis); other axes are channels."""
+        return sosfiltfilt(self.sos, data, axis=axis)
+
+    def filter_frame(self, df, channels, max_elements=None):
+        """
+        Frame like df with the given channel columns filtered (in float64, stored back in
+        each column's dtype). The other columns are shared with df, not copied. Channels
+        are filtered together in blocks of at most max_elements (default max_block_elements)
+        samples.
+        """
+        step = max(1, (max_elements or max_block_elements) // max(len(df), 1))
+        filtered = {}
+        for i in range(0, len(channels), step):
+            block = channels[i:i + step]
+            signals = np.ascontiguousarray(df[block].to_numpy(dtype=float).T)  # channel-major
+            for ch, values in zip(block, self.apply(signals, axis=-1)):
+                filtered[ch] = values.astype(df[ch].dtype if df[ch].dtype.kind == 'f' else float, copy=False)
+        return df.assign(**filtered)
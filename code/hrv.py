@@ -0,0 +1,292 @@
+"""
+Heart rate variability from the PPG beat table (ppg_beats).
+
+Time domain:      SDNN, RMSSD (ms), pNN50 (%), mean HR (BPM)
+Frequency domain: VLF, LF, HF band powers (ms^2) and LF/HF, from a Lomb-Scargle
+                  periodogram of the unevenly spaced RR series (no resampling, so
+                  rejected beats simply leave gaps)
+
+Only clean RR intervals (quality == 0) whose previous beat lies in the same segment are
+used; successive differences need two adjacent clean intervals. Metrics are computed for
+many segments at once: per activity (hrv_activity_metrics) or per sliding window
+(hrv_window_metrics). Time-domain metrics come from cumulative sums, the periodograms of
+all windows from one batched array expression.
+
+RRCache detects the beats of a session once and hands the same beat table to every
+consumer (activity features, windowed HRV, HR/HRV figures); with a cache_dir the tables
+are also stored on disk, keyed by a fingerprint of the PPG they came from.
+"""
+
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from eeg_features import trapezoid
+from instrumentation import instrumented
+from ppg_beats import detect_beats, ppg_channels
+
+hrv_bands = {"VLF": (0.003, 0.04), "LF": (0.04, 0.15), "HF": (0.15, 0.4)}
+
+# Frequency grid of the Lomb-Scargle periodogram (Hz), fine enough for the resolution of spectral_window
+hrv_freqs = np.arange(0.003, 0.4005, 0.001)
+
+# Longer segments get the mean LF and HF powers of spectral_window windows with 50% overlap
+# (short-term spectra, as recommended for HRV, instead of one periodogram of a whole activity).
+# VLF periods (up to 333 s) do not fit in such a window: VLF comes from a periodogram of the
+# whole segment, evaluated on VLF frequencies only.
+spectral_window = 300.0
+
+# Fewest clean intervals for the time-domain and the frequency-domain metrics
+min_intervals = 2
+min_spectral_intervals = 10
+
+# Upper bound on the elements of one batched periodogram block (windows x beats x frequencies)
+max_block_elements = 500_000
+
+hrv_columns = ["Mean HR", "SDNN", "RMSSD", "pNN50", "VLF", "LF", "HF", "LF/HF", "N Intervals"]
+
+
+def _seconds(timestamps):
+    """Beat times as float seconds (epoch seconds for datetimes)."""
+    timestamps = pd.Series(timestamps)
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        return pd.DatetimeIndex(timestamps).as_unit("ns").asi8 / 1e9
+    return timestamps.to_numpy(dtype=float)
+
+
+def _like(seconds, timestamps):
+    """Seconds back in the representation of timestamps (numeric, naive or tz-aware datetimes)."""
+    timestamps = pd.Series(timestamps)
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        return seconds
+    times = pd.DatetimeIndex(np.round(np.asarray(seconds) * 1e9).astype(np.int64).astype("datetime64[ns]"))
+    tz = pd.DatetimeIndex(timestamps).tz
+    return times.tz_localize("UTC").tz_convert(tz) if tz is not None else times
+
+
+def rr_series(beats, channel="PGI"):
+    """
+    (beat times in s, RR in s, usable mask) of one channel. beats may be a segment of a
+    beat table: an interval is usable if it is clean and its previous beat is in beats too.
+    """
+    beats = beats[(beats["channel"] == channel).to_numpy()]
+    t = _seconds(beats["timestamp"])
+    rr = beats["rr"].to_numpy(dtype=float)
+    usable = (beats["quality"] == 0).to_numpy().copy()
+    if len(usable):
+        usable[0] = False
+        usable[1:] &= np.diff(beats.index.to_numpy()) == 1
+    return t, rr, usable
+
+
+def lomb_scargle(t, x, mask, freqs=hrv_freqs):
+    """
+    One-sided Lomb-Scargle PSD (units^2/Hz) of every row of t, x (padded rows; mask marks
+    the samples) at freqs, scaled like a periodogram so that it integrates to the variance.
+    """
+    n = mask.sum(axis=1)
+    mean = np.where(n > 0, (x * mask).sum(axis=1) / np.maximum(n, 1), 0.0)
+    x = np.where(mask, x - mean[:, None], 0.0)
+    t_min = np.where(mask, t, np.inf).min(axis=1, keepdims=True)
+    t_max = np.where(mask, t, -np.inf).max(axis=1, keepdims=True)
+    t = np.where(mask, t - np.where(np.isfinite(t_min), t_min, 0.0), 0.0)
+
+    wt = 2 * np.pi * t[:, :, None] * freqs[None, None, :]
+    c, s = np.cos(wt) * mask[:, :, None], np.sin(wt) * mask[:, :, None]
+    # Time offset tau making the sine and cosine terms orthogonal
+    two_wtau = np.arctan2(2 * (c * s).sum(axis=1), (c * c - s * s).sum(axis=1))
+    cos_tau, sin_tau = np.cos(two_wtau / 2)[:, None, :], np.sin(two_wtau / 2)[:, None, :]
+    cc = c * cos_tau + s * sin_tau
+    ss = s * cos_tau - c * sin_tau
+    xc = (x[:, :, None] * cc).sum(axis=1)
+    xs = (x[:, :, None] * ss).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        power = 0.5 * (xc ** 2 / (cc ** 2).sum(axis=1) + xs ** 2 / (ss ** 2).sum(axis=1))
+        spacing = (t_max - t_min)[:, 0] / np.maximum(n - 1, 1)
+    return np.nan_to_num(power * 2 * spacing[:, None])
+
+
+def interval_metrics(t, rr, usable, lo, hi, freqs=hrv_freqs):
+    """
+    HRV metrics (hrv_columns) of the beats lo[i]:hi[i] of one channel for every i; the
+    interval ending at beat lo[i] reaches outside the segment and is not used.
+    """
+    lo, hi = np.asarray(lo, dtype=np.int64), np.asarray(hi, dtype=np.int64)
+    first = np.minimum(lo + 1, len(rr))
+    end = np.maximum(hi, first)
+    rr_ms = np.where(usable, rr * 1000, 0.0)
+
+    # Time domain from cumulative sums (centred for numerical stability)
+    mean_rr = rr_ms[usable].mean() if usable.any() else 0.0
+    centred = np.where(usable, rr_ms - mean_rr, 0.0)
+    c0 = np.concatenate([[0], np.cumsum(usable)])
+    c1 = np.concatenate([[0.0], np.cumsum(centred)])
+    c2 = np.concatenate([[0.0], np.cumsum(centred ** 2)])
+    count = c0[end] - c0[first]
+    divisor = np.maximum(count, 1)
+    mean_centred = (c1[end] - c1[first]) / divisor
+    sdnn = np.sqrt(np.clip((c2[end] - c2[first]) / divisor - mean_centred ** 2, 0, None))
+
+    # Successive differences: pair k joins the adjacent usable intervals k - 1 and k
+    pair = np.zeros(len(rr), dtype=bool)
+    pair[1:] = usable[1:] & usable[:-1]
+    diff = np.zeros(len(rr))
+    diff[1:] = np.where(pair[1:], rr_ms[1:] - rr_ms[:-1], 0.0)
+    p0 = np.concatenate([[0], np.cumsum(pair)])
+    p2 = np.concatenate([[0.0], np.cumsum(diff ** 2)])
+    p50 = np.concatenate([[0], np.cumsum(pair & (np.abs(diff) > 50))])
+    pair_first = np.minimum(first + 1, end)
+    n_pairs = p0[end] - p0[pair_first]
+
+    metrics = pd.DataFrame({
+        "Mean HR": np.where(count > 0, 60000 / (mean_centred + mean_rr), np.nan),
+        "SDNN": np.where(count >= min_intervals, sdnn, np.nan),
+        "RMSSD": np.where(n_pairs > 0, np.sqrt((p2[end] - p2[pair_first]) / np.maximum(n_pairs, 1)), np.nan),
+        "pNN50": np.where(n_pairs > 0, 100 * (p50[end] - p50[pair_first]) / np.maximum(n_pairs, 1), np.nan),
+    })
+    bands = band_powers(t, rr_ms, usable, first, end, count, freqs)
+    for name in hrv_bands:
+        metrics[name] = bands[name]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metrics["LF/HF"] = np.where(bands["HF"] > 0, bands["LF"] / bands["HF"], np.nan)
+    metrics["N Intervals"] = count
+    return metrics
+
+
+def band_powers(t, rr_ms, usable, first, end, count, freqs=hrv_freqs):
+    """{band: power (ms^2)} per segment first[i]:end[i] from batched Lomb-Scargle periodograms."""
+    powers = {name: np.full(len(first), np.nan) for name in hrv_bands}
+    todo = np.flatnonzero(count >= min_spectral_intervals)
+    if not len(todo) or not len(rr_ms):
+        return powers
+
+    lengths = end[todo] - first[todo]
+    width = int(lengths.max())
+    rows_per_block = max(max_block_elements // (width * len(freqs)), 1)
+    in_band = {name: (freqs >= low) & (freqs <= high) for name, (low, high) in hrv_bands.items()}
+    for b in range(0, len(todo), rows_per_block):
+        rows = todo[b:b + rows_per_block]
+        offsets = np.arange(width)
+        idx = np.minimum(first[rows, None] + offsets, len(rr_ms) - 1)
+        mask = (offsets < (end[rows] - first[rows])[:, None]) & usable[idx]
+        psd = lomb_scargle(t[idx], rr_ms[idx], mask, freqs)
+        for name, sel in in_band.items():
+            powers[name][rows] = trapezoid(psd[:, sel], freqs[sel], axis=-1)
+    return powers
+
+
+@instrumented()
+def hrv_metrics(beats, channel="PGI", freqs=hrv_freqs):
+    """HRV metrics of one segment (a beat table or a part of one) as a dict."""
+    t, rr, usable = rr_series(beats, channel)
+    windowed = len(t) > 1 and t[-1] - t[0] > spectral_window
+    if not windowed:
+        return interval_metrics(t, rr, usable, [0], [len(rr)], freqs).iloc[0].to_dict()
+
+    # LF and HF of long segments are window averages; the whole-segment periodogram only covers VLF,
+    # on a grid at least as fine as half its resolution (1 / duration) so the band integral holds
+    low, high = hrv_bands["VLF"]
+    step = min(freqs[1] - freqs[0], 0.5 / (t[-1] - t[0]))
+    vlf_freqs = np.arange(low, high + step / 2, step)
+    metrics = interval_metrics(t, rr, usable, [0], [len(rr)], vlf_freqs).iloc[0].to_dict()
+    windows = hrv_window_metrics(beats, spectral_window, spectral_window / 2, channel, freqs)
+    for name in ["LF", "HF", "LF/HF"]:
+        metrics[name] = windows[name].mean() if windows[name].notna().any() else np.nan
+    return metrics
+
+
+@instrumented()
+def hrv_activity_metrics(beats, segments, channel="PGI", freqs=hrv_freqs):
+    """One row of HRV metrics per (activity, beats of that activity) in segments."""
+    rows = [{"activity": activity, **hrv_metrics(segment_beats, channel, freqs)} for activity, segment_beats in segments]
+    return pd.DataFrame(rows, columns=["activity"] + hrv_columns)
+
+
+@instrumented()
+def hrv_window_metrics(beats, window, hop, channel="PGI", freqs=hrv_freqs):
+    """
+    HRV metrics per sliding window of `window` seconds every `hop` seconds over the beats
+    of one channel; 'time' is the window start in the beat timestamps' representation.
+    """
+    t, rr, usable = rr_series(beats, channel)
+    if len(t) < 2 or t[-1] - t[0] < window:
+        return pd.DataFrame(columns=["time"] + hrv_columns)
+    starts = t[0] + np.arange(0, t[-1] - t[0] - window + hop * 1e-9, hop)
+    lo = np.searchsorted(t, starts)
+    hi = np.searchsorted(t, starts + window)
+    metrics = interval_metrics(t, rr, usable, lo, hi, freqs)
+    channel_times = beats["timestamp"][(beats["channel"] == channel).to_numpy()]
+    metrics.insert(0, "time", _like(starts, channel_times))
+    return metrics
+
+
+def _fingerprint(signals, times, fs):
+    digest = hashlib.blake2b(np.ascontiguousarray(signals, dtype=float).tobytes(), digest_size=16)
+    digest.update(np.ascontiguousarray(times, dtype=float).tobytes())
+    digest.update(repr(fs).encode())
+    return digest.hexdigest()
+
+
+class RRCache:
+    """
+    Beat tables detected once per (participant, session, channel) and shared by every
+    HR/HRV consumer. With a cache_dir, each channel's table is also stored as an .npz file
+    together with a fingerprint of the PPG it came from, so a later run (or another
+    process, e.g. the figure renderer) reuses it as long as the data is unchanged.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._beats = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def beats(self, participant, session, ppg, fs, channels=ppg_channels, time_col="timestamp"):
+        """Beat table of the requested channels; missing ones are detected in one detect_beats call."""
+        channels = [ch for ch in channels if ch in ppg.columns]
+        times = _seconds(ppg[time_col]) if time_col else np.arange(len(ppg)) / fs
+        missing = [ch for ch in channels if (participant, session, ch) not in self._beats]
+        if missing:
+            fingerprints = {ch: _fingerprint(ppg[ch].to_numpy(dtype=float), times, fs) for ch in missing}
+            if self.cache_dir:
+                for ch in list(missing):
+                    cached = self._read((participant, session, ch), fingerprints[ch], ppg[time_col] if time_col else None)
+                    if cached is not None:
+                        self._beats[(participant, session, ch)] = cached
+                        missing.remove(ch)
+            if missing:
+                detected = detect_beats(ppg, fs, channels=missing, time_col=time_col)
+                for ch in missing:
+                    table = detected[(detected["channel"] == ch).to_numpy()]
+                    self._beats[(participant, session, ch)] = table
+                    if self.cache_dir:
+                        self._write((participant, session, ch), fingerprints[ch], table)
+
+        tables = [self._beats[(participant, session, ch)] for ch in channels]
+        combined = pd.concat(tables, ignore_index=True) if tables else detect_beats(ppg.iloc[:0], fs, channels)
+        combined["channel"] = pd.Categorical(combined["channel"].astype(str), categories=channels)
+        return combined
+
+    def _path(self, key):
+        name = "_".join(str(part) for part in key)
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "-", name) + "_beats.npz")
+
+    def _read(self, key, fingerprint, like):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            if str(f["fingerprint"]) != fingerprint:
+                return None
+            timestamp = f["seconds"] if like is None else _like(f["seconds"], like)
+            return pd.DataFrame({
+                "channel": pd.Categorical([key[-1]] * len(f["sample"]), categories=[key[-1]]),
+                "sample": f["sample"], "timestamp": timestamp, "rr": f["rr"], "quality": f["quality"],
+            })
+
+    def _write(self, key, fingerprint, table):
+        np.savez(self._path(key), sample=table["sample"].to_numpy(), seconds=_seconds(table["timestamp"]),
+                 rr=table["rr"].to_numpy(), quality=table["quality"].to_numpy(), fingerprint=fingerprint)
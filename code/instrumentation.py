@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Per-stage metrics: wall time, CPU time, peak memory and rows processed.
+
+Stages are marked in the code with the instrumented decorator (one record per call of a
+function such as expand_data, resample_data, filter_data or a plotting function) or the
+stage context manager (a block, e.g. a welch call). Recording is off unless a metrics
+directory is set, through enable() or the WEPOP_METRICS_DIR environment variable; an
+instrumented function then costs one environment lookup per call.
+
+The setting is inherited by worker processes, and every process appends its records to
+its own metrics-<pid>.jsonl file in the directory, so one run of the pipeline (or of any
+stage script) with pool workers ends up in one place. Each record holds:
+
+    stage           function or block name        parent   enclosing stage, if any
+    wall_s, cpu_s   elapsed and CPU time (CPU of this process only, not of its workers)
+    peak_rss_mb     peak RSS of the process so far (Linux/macOS; None elsewhere)
+    rss_growth_mb   how much the stage raised that peak
+    rows            rows (samples) of the first frame/array argument, or as set by the stage
+    error           exception of a failed call
+
+write_report turns the records into metrics.csv (one row per call), metrics_summary.csv
+and metrics.json (totals per stage); compare_reports lines up two metrics.json files to
+spot regressions between campaigns.
+
+Profiling is opt-in: with WEPOP_PROFILE=1 (enable(..., profile=True)) the outermost stage
+of each process runs under cProfile and its stats are written next to the records as
+<stage>-<pid>-<n>.prof (pstats format; snakeviz, gprof2dot etc. read it). Instrumented
+functions keep their names in the stack, so a sampling profiler such as
+`py-spy record -o profile.svg -- python pipeline.py` shows the same stages without any hook.
+
+Usage:
+    WEPOP_METRICS_DIR=../metrics/run1 python eeg_cohort.py ...   # any stage script
+    python pipeline.py --metrics ../metrics --profile            # one sub-directory per run
+    python instrumentation.py --run ../metrics/run1              # (re)write the report of a run
+    python instrumentation.py --run ../metrics/run2 --compare ../metrics/run1/metrics.json
+"""
+
+import argparse
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import re
+import sys
+import time
+from glob import glob
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak memory is not recorded
+    resource = None
+
+metrics_env = "WEPOP_METRICS_DIR"
+profile_env = "WEPOP_PROFILE"
+
+# Open stages, innermost last, as (name, pid): a forked worker inherits the stages open in its parent
+_stack = []
+_profiles = 0
+
+
+def metrics_dir():
+    """Directory records are written to, or None when recording is off."""
+    return os.environ.get(metrics_env) or None
+
+
+def enable(directory, profile=False):
+    """Record the stages of this process and of the processes it starts into directory; returns its absolute path."""
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    os.environ[metrics_env] = directory
+    if profile:
+        os.environ[profile_env] = "1"
+    else:
+        os.environ.pop(profile_env, None)
+    return directory
+
+
+def disable():
+    os.environ.pop(metrics_env, None)
+    os.environ.pop(profile_env, None)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def count_rows(args, kwargs=None, result=None):
+    """Length of the first frame or array among the arguments (then the result); None if there is none."""
+    for value in (*args, *(kwargs or {}).values(), result):
+        shape = getattr(value, "shape", None)
+        if shape:
+            return int(shape[0])
+    return None
+
+
+def _append(directory, record):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"metrics-{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Record the enclosed block as a stage. Yields the record, so the block can set
+    record["rows"] once it knows them. Does nothing (beyond yielding a dict) when off.
+    """
+    global _profiles
+    record = {"stage": name, "rows": rows}
+    directory = metrics_dir()
+    if directory is None:
+        yield record
+        return
+
+    pid = os.getpid()
+    profiler = None
+    if os.environ.get(profile_env) and not any(owner == pid for _, owner in _stack):
+        profiler = cProfile.Profile()  # outermost stage of this process
+    parent = _stack[-1][0] if _stack else None
+    _stack.append((name, pid))
+    start = time.time()
+    rss0 = peak_rss_mb()
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    error = None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        _stack.pop()
+        rss1 = peak_rss_mb()
+        if profiler is not None:
+            _profiles += 1
+            profile = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}-{pid}-{_profiles}.prof"
+            profiler.dump_stats(os.path.join(directory, profile))
+            record["profile"] = profile
+        record.update({
+            "parent": parent,
+            "pid": pid,
+            "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start)),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_mb": None if rss1 is None else round(rss1, 1),
+            "rss_growth_mb": None if rss1 is None else round(rss1 - rss0, 1),
+            "error": error,
+        })
+        _append(directory, record)
+
+
+def instrumented(name=None, rows=count_rows):
+    """
+    Decorator recording every call of a function as a stage, named after the function
+    unless name is given. rows(args, kwargs, result) counts the rows it processed.
+    """
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not os.environ.get(metrics_env):
+                return func(*args, **kwargs)
+            with stage(label) as record:
+                result = func(*args, **kwargs)
+                record["rows"] = rows(args, kwargs, result) if rows else None
+                return result
+        return wrapper
+    return decorate
+
+
+# ---------- Report ----------
+
+def read_records(directory):
+    """All records of a run, in start order."""
+    records = []
+    for path in sorted(glob(os.path.join(directory, "metrics-*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return sorted(records, key=lambda r: (r["start"], r["pid"]))
+
+
+def summarise(records):
+    """Per-stage totals: calls, failures, wall/CPU time, rows, throughput and the highest peak RSS."""
+    import pandas as pd
+
+    columns = ["stage", "calls", "errors", "wall_s", "mean_wall_s", "max_wall_s", "cpu_s", "rows", "rows_per_s",
+               "peak_rss_mb", "max_rss_growth_mb"]
+    if not records:
+        return pd.DataFrame(columns=columns)
+    calls = pd.DataFrame(records)
+    calls["failed"] = calls["error"].notna()
+    summary = calls.groupby("stage", sort=False).agg(
+        calls=("wall_s", "size"),
+        errors=("failed", "sum"),
+        wall_s=("wall_s", "sum"),
+        mean_wall_s=("wall_s", "mean"),
+        max_wall_s=("wall_s", "max"),
+        cpu_s=("cpu_s", "sum"),
+        rows=("rows", lambda r: r.sum(min_count=1)),
+        peak_rss_mb=("peak_rss_mb", "max"),
+        max_rss_growth_mb=("rss_growth_mb", "max"),
+    ).reset_index()
+    summary["rows_per_s"] = summary["rows"] / summary["wall_s"].where(summary["wall_s"] > 0)
+    return summary[columns].sort_values("wall_s", ascending=False, ignore_index=True).round(6)
+
+
+def write_report(directory):
+    """metrics.csv, metrics_summary.csv and metrics.json of the records in directory; returns the JSON path."""
+    import pandas as pd
+
+    records = read_records(directory)
+    summary = summarise(records)
+    pd.DataFrame(records).to_csv(os.path.join(directory, "metrics.csv"), index=False)
+    summary.to_csv(os.path.join(directory, "metrics_summary.csv"), index=False)
+
+    report = {
+        "run": os.path.basename(os.path.normpath(directory)),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "calls": len(records),
+        "stages": json.loads(summary.to_json(orient="records")),
+    }
+    json_path = os.path.join(directory, "metrics.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    return json_path
+
+
+def compare_reports(baseline, current, threshold=0.2):
+    """
+    Stages of two metrics.json reports side by side with the wall-time ratio; 'flag' marks
+    stages more than threshold slower (or faster) per call than in the baseline.
+    """
+    import pandas as pd
+
+    def load(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return pd.DataFrame(json.load(f)["stages"]).set_index("stage")[["calls", "mean_wall_s", "peak_rss_mb"]]
+
+    table = load(baseline).join(load(current), how="outer", lsuffix="_baseline", rsuffix="_current")
+    table["ratio"] = table["mean_wall_s_current"] / table["mean_wall_s_baseline"]
+    table["flag"] = ""
+    table.loc[table["ratio"] > 1 + threshold, "flag"] = "slower"
+    table.loc[table["ratio"] < 1 / (1 + threshold), "flag"] = "faster"
+    return table.sort_values("ratio", ascending=False).round(4)
+
+
+def print_summary(summary, limit=20):
+    print(f"\n{'stage':<36} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'rows':>12} {'rows/s':>12} {'peak MB':>8}")
+    for _, row in summary.head(limit).iterrows():
+        rows = "" if row["rows"] != row["rows"] else f"{row['rows']:,.0f}"
+        rate = "" if row["rows_per_s"] != row["rows_per_s"] else f"{row['rows_per_s']:,.0f}"
+        peak = "" if row["peak_rss_mb"] != row["peak_rss_mb"] else f"{row['peak_rss_mb']:.0f}"
+        print(f"{row['stage']:<36} {row['calls']:>6} {row['wall_s']:>9.2f} {row['cpu_s']:>9.2f} "
+              f"{rows:>12} {rate:>12} {peak:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write and compare the metrics report of an instrumented run.")
+    parser.add_argument("--run", required=True, help="Metrics directory of the run.")
+    parser.add_argument("--compare", default=None, help="metrics.json of a baseline run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative change in mean wall time per call flagged by --compare.")
+    args = parser.parse_args()
+
+    json_path = write_report(args.run)
+    print(f"Metrics report written to: {json_path}")
+    print_summary(summarise(read_records(args.run)))
+
+    if args.compare:
+        table = compare_reports(args.compare, json_path, args.threshold)
+        print(f"\nAgainst {args.compare}:")
+        print(table.to_string())
+        if (table["flag"] == "slower").any():
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
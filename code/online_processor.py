@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Online (streaming) EDA/PPG processing of EmotiBit packets.
+
+EmotiBitStreamProcessor takes the raw packets one at a time (the same JSON records that
+expand_data parses) and keeps all state between packets:
+
+- causal filters (second-order sections with their state carried over), instead of the
+  zero-phase savgol/filtfilt of the offline analysis;
+- incremental PPG beat detection (local maxima of the band-passed PPG with a refractory
+  period and an adaptive amplitude threshold), giving HR, SDNN and RMSSD over a sliding
+  window of RR intervals;
+- incremental skin conductance response (SCR) detection: a peak of the low-passed EDA
+  that rises at least min_scr_amplitude above the preceding trough.
+
+The work per packet is proportional to the samples in it, and a beat or SCR is reported
+at most one refractory period (or one sample) after it occurred.
+
+Replay of a recorded raw CSV (as fast as possible, in real time, or 10x accelerated):
+    python online_processor.py --input ../datasets/raw/phys/P01_HT_x.csv --speed 10 --report-every 30
+"""
+
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+from emotibitDataWrangling import expected_rates, load_packet
+
+
+class CausalFilter:
+    """Butterworth filter (low- or band-pass) applied chunk by chunk, carrying its state."""
+
+    def __init__(self, fs, cutoff, btype="low", order=2):
+        self.sos = butter(order, cutoff, btype=btype, fs=fs, output="sos")
+        self._zi = None
+
+    def process(self, x):
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return x
+        if self._zi is None:
+            # Start in steady state at the first sample to avoid an onset transient
+            self._zi = sosfilt_zi(self.sos) * x[0]
+        y, self._zi = sosfilt(self.sos, x, zi=self._zi)
+        return y
+
+
+class BeatDetector:
+    """Incremental peak picking with a refractory period and an adaptive amplitude threshold."""
+
+    def __init__(self, fs, refractory=0.33, threshold=0.4, adapt=0.1):
+        self.fs = fs
+        self.refractory = refractory
+        self.threshold = threshold
+        self.adapt = adapt
+        self.amplitude = None
+        self._prev = (None, None)      # (t, y) of the previous sample
+        self._rising = False
+        self._candidate = None         # (t, y) of the best local maximum not yet confirmed
+        self._last_beat = None
+
+    def process(self, t, y):
+        """Feed samples; returns the times of the beats confirmed by them."""
+        beats = []
+        prev_t, prev_y = self._prev
+        for ti, yi in zip(t, y):
+            if self._candidate is not None and ti - self._candidate[0] >= self.refractory:
+                beats.append(self._confirm())
+            if prev_y is not None:
+                if yi < prev_y and self._rising and prev_y > 0:
+                    self._offer(prev_t, prev_y)
+                self._rising = yi > prev_y if yi != prev_y else self._rising
+            prev_t, prev_y = ti, yi
+        self._prev = (prev_t, prev_y)
+        return beats
+
+    def _offer(self, t, y):
+        if self.amplitude is not None and y < self.threshold * self.amplitude:
+            return
+        if self._last_beat is not None and t - self._last_beat < self.refractory:
+            return
+        if self._candidate is None or y > self._candidate[1]:
+            self._candidate = (t, y)
+
+    def _confirm(self):
+        t, y = self._candidate
+        self._candidate = None
+        self._last_beat = t
+        self.amplitude = y if self.amplitude is None else (1 - self.adapt) * self.amplitude + self.adapt * y
+        return t
+
+
+class SCRDetector:
+    """Skin conductance responses: trough-to-peak rises of at least min_amplitude (µS)."""
+
+    def __init__(self, min_amplitude=0.01):
+        self.min_amplitude = min_amplitude
+        self._prev = None
+        self._trough = None
+        self._rising = False
+
+    def process(self, t, y):
+        """Feed samples; returns (peak time, amplitude) of the SCRs completed by them."""
+        responses = []
+        for ti, yi in zip(t, y):
+            if self._prev is None:
+                self._trough = yi
+            else:
+                prev_t, prev_y = self._prev
+                if yi < prev_y and self._rising:
+                    amplitude = prev_y - self._trough
+                    if amplitude >= self.min_amplitude:
+                        responses.append((prev_t, amplitude))
+                    self._trough = yi
+                elif yi < self._trough or not self._rising:
+                    self._trough = min(self._trough, yi)
+                self._rising = yi > prev_y if yi != prev_y else self._rising
+            self._prev = (ti, yi)
+        return responses
+
+
+class EmotiBitStreamProcessor:
+    """
+    Per-packet EDA/PPG processing with bounded latency.
+
+    window is the length (s) of the sliding window used for HR, SDNN, RMSSD and the SCR rate.
+    """
+
+    def __init__(self, window=60.0, eda_cutoff=1.0, ppg_band=(0.5, 5.0), min_scr_amplitude=0.01,
+                 refractory=0.33):
+        self.eda_rate, self.ppg_rate = expected_rates["EDA"], expected_rates["PPG"]
+        self.window = window
+        self.eda_filter = CausalFilter(self.eda_rate, eda_cutoff, btype="low")
+        self.ppg_filter = CausalFilter(self.ppg_rate, ppg_band, btype="band")
+        self.beats = BeatDetector(self.ppg_rate, refractory=refractory)
+        self.scrs = SCRDetector(min_scr_amplitude)
+        self._beat_times = deque()
+        self._scr_times = deque()
+        self.scr_count = 0
+        self.beat_count = 0
+        self.last_time = None
+
+    def process_packet(self, ts, packet):
+        """
+        Process one raw record (base timestamp and JSON text or decoded dict). Returns the
+        current status, or None for a corrupt record.
+        """
+        if not isinstance(packet, dict):
+            packet = load_packet(packet)
+            if packet is None:
+                return None
+
+        new_beats, new_scrs = [], []
+        if packet.get("eda"):
+            eda = np.asarray(packet["eda"], dtype=float)
+            t = ts + np.arange(len(eda)) / self.eda_rate
+            new_scrs = self.scrs.process(t, self.eda_filter.process(eda))
+            self.last_time = max(self.last_time or t[-1], t[-1])
+        if packet.get("pgi"):
+            ppg = np.asarray(packet["pgi"], dtype=float)
+            t = ts + np.arange(len(ppg)) / self.ppg_rate
+            new_beats = self.beats.process(t, self.ppg_filter.process(ppg))
+            self.last_time = max(self.last_time or t[-1], t[-1])
+
+        self._beat_times.extend(new_beats)
+        self._scr_times.extend(peak for peak, _ in new_scrs)
+        self.beat_count += len(new_beats)
+        self.scr_count += len(new_scrs)
+        return self.status(new_beats=len(new_beats), new_scrs=len(new_scrs))
+
+    def _trim(self):
+        if self.last_time is None:
+            return
+        start = self.last_time - self.window
+        for times in (self._beat_times, self._scr_times):
+            while times and times[0] < start:
+                times.popleft()
+
+    def status(self, new_beats=0, new_scrs=0):
+        self._trim()
+        rr = np.diff(np.asarray(self._beat_times))
+        hr = 60 / rr.mean() if len(rr) else np.nan
+        return {
+            "time": self.last_time,
+            "HR": hr,
+            "SDNN": rr.std() if len(rr) > 1 else np.nan,
+            "RMSSD": np.sqrt(np.mean(np.diff(rr) ** 2)) if len(rr) > 2 else np.nan,
+            "SCR Count": self.scr_count,
+            "SCR Rate": len(self._scr_times) * 60 / self.window,  # per minute over the window
+            "new_beats": new_beats,
+            "new_scrs": new_scrs,
+        }
+
+
+def replay(path, processor=None, speed=None, report_every=10.0, chunksize=10_000, on_status=print):
+    """
+    Feed a recorded raw CSV (ts, data) to the processor packet by packet. speed=None runs
+    as fast as possible, 1.0 in real time, 10.0 ten times faster. Every report_every
+    seconds of recording time on_status(status) is called. Returns the list of reported
+    statuses and the per-packet processing latencies (s).
+    """
+    processor = processor or EmotiBitStreamProcessor()
+    reports, latencies = [], []
+    wall_start, first_ts, next_report = time.perf_counter(), None, None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for ts, text in zip(chunk["ts"].to_numpy(dtype=float), chunk["data"].tolist()):
+            if first_ts is None:
+                first_ts, next_report = ts, ts + report_every
+            if speed:
+                delay = (ts - first_ts) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            status = processor.process_packet(ts, text)
+            latencies.append(time.perf_counter() - t0)
+            if status is not None and ts >= next_report:
+                next_report += report_every * (1 + (ts - next_report) // report_every)
+                reports.append(status)
+                on_status(status)
+    return reports, np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a raw EmotiBit CSV through the online EDA/PPG processor.")
+    parser.add_argument("--input", required=True, help="Raw EmotiBit CSV with 'ts' and 'data' columns.")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay speed (1 = real time, 10 = 10x); as fast as possible if omitted.")
+    parser.add_argument("--window", type=float, default=60.0, help="Sliding window (s) for HR/HRV and SCR rate.")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Status interval in recording seconds.")
+    parser.add_argument("--output", default=None, help="Optional CSV for the reported statuses.")
+    args = parser.parse_args()
+
+    def show(status):
+        print(f"{pd.to_datetime(status['time'], unit='s')}  HR {status['HR']:6.1f}  SDNN {status['SDNN']:.3f}  "
+              f"RMSSD {status['RMSSD']:.3f}  SCRs {status['SCR Count']:4d} ({status['SCR Rate']:.1f}/min)")
+
+    reports, latencies = replay(args.input, EmotiBitStreamProcessor(window=args.window), speed=args.speed,
+                                report_every=args.report_every, on_status=show)
+    if len(latencies):
+        print(f"\n{len(latencies)} packets, latency per packet: median {np.median(latencies) * 1e6:.0f} µs, "
+              f"p99 {np.percentile(latencies, 99) * 1e6:.0f} µs, max {latencies.max() * 1e6:.0f} µs")
+    if args.output:
+        pd.DataFrame(reports).to_csv(args.output, index=False)
+        print(f"Saved {len(reports)} status rows to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
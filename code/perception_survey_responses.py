@@ -1,9 +1,14 @@
+import argparse
+import os
+
 import pandas as pd
-import pytz
 
-# Load the survey responses dataset again
+from instrumentation import instrumented
+from timebase import local_tz, local_format, parse_times, write_csv
+
+# Survey export and processed output (defaults; the pipeline config passes its own paths)
 file_path = 'C:/Users/Tomar/dev/datasets/WEPOP_summer2024/survey_responses.csv'
-survey_data = pd.read_csv(file_path)
+output_file_path = 'C:/Users/Tomar/dev/WEPOP_summer2024/results/perception_survey_responses.csv'
 
 # Filter and process relevant columns for the analysis
 perception_columns = [
@@ -28,39 +33,58 @@ perception_columns = [
     'air_quality_perception_Q3: How would you rate the air quality in this environment? [-2,2]',
 ]
 
-# Subset the data to the relevant columns for perception analysis
-perception_data = survey_data[perception_columns]
+# Update labels to match the instruction of skipping the Initial Survey
+labels = ['perception_survey_1', 'perception_survey_2', 'perception_survey_3', 'perception_survey_4', 'perception_survey_5']
 
-# Convert perception columns (excluding user_id and session_start) to integers
-perception_only_columns = perception_columns[2:]  # Exclude 'user_id' and 'session_start'
-perception_data[perception_only_columns] = perception_data[perception_only_columns].apply(pd.to_numeric, errors='coerce').astype('Int64')
 
-# Convert session_start to datetime for ordering survey rounds
-perception_data['session_start'] = pd.to_datetime(perception_data['session_start'], utc=True)
+@instrumented()
+def perception_responses(survey_data):
+    """Perception answers of every user, ordered by time and labelled perception_survey_1..5 (the initial survey dropped)."""
+    # Subset the data to the relevant columns for perception analysis
+    perception_data = survey_data[perception_columns].copy()
 
-# Convert the time to CET (Central European Time) with +2:00 during summer (CEST)
-cet = pytz.timezone('Europe/Berlin')
-perception_data['session_start'] = perception_data['session_start'].dt.tz_convert(cet)
+    # Convert perception columns (excluding user_id and session_start) to integers
+    perception_only_columns = perception_columns[2:]  # Exclude 'user_id' and 'session_start'
+    perception_data[perception_only_columns] = perception_data[perception_only_columns].apply(pd.to_numeric, errors='coerce').astype('Int64')
 
-# Remove the timezone offset and microseconds, keeping only date and time up to seconds
-perception_data['session_start'] = perception_data['session_start'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    # Convert session_start to datetime for ordering survey rounds (kept as a datetime until the CSV is written)
+    perception_data['session_start'] = parse_times(perception_data['session_start'])
 
-# Grouping data by 'user_id' to ensure each user has all five perception rounds
-grouped_perception_data = perception_data.groupby('user_id').apply(
-    lambda x: x.sort_values(by='session_start')).reset_index(drop=True)
+    # Convert the time to CET (Central European Time) with +2:00 during summer (CEST)
+    perception_data['session_start'] = perception_data['session_start'].dt.tz_convert(local_tz)
 
-# Update labels to match the instruction of skipping the Initial Survey
-labels = ['perception_survey_1', 'perception_survey_2', 'perception_survey_3', 'perception_survey_4', 'perception_survey_5']
+    # Order the rounds of each user by time (users in sorted order, as a groupby would)
+    grouped_perception_data = perception_data.sort_values(['user_id', 'session_start'], kind='stable').reset_index(drop=True)
 
-# Assign perception survey labels skipping 'Initial Survey' based on the order of appearance for each user
-grouped_perception_data['Label'] = grouped_perception_data.groupby('user_id').cumcount().map(dict(enumerate(labels, 1)))
+    # Assign perception survey labels skipping 'Initial Survey' based on the order of appearance for each user
+    grouped_perception_data['Label'] = grouped_perception_data.groupby('user_id').cumcount().map(dict(enumerate(labels, 1)))
 
-# Filter out the "Initial Survey" from the data
-filtered_perception_data = grouped_perception_data.dropna(subset=['Label'])
+    # Filter out the "Initial Survey" from the data
+    return grouped_perception_data.dropna(subset=['Label'])
+
+
+def process_survey(input_path, output_path):
+    """Read the survey export, extract the perception responses and write them as CSV; returns output_path."""
+    filtered_perception_data = perception_responses(pd.read_csv(input_path))
+
+    # Save the resulting DataFrame to a CSV file
+    # (local time without the timezone offset and microseconds, keeping only date and time up to seconds)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    write_csv(filtered_perception_data, output_path, date_format=local_format, index=False)
+
+    # Output file path for the user
+    print(f"File saved successfully at: {output_path}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the perception survey rounds from the survey export.")
+    parser.add_argument("--input", default=file_path, help="Survey responses CSV export.")
+    parser.add_argument("--output", default=output_file_path, help="Processed perception survey CSV.")
+    args = parser.parse_args()
+
+    process_survey(args.input, args.output)
 
-# Save the resulting DataFrame to a CSV file in the local directory
-output_file_path = 'C:/Users/Tomar/dev/WEPOP_summer2024/results/perception_survey_responses.csv'
-filtered_perception_data.to_csv(output_file_path, index=False)
 
-# Output file path for the user
-print(f"File saved successfully at: {output_file_path}")
+if __name__ == "__main__":
+    main()
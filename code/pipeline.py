@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Single entry point of the processing pipeline.
+
+Every stage is declared as a task with the files it reads, the outputs it writes and the
+tasks it depends on:
+
+    emotibit_wrangle   raw EmotiBit CSV -> per-participant streams     (emotibitDataWrangling)
+    eeg_wrangle        raw Muse CSV     -> per-participant streams     (eegDataWrangling)
+    env                sensor exports   -> env_HT.csv / env_LT.csv     (env_processing)
+    survey             survey export    -> perception survey CSV       (perception_survey_responses)
+    emotibit_features  EmotiBit streams -> cohort feature table        (emotibit_cohort)
+    eeg_features       EEG streams      -> cohort feature table        (eeg_cohort)
+    align              all of the above -> aligned per-session tables  (time_align)
+    emotibit_analysis_<participant>, eeg_analysis_<participant>
+                       cleaned trials   -> per-participant figures     (Emotibit_data_processing,
+                                                                        eeg_data_processing)
+
+Independent tasks run concurrently, each in its own process (max_parallel_tasks), and
+every task still parallelises over files/sessions with the configured number of workers.
+A task is skipped when its outputs exist and neither its input files (content hashes)
+nor its parameters (stage versions, rates, formats) changed since it last succeeded;
+the stages themselves then skip whatever files inside them are unchanged. A failed task
+is reported and only the tasks depending on it are skipped.
+
+All paths, sampling rates and participant ids come from one JSON config (default
+pipeline.json next to this file); relative paths are taken relative to the config file.
+
+With --metrics DIR every task, and the instrumented functions it calls, is recorded
+(wall/CPU time, peak memory, rows) into DIR/<run start time>/, summarised as
+metrics.json / metrics_summary.csv at the end (see instrumentation); --profile adds
+cProfile stats per task and worker process.
+
+Usage:
+    python pipeline.py                                  # every task that is out of date
+    python pipeline.py --tasks align --dry-run          # what 'align' (and its dependencies) would run
+    python pipeline.py --config my_study.json --force   # rebuild everything
+    python pipeline.py --metrics ../metrics --profile   # with a metrics report and cProfile stats
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from glob import glob
+
+import eegDataWrangling
+import eeg_cohort
+import eeg_data_processing
+import emotibitDataWrangling
+import emotibit_cohort
+import Emotibit_data_processing
+import env_processing
+import perception_survey_responses
+import time_align
+from batch_runner import _timed_call
+from build_cache import BuildManifest
+from instrumentation import enable, print_summary, read_records, stage, summarise, write_report
+from plot_backend import set_batch_mode
+from stream_store import formats, stream_path
+
+default_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.json")
+manifest_name = ".pipeline_manifest.json"
+
+# Bump when the task graph or the way tasks call the stages changes
+pipeline_version = "1"
+
+
+class Task:
+    """
+    One pipeline stage: func(**kwargs) reads inputs (file paths or glob patterns, expanded
+    when the task is about to run, i.e. after its dependencies wrote them) and writes
+    outputs (files or directories). params is everything else the outputs depend on.
+    """
+
+    def __init__(self, name, func, kwargs=None, inputs=(), outputs=(), deps=(), params=None):
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs or {}
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.params = {"pipeline": pipeline_version, **(params or {}), "kwargs": self.kwargs}
+
+    def input_files(self):
+        files = set()
+        for pattern in self.inputs:
+            files.update(p for p in glob(pattern, recursive=True) if os.path.isfile(p))
+        return sorted(files)
+
+    def stamp(self, state_dir):
+        """File recorded in the pipeline manifest when the task succeeds."""
+        return os.path.join(state_dir, "stamps", self.name + ".done")
+
+    def is_current(self, manifest, state_dir, inputs):
+        return (all(os.path.exists(p) for p in self.outputs)
+                and manifest.is_current(self.stamp(state_dir), inputs, self.params))
+
+    def run(self):
+        return self.func(**self.kwargs)
+
+
+def _execute(task):
+    """Run a task in a worker process: figures are rendered headless, plt.show() never blocks."""
+    set_batch_mode()
+    with stage(task.name):
+        task.run()
+
+
+# ---------- Config ----------
+
+def load_config(path):
+    """Config dict with every entry of 'paths' (and the participants' files) made absolute."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return os.path.normpath(os.path.join(base, os.path.expanduser(p)))
+
+    config["paths"] = {key: resolve(p) for key, p in config["paths"].items()}
+    for participant in config.get("analysis", {}).get("participants", []):
+        for device in ("emotibit", "eeg"):
+            if device in participant:
+                participant[device] = {trial: resolve(p) for trial, p in participant[device].items()}
+        participant["output"] = resolve(participant["output"])
+    return config
+
+
+def build_tasks(config):
+    """Every task of the pipeline, in declaration order."""
+    paths = config["paths"]
+    fmt = config.get("format", "parquet")
+    ext = formats[fmt]
+    workers = config.get("workers", 1)
+    figure_formats = config.get("figure_formats", ["png"])
+    emotibit = config.get("emotibit", {})
+    eeg = config.get("eeg", {})
+    env = config.get("env", {})
+    align = config.get("align", {})
+    analysis = config.get("analysis", {})
+
+    resampling = {key: emotibit[key] for key in ("method", "max_gap") if emotibit.get(key) is not None}
+    emotibit_streams = [os.path.join(paths["phys"], "*", f"*_{stream}{ext}") for stream in ("eda", "ppg", "motion")]
+    eeg_streams = [os.path.join(paths["phys"], "*", f"*_eeg{ext}")]
+    env_outputs = [os.path.join(paths["env"], f"env_{label}.csv") for label in env_processing.sessions]
+
+    tasks = [
+        Task("emotibit_wrangle", emotibitDataWrangling.process_emotibit_files,
+             dict(input_directory=paths["raw_emotibit"], output_root=paths["phys"], workers=workers, fmt=fmt,
+                  chunksize=emotibit.get("chunksize"), resampling=resampling),
+             inputs=[os.path.join(paths["raw_emotibit"], "*.csv")], outputs=[paths["phys"]],
+             params={stream: emotibitDataWrangling.stream_params(stream, resampling)
+                     for stream in emotibitDataWrangling.packet_layout}),
+        Task("eeg_wrangle", eegDataWrangling.process_eeg_files,
+             dict(input_directory=paths["raw_eeg"], output_root=paths["phys"], workers=workers, fmt=fmt,
+                  mmap=eeg.get("mmap", True)),
+             inputs=[os.path.join(paths["raw_eeg"], "*.csv")], outputs=[paths["phys"]],
+             params={"eeg": eegDataWrangling.eeg_params, "store": eegDataWrangling.store_params}),
+        Task("env", env_processing.process_env_files,
+             dict(input_dir=paths["raw_env"], output_dir=paths["env"], time_format=env.get("time_format"),
+                  chunksize=env.get("chunksize", env_processing.default_chunksize)),
+             inputs=[os.path.join(paths["raw_env"], pattern) for pattern in env_processing.sessions.values()],
+             outputs=env_outputs,
+             params={"version": env_processing.env_version, "keep_columns": env_processing.keep_columns}),
+        Task("survey", perception_survey_responses.process_survey,
+             dict(input_path=paths["raw_survey"], output_path=paths["survey"]),
+             inputs=[paths["raw_survey"]], outputs=[paths["survey"]],
+             params={"columns": perception_survey_responses.perception_columns,
+                     "labels": perception_survey_responses.labels}),
+        Task("emotibit_features", emotibit_cohort.run_cohort,
+             dict(input_root=paths["phys"], output_dir=paths["features"], workers=workers, fmt=fmt,
+                  figures_dir=paths["figures"] if emotibit.get("figures") else None, figure_formats=figure_formats),
+             inputs=emotibit_streams, deps=["emotibit_wrangle"],
+             outputs=[stream_path(os.path.join(paths["features"], "emotibit_cohort_features"), fmt)],
+             params=emotibit_cohort.feature_params),
+        Task("eeg_features", eeg_cohort.run_cohort,
+             dict(input_root=paths["phys"], output_dir=paths["features"], workers=workers, fmt=fmt),
+             inputs=eeg_streams, deps=["eeg_wrangle"],
+             outputs=[stream_path(os.path.join(paths["features"], "eeg_cohort_features"), fmt)],
+             params=eeg_cohort.feature_params),
+        Task("align", time_align.align_cohort,
+             dict(phys_root=paths["phys"], output_dir=paths["aligned"], env_dir=paths["env"],
+                  survey_path=paths["survey"], master=align.get("master", "eda"), rate=align.get("rate"),
+                  workers=workers, fmt=fmt),
+             inputs=[os.path.join(paths["phys"], "*", f"*_{stream}{ext}") for stream in time_align.phys_streams]
+             + env_outputs + [paths["survey"]],
+             outputs=[paths["aligned"]], deps=["emotibit_wrangle", "eeg_wrangle", "env", "survey"],
+             params=time_align.align_params),
+    ]
+
+    emotibit_fs = analysis.get("emotibit_fs", Emotibit_data_processing.fs)
+    eeg_fs = analysis.get("eeg_fs", eeg_data_processing.fs)
+    for participant in analysis.get("participants", []):
+        pid = participant["participant_id"]
+        output = participant["output"]
+        if "emotibit" in participant:
+            trials = participant["emotibit"]
+            tasks.append(Task(f"emotibit_analysis_{pid}", Emotibit_data_processing.analyse_participant,
+                              dict(cold_data_path=trials["cold"], hot_data_path=trials["hot"], participant_id=pid,
+                                   out_path=os.path.join(output, "emotibit"), fs=emotibit_fs,
+                                   figure_formats=figure_formats),
+                              inputs=[trials["cold"], trials["hot"]], outputs=[os.path.join(output, "emotibit")]))
+        if "eeg" in participant:
+            trials = participant["eeg"]
+            tasks.append(Task(f"eeg_analysis_{pid}", eeg_data_processing.analyse_participant,
+                              dict(file_cold=trials["cold"], file_hot=trials["hot"], participant_id=pid,
+                                   out_path=os.path.join(output, "eeg"), fs=eeg_fs, figure_formats=figure_formats),
+                              inputs=[trials["cold"], trials["hot"]], outputs=[os.path.join(output, "eeg")],
+                              params={"features": eeg_cohort.feature_params}))
+    return tasks
+
+
+def select_tasks(tasks, names):
+    """The named tasks and everything they depend on, in declaration order (all tasks if names is empty)."""
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        missing = [dep for dep in task.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Task {task.name} depends on unknown task(s): {', '.join(missing)}")
+    if not names:
+        return tasks
+
+    wanted, stack = set(), list(names)
+    while stack:
+        name = stack.pop()
+        if name not in by_name:
+            raise ValueError(f"Unknown task: {name} (known: {', '.join(by_name)})")
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(by_name[name].deps)
+    return [task for task in tasks if task.name in wanted]
+
+
+# ---------- Scheduler ----------
+
+def run_pipeline(tasks, state_dir, max_parallel=1, force=False, dry_run=False):
+    """
+    Run the tasks in dependency order, up to max_parallel at a time. Returns
+    {task name: status}, status one of 'ok', 'up to date', 'failed: ...', 'skipped: ...'
+    or (dry run) 'would run'.
+    """
+    manifest = BuildManifest(os.path.join(state_dir, manifest_name))
+    pending = {task.name: task for task in tasks}
+    status = {}
+    t0 = time.perf_counter()
+
+    def finished(name):
+        return name in status and status[name] in ("ok", "up to date", "would run")
+
+    def start_ready(pool, running):
+        """Submit (or settle without running) every task whose dependencies are done; loops until none is left."""
+        progress = True
+        while progress:
+            progress = False
+            for name, task in list(pending.items()):
+                blocked = [dep for dep in task.deps if dep in status and not finished(dep)]
+                if blocked:
+                    status[name] = f"skipped: {', '.join(blocked)} did not complete"
+                elif not all(finished(dep) for dep in task.deps):
+                    continue
+                else:
+                    inputs = task.input_files()
+                    if dry_run:
+                        rerun = force or any(status[dep] == "would run" for dep in task.deps) \
+                            or not task.is_current(manifest, state_dir, inputs)
+                        status[name] = "would run" if rerun else "up to date"
+                    elif not force and task.is_current(manifest, state_dir, inputs):
+                        status[name] = "up to date"
+                    else:
+                        print(f"[pipeline] starting {name}")
+                        running[pool.submit(_timed_call, _execute, task)] = task
+                        del pending[name]
+                        progress = True
+                        continue
+                print(f"[pipeline] {name}: {status[name]}")
+                del pending[name]
+                progress = True
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+        start_ready(pool, running)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                _, _, error, seconds = future.result()
+                if error is None:
+                    # Inputs are hashed now, after the run, so the record matches what the task read
+                    stamp = task.stamp(state_dir)
+                    os.makedirs(os.path.dirname(stamp), exist_ok=True)
+                    with open(stamp, "w", encoding="utf-8") as f:
+                        json.dump({"task": task.name, "seconds": round(seconds, 3),
+                                   "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+                    manifest.record(stamp, task.input_files(), task.params)
+                    manifest.save()
+                    status[task.name] = "ok"
+                else:
+                    status[task.name] = f"failed: {error}"
+                print(f"[pipeline] {task.name}: {status[task.name]} ({seconds:.2f} s)")
+            start_ready(pool, running)
+
+    print(f"\nPipeline summary ({time.perf_counter() - t0:.2f} s wall):")
+    for task in tasks:
+        print(f"  {task.name:<32} {status.get(task.name, 'not run')}")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the EmotiBit, EEG, environment and survey pipeline.")
+    parser.add_argument("--config", default=default_config, help="Pipeline config (JSON).")
+    parser.add_argument("--tasks", nargs="+", default=None,
+                        help="Run only these tasks (and the tasks they depend on).")
+    parser.add_argument("--force", action="store_true", help="Run every selected task, even if up to date (the stages still skip unchanged files).")
+    parser.add_argument("--dry-run", action="store_true", help="List what would run without running it.")
+    parser.add_argument("--list", action="store_true", help="List the tasks of the config and exit.")
+    parser.add_argument("--metrics", default=None,
+                        help="Record per-stage metrics into a new sub-directory of this directory.")
+    parser.add_argument("--profile", action="store_true", help="With --metrics, also write cProfile stats per task.")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    tasks = select_tasks(build_tasks(config), args.tasks)
+    if args.list:
+        for task in tasks:
+            print(f"{task.name:<32} <- {', '.join(task.deps) or '-'}")
+        return
+
+    run_dir = None
+    if args.metrics and not args.dry_run:
+        run_dir = enable(os.path.join(args.metrics, time.strftime("%Y%m%d-%H%M%S")), profile=args.profile)
+
+    state_dir = config["paths"].get("state", os.path.join(config["paths"]["features"], ".pipeline"))
+    status = run_pipeline(tasks, state_dir, max_parallel=config.get("max_parallel_tasks", 1), force=args.force,
+                          dry_run=args.dry_run)
+
+    if run_dir:
+        print(f"\nMetrics report written to: {write_report(run_dir)}")
+        print_summary(summarise(read_records(run_dir)))
+    if any(s.startswith(("failed", "skipped")) for s in status.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Rendering helpers for long-session figures.
+
+- Decimation to a pixel budget before plotting: min/max per pixel column (keeps every
+  peak and trough, so the rendered line looks the same) or LTTB (Largest-Triangle-
+  Three-Buckets, visually faithful with fewer points).
+- Batch mode: headless Agg backend, figures are closed instead of shown.
+- save_figure: PNG by default, EPS only when asked for (vector output of long series is
+  slow to write and large).
+- render_parallel: one figure job per participant/session on a worker pool.
+- show_table: notebook table viewer when available, printed otherwise.
+"""
+
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+
+from batch_runner import run_batch
+from instrumentation import instrumented
+
+# Figure formats written by save_figure unless overridden; add "eps" for publication figures
+default_formats = ("png",)
+
+# Points per pixel column kept by the min/max decimation
+points_per_pixel = 2
+
+_batch = os.environ.get("MPLBACKEND", "").lower() == "agg"
+
+
+def set_batch_mode(enabled=True):
+    """Headless rendering (Agg) without blocking plt.show() calls."""
+    global _batch
+    _batch = enabled
+    if enabled:
+        matplotlib.use("Agg", force=True)
+        plt.switch_backend("Agg")
+
+
+def batch_mode():
+    return _batch
+
+
+def _as_numeric(x):
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        t = pd.DatetimeIndex(x).as_unit("ns").asi8.astype(float)
+        t[x.isna().to_numpy()] = np.nan
+        return t
+    return x.to_numpy(dtype=float)
+
+
+def minmax_indices(y, n_buckets):
+    """Sorted indices of the first/last sample and of the min and max of y in each of n_buckets equal buckets."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    lows = offsets + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    idx = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return idx[idx < n]
+
+
+def lttb_indices(x, y, n_out):
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling to n_out points."""
+    x, y = _as_numeric(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = np.nanmean(x[nlo:nhi]), np.nanmean(y[nlo:nhi])
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if np.isfinite(area).any() else lo
+        idx[i + 1] = a
+    return idx
+
+
+def pixel_width(ax):
+    """Width of the axes in device pixels."""
+    return max(int(ax.get_window_extent().width), 1)
+
+
+def decimate(x, y, ax=None, n_points=None, method="minmax"):
+    """(x, y) reduced to what the axes can show: n_points, or points_per_pixel per pixel column of ax."""
+    if n_points is None:
+        n_points = points_per_pixel * (pixel_width(ax) if ax is not None else 2000)
+    if method == "minmax":
+        idx = minmax_indices(y, max(n_points // 2, 1))
+    elif method == "lttb":
+        idx = lttb_indices(x, y, n_points)
+    else:
+        raise ValueError(f"Unknown decimation method '{method}', expected 'minmax' or 'lttb'.")
+    return _take(x, idx), _take(y, idx)
+
+
+def _take(values, idx):
+    return values.iloc[idx] if hasattr(values, "iloc") else np.asarray(values)[idx]
+
+
+@instrumented()
+def save_figure(fig, save_path, stem, formats=None, **savefig_kwargs):
+    """Write fig as <save_path>/<stem>.<fmt> for each format; returns the written paths."""
+    paths = []
+    if save_path:
+        for fmt in formats or default_formats:
+            path = os.path.join(save_path, f"{stem}.{fmt}")
+            fig.savefig(path, format=fmt, **savefig_kwargs)
+            paths.append(path)
+    return paths
+
+
+def show_or_close(fig):
+    """plt.show() interactively; close the figure in batch mode so long runs do not accumulate them."""
+    if _batch:
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def show_table(name, df):
+    """Show a table in the notebook viewer (ace_tools_open) when it is installed; print it otherwise."""
+    try:
+        import ace_tools_open as tools
+    except ImportError:
+        print(f"{name}:\n{df}")
+        return
+    tools.display_dataframe_to_user(name=name, dataframe=df)
+
+
+def _render_job(job, render):
+    set_batch_mode(True)
+    return render(job)
+
+
+def render_parallel(render, jobs, workers=1, label=str):
+    """Run render(job) for every job on a worker pool with the Agg backend."""
+    set_batch_mode(True)
+    return run_batch(partial(_render_job, render=render), jobs, workers=workers, label=label)
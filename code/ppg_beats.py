@@ -0,0 +1,157 @@
+"""
+Batched PPG beat detection with RR-interval cleaning.
+
+The PPG channels (PGI, PGR, PGG) are band-limited once, in a single zero-phase filter
+call over all channels, and the beats of every channel are found by one find_peaks call
+on the channels laid end to end. Beat times are refined to sub-sample precision by
+parabolic interpolation, which matters at 25 Hz (40 ms between samples against RR
+differences of a few ms).
+
+RR intervals are cleaned with vectorized rules; each rule sets one bit of the quality flag:
+
+- first:   first beat of a channel (no RR interval);
+- range:   RR outside (min_rr, max_rr), e.g. missed beats, dropouts or double detections;
+- ectopic: RR deviating more than ectopic_tolerance from the median RR of the
+           surrounding median_beats beats.
+
+The beat table (channel, sample, timestamp, rr, quality) is the input of the HR/HRV
+features; quality == 0 marks a clean RR interval.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+from filter_bank import FilterBank
+from instrumentation import instrumented
+
+ppg_channels = ["PGI", "PGR", "PGG"]
+
+# 30-240 BPM fundamental; the dicrotic notch and higher harmonics are not needed for beat timing
+ppg_band = (0.5, 4.0)
+
+# Physiological RR range (s): 200 BPM to 30 BPM
+min_rr, max_rr = 0.3, 2.0
+
+# Relative deviation from the local median RR beyond which an interval counts as ectopic
+ectopic_tolerance = 0.2
+median_beats = 9
+
+# Peak prominence in units of the channel's robust standard deviation
+min_prominence = 0.5
+
+quality_flags = {"first": 1, "range": 2, "ectopic": 4}
+
+
+def robust_scale(signals):
+    """Per-channel (rows) robust standard deviation from the median absolute deviation."""
+    mad = np.median(np.abs(signals - np.median(signals, axis=-1, keepdims=True)), axis=-1)
+    return np.where(mad > 0, 1.4826 * mad, 1.0)
+
+
+def find_beats(signals, fs):
+    """
+    (channel row, sample, sub-sample offset) of the beats in band-limited channel-major
+    signals, from a single find_peaks call over all channels.
+    """
+    n_channels, n_samples = signals.shape
+    distance = max(int(min_rr * fs), 1)
+    # Zero (the filtered baseline) separates the channels, long enough that no peak spans two
+    gap = distance + 1
+    stride = n_samples + gap
+    flat = np.zeros(n_channels * stride)
+    flat.reshape(n_channels, stride)[:, :n_samples] = signals / robust_scale(signals)[:, None]
+
+    peaks, _ = find_peaks(flat, distance=distance, prominence=min_prominence, wlen=int(2 * max_rr * fs) | 1)
+    row, sample = np.divmod(peaks, stride)
+    keep = (sample > 0) & (sample < n_samples - 1)
+    peaks, row, sample = peaks[keep], row[keep], sample[keep]
+
+    # Vertex of the parabola through the peak sample and its neighbours
+    left, centre, right = flat[peaks - 1], flat[peaks], flat[peaks + 1]
+    curvature = left - 2 * centre + right
+    offset = np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, 1), 0.0)
+    return row, sample, np.clip(offset, -0.5, 0.5)
+
+
+def clean_rr(rr, channel_codes):
+    """Quality flags (int8) for the RR intervals of a beat table sorted by channel and time."""
+    first = np.ones(len(rr), dtype=bool)
+    first[1:] = channel_codes[1:] != channel_codes[:-1]
+    out_of_range = ~first & ~((rr >= min_rr) & (rr <= max_rr))
+
+    # Local median of the in-range intervals of the same channel
+    candidate = pd.Series(np.where(first | out_of_range, np.nan, rr))
+    medians = (candidate.groupby(channel_codes).rolling(median_beats, center=True, min_periods=1).median()
+               .reset_index(level=0, drop=True).sort_index().to_numpy())
+    ectopic = ~first & ~out_of_range & (np.abs(rr - medians) > ectopic_tolerance * medians)
+
+    return (first * quality_flags["first"] + out_of_range * quality_flags["range"]
+            + ectopic * quality_flags["ectopic"]).astype(np.int8)
+
+
+def _sample_times(times, sample, offset, fs):
+    """Beat times: the sample times (numeric seconds or datetimes) shifted by the sub-sample offset."""
+    if times is None:
+        return (sample + offset) / fs, (sample + offset) / fs
+    times = pd.Series(times)
+    if pd.api.types.is_datetime64_any_dtype(times):
+        base = pd.DatetimeIndex(times).as_unit("ns")
+        ns = base.asi8[sample] + np.round(offset / fs * 1e9).astype(np.int64)
+        return pd.DatetimeIndex(ns.astype("datetime64[ns]")).tz_localize(base.tz), ns / 1e9
+    seconds = times.to_numpy(dtype=float)[sample] + offset / fs
+    return seconds, seconds
+
+
+@instrumented()
+def detect_beats(data, fs, channels=ppg_channels, time_col=None, band=ppg_band):
+    """
+    Beat table of the PPG channels of data (those present): channel, sample (row
+    position in data), timestamp (from time_col, or seconds from the first sample),
+    rr (s, NaN for the first beat of a channel) and quality (0 = clean RR).
+    """
+    channels = [ch for ch in channels if ch in data.columns]
+    empty = pd.DataFrame({
+        "channel": pd.Categorical([], categories=channels), "sample": np.empty(0, dtype=np.int64),
+        "timestamp": np.empty(0), "rr": np.empty(0), "quality": np.empty(0, dtype=np.int8),
+    })
+    bank = FilterBank(fs, band=band, order=2)
+    if not channels or len(data) <= 3 * (2 * len(bank.sos) + 1):  # too short for the filter's edge padding
+        return empty
+
+    signals = bank.apply(np.ascontiguousarray(data[channels].to_numpy(dtype=float).T), axis=-1)  # channel-major
+    row, sample, offset = find_beats(signals, fs)
+    if not len(row):
+        return empty
+
+    timestamp, seconds = _sample_times(data[time_col] if time_col else None, sample, offset, fs)
+    rr = np.empty(len(row))
+    rr[0] = np.nan
+    rr[1:] = np.diff(seconds)
+    quality = clean_rr(rr, row)
+    rr[(quality & quality_flags["first"]) > 0] = np.nan
+    return pd.DataFrame({
+        "channel": pd.Categorical.from_codes(row, categories=channels),
+        "sample": sample.astype(np.int64),
+        "timestamp": timestamp,
+        "rr": rr,
+        "quality": quality,
+    })
+
+
+def beats_in(beats, index):
+    """Beats whose sample lies in index (the row positions of a segment of the frame they were detected on)."""
+    return beats[np.isin(beats["sample"].to_numpy(), np.asarray(index))]
+
+
+def clean_intervals(beats, channel="PGI"):
+    """Clean RR intervals (s) of one channel."""
+    return beats["rr"].to_numpy()[(beats["channel"] == channel).to_numpy() & (beats["quality"] == 0).to_numpy()]
+
+
+def heart_rate_features(beats, channel="PGI"):
+    """(HR in BPM, HRV as the std of the clean RR intervals), as returned by extract_ppg_features."""
+    rr = clean_intervals(beats, channel)
+    heart_rate = 60 / np.mean(rr) if len(rr) > 0 else 0
+    hrv = np.std(rr) if len(rr) > 1 else 0
+    return heart_rate, hrv
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+from scipy.signal import welch
+
+from instrumentation import instrumented, stage
+
+# Largest samples x channels block passed to one welch call (bounds its float64 segment copies)
+max_block_elements = 1_000_000
+
+
+def _fingerprint(signal):
+    return hashlib.blake2b(np.ascontiguousarray(signal, dtype=float).tobytes(), digest_size=16).hexdigest()
+
+
+class PSDCache:
+    """
+    Welch spectra computed once per (participant, session, stage, activity, channel,
+    fs, nperseg) and shared by every consumer (band power, activity analysis, plots).
+
+    ``stage`` tells apart spectra of the same segment at different processing steps
+    (e.g. "raw" and "filtered"). With a cache_dir, spectra are also stored as .npz
+    files together with a fingerprint of the signal they came from, so a later run
+    reuses them as long as the data is unchanged.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._spectra = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @instrumented()
+    def spectra(self, participant, session, activity, df, channels, fs, nperseg=1024, stage="filtered"):
+        """
+        Return {channel: (freqs, psd)} for one segment; missing channels are computed
+        together, in blocks of at most max_block_elements samples per welch call.
+        """
+        segment = (participant, session, stage, activity, fs, nperseg)
+        missing = [ch for ch in channels if segment + (ch,) not in self._spectra]
+        step = max(1, max_block_elements // max(len(df), 1))
+        for i in range(0, len(missing), step):
+            block = missing[i:i + step]
+            self._load_or_compute(segment, block, df[block].to_numpy(dtype=float))
+        return {ch: self._spectra[segment + (ch,)] for ch in channels}
+
+    def _load_or_compute(self, segment, channels, signals):
+        fs, nperseg = segment[-2:]
+        fingerprints = [_fingerprint(signals[:, i]) for i in range(len(channels))] if self.cache_dir else None
+
+        todo = []
+        for i, ch in enumerate(channels):
+            cached = self._read(segment, ch, fingerprints[i]) if self.cache_dir else None
+            if cached is None:
+                todo.append(i)
+            else:
+                self._spectra[segment + (ch,)] = cached
+
+        if todo:
+            with stage("welch", rows=len(signals)):
+                freqs, psd = welch(signals[:, todo], fs, nperseg=nperseg, axis=0)
+            for j, i in enumerate(todo):
+                spectrum = (freqs, psd[:, j])
+                self._spectra[segment + (channels[i],)] = spectrum
+                if self.cache_dir:
+                    self._write(segment, channels[i], fingerprints[i], spectrum)
+
+    def _path(self, segment, channel):
+        name = "_".join(str(part) for part in segment + (channel,))
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "-", name) + ".npz")
+
+    def _read(self, segment, channel, fingerprint):
+        path = self._path(segment, channel)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            if str(f["fingerprint"]) != fingerprint:
+                return None
+            return f["freqs"], f["psd"]
+
+    def _write(self, segment, channel, fingerprint, spectrum):
+        freqs, psd = spectrum
+        np.savez(self._path(segment, channel), freqs=freqs, psd=psd, fingerprint=fingerprint)
@@ -0,0 +1,95 @@
+"""
+Typed in-memory schema of the physiological streams.
+
+The resampled streams are stored as float64 with the activity label repeated as a string
+on every row. In memory they are held as:
+
+    signals     float32    EmotiBit channels (EDA, PPG, temperature, motion) and EEG channels
+    Activity    category   one small integer code per row, the labels stored once
+    t_ns        int64      epoch nanoseconds (time_align); DateTime columns are datetime64[ns]
+
+float32 keeps ~7 significant digits, more than the sensors resolve (the wrangler rounds to
+two decimals). Epoch times need 8 bytes: 'timestamp' stays float64 epoch seconds, the unit
+every feature function reads it in. Columns the schema does not know (feature tables,
+survey and environment columns) are left as they are.
+
+read_stream applies the schema while loading; apply_schema converts a frame in memory.
+Computations that accumulate (filters, cumulative sums, spectra) still run in float64 on
+the arrays they take from a frame; as_signal casts their output back for storage in it.
+"""
+
+import numpy as np
+import pandas as pd
+
+from eeg_features import channels as eeg_channels
+
+signal_dtype = np.float32
+epoch_dtype = np.int64
+
+# Signal columns of each stream, with the wrangler (PI/PR/PG) and analysis (PGI/PGR/PGG) names
+signal_columns = {
+    "eda": ["EDA", "EDL", "EDA Tonic", "EDA Phasic"],
+    "ppg": ["PI", "PR", "PG", "PGI", "PGR", "PGG"],
+    "temp": ["Temp", "T0", "T1", "TH"],
+    "motion": [f"{sensor}_{axis}" for sensor in ("ACC", "GY", "MG") for axis in "xyz"],
+    "eeg": list(eeg_channels),
+}
+
+categorical_columns = ["Activity"]
+epoch_columns = ["t_ns"]
+
+_signals = {column for columns in signal_columns.values() for column in columns}
+
+
+def schema_dtypes(columns):
+    """{column: dtype} for the columns the schema knows (usable as read_csv's dtype)."""
+    dtypes = {}
+    for column in columns:
+        if column in _signals:
+            dtypes[column] = signal_dtype
+        elif column in categorical_columns:
+            dtypes[column] = "category"
+        elif column in epoch_columns:
+            dtypes[column] = epoch_dtype
+    return dtypes
+
+
+def apply_schema(df):
+    """Convert the known columns of df to the schema, one column at a time (in place); returns df."""
+    for column, dtype in schema_dtypes(df.columns).items():
+        if df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def arrow_schema_types(schema):
+    """{column: Arrow type} of the known columns of an Arrow schema whose type differs from the schema's."""
+    import pyarrow as pa
+    targets = {signal_dtype: pa.float32(), epoch_dtype: pa.int64(), "category": pa.dictionary(pa.int32(), pa.string())}
+    types = {}
+    for column, dtype in schema_dtypes(schema.names).items():
+        target = targets[dtype]
+        current = schema.field(column).type
+        if dtype == "category" and pa.types.is_dictionary(current):
+            continue
+        if current != target:
+            types[column] = target
+    return types
+
+
+def as_signal(values, like):
+    """values (an array) in the floating dtype of like: float32 signals stay float32, anything else float64."""
+    return np.asarray(values).astype(np.result_type(np.asarray(like).dtype, signal_dtype), copy=False)
+
+
+def relabel(labels, mapping):
+    """
+    Categorical copy of labels with the values in mapping renamed; several labels may be
+    merged into one. Only the categories are renamed, the rows keep their integer codes.
+    """
+    labels = pd.Series(labels).astype("category")
+    renamed = [mapping.get(label, label) for label in labels.cat.categories]
+    recode, categories = pd.factorize(pd.Index(renamed))
+    codes = labels.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, recode[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=labels.index, name=labels.name)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Storage layer for the resampled physiological streams (_eda, _ppg, _temp, _motion, _eeg).
+
+Streams can be written as compressed Parquet (default), Arrow IPC (Feather v2) or CSV,
+and are read back with read_stream, which can load a subset of columns and/or a time
+range and converts the columns to the typed schema of stream_schema (float32 signals,
+categorical Activity) while loading. Parquet and Arrow need pyarrow.
+
+Usage (convert an existing CSV tree in place):
+    python stream_store.py --input ../datasets/transformed/phys/ --format parquet
+"""
+
+import argparse
+import glob
+import os
+
+import pandas as pd
+
+from stream_schema import arrow_schema_types, schema_dtypes
+
+# Storage format -> file extension
+formats = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "csv": ".csv",
+}
+default_format = "parquet"
+
+
+def stream_path(base, fmt=default_format):
+    """Path of a stream file given its path without extension, e.g. '<dir>/P01_HT_eda'."""
+    return base + formats[fmt]
+
+
+def format_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in formats.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"Unknown stream format for '{path}', expected one of {sorted(formats.values())}.")
+
+
+def write_stream(df, path):
+    """Write a stream; the format follows the file extension."""
+    fmt = format_of(path)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False, compression="zstd")
+    elif fmt == "arrow":
+        df.reset_index(drop=True).to_feather(path, compression="zstd")
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+class StreamWriter:
+    """
+    Append DataFrame chunks to one stream file (CSV rows, Parquet row groups or Arrow
+    record batches). The first chunk, even an empty one, creates the file and schema.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fmt = format_of(path)
+        self._writer = None
+        self._started = False
+
+    def write(self, df):
+        if self._started and df.empty:
+            return
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                if self.fmt == "parquet":
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression="zstd")
+                    self._writer = pa.ipc.new_file(self.path, table.schema, options=options)
+            self._writer.write_table(table)
+        self._started = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _typed_frame(names, read_column):
+    """
+    DataFrame in the typed schema, built one column at a time: read_column(name) returns
+    an Arrow column, which is cast before the next one is read, so at most one untyped
+    column is in memory.
+    """
+    import pyarrow as pa
+    columns = []
+    for name in names:
+        column = read_column(name)
+        target = arrow_schema_types(pa.schema([(name, column.type)])).get(name)
+        columns.append(column.cast(target) if target is not None else column)
+    return pa.table(columns, names=names).to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_stream(path, columns=None, time_range=None, time_col="timestamp", typed=True):
+    """
+    Load a stream written by write_stream (or any of the existing CSV files).
+
+    columns: optional list of columns to load (time_col is added when filtering by time).
+    time_range: optional (start, end) tuple, inclusive, compared against time_col. Either
+        bound may be None. For Parquet the filter is pushed down to the row groups.
+    typed: convert to the stream_schema dtypes while reading (False: as stored).
+    """
+    if columns is not None and time_range is not None and time_col not in columns:
+        columns = [time_col] + list(columns)
+
+    fmt = format_of(path)
+    if fmt == "parquet":
+        filters = None
+        if time_range is not None:
+            start, end = time_range
+            filters = [(time_col, op, bound) for op, bound in ((">=", start), ("<=", end)) if bound is not None]
+            filters = filters or None
+        if not typed:
+            return pd.read_parquet(path, columns=columns, filters=filters)
+        import pyarrow.parquet as pq
+        names = columns or [n for n in pq.read_schema(path).names if not n.startswith("__index_level_")]
+        return _typed_frame(names, lambda name: pq.read_table(path, columns=[name], filters=filters).column(0))
+
+    if fmt == "arrow":
+        from pyarrow import feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        df = _typed_frame(table.column_names, table.column) if typed else table.to_pandas()
+    else:
+        dtypes = schema_dtypes(columns or pd.read_csv(path, nrows=0).columns) if typed else None
+        df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+
+    if time_range is not None:
+        start, end = time_range
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df[time_col] >= start
+        if end is not None:
+            mask &= df[time_col] <= end
+        df = df[mask].reset_index(drop=True)
+    return df
+
+
+def convert_tree(root, fmt, remove_source=False):
+    """Convert every CSV stream below root to fmt."""
+    for src in sorted(glob.glob(os.path.join(root, "**", "*.csv"), recursive=True)):
+        dst = stream_path(os.path.splitext(src)[0], fmt)
+        write_stream(pd.read_csv(src), dst)
+        print(f"  {src} -> {dst}")
+        if remove_source:
+            os.remove(src)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV stream files to Parquet or Arrow IPC.")
+    parser.add_argument("--input", required=True, help="Root directory searched recursively for CSV streams.")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default=default_format, help="Target format.")
+    parser.add_argument("--remove-csv", action="store_true", help="Delete each CSV after it has been converted.")
+    args = parser.parse_args()
+
+    convert_tree(args.input, args.format, remove_source=args.remove_csv)
+
+
+if __name__ == "__main__":
+    main()
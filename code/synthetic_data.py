@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic inputs in the formats the pipeline reads, for benchmarks and dry runs
+without the campaign data:
+
+    raw EmotiBit   P##_<cond>_synthetic.csv   ts (epoch s), data (one JSON packet per second:
+                                              eda/edl 15, pgi/pgr/pgg 25, thr 15 every other
+                                              packet, acx..mgz 25 samples)    -> expand_data
+    Muse EEG       P##_<cond>_synthetic.csv   ts, tp9, af7, af8, tp10 (µV, 256 Hz), Activity,
+                                              user, usernames                -> eegDataWrangling
+    environment    <cond>_<n>.csv             keep_columns, Time as local wall-clock strings
+                                              (one file per session)         -> env_processing
+    survey         survey_responses.csv       perception_columns, an initial and five
+                                              perception rounds per session
+                                              -> perception_survey_responses
+
+Sessions follow the campaign layout of outdir/campaign_datetime.csv: a participant's
+session there keeps its start and activity windows (S01: cold/LT on 2024-08-07, hot/HT
+on 2024-08-29, both from 09:30 local), so the schedule-backed activity segments of the
+EmotiBit streams match the data. Sessions not in the file start at 09:30 local on their
+condition's campaign day, with the activity timeline `schedule` over the recording. A
+recording shorter than its session starts shortly before the first activity. Survey
+rounds are written for every session: an initial survey at its start, a round as each
+activity begins and one after the last; the user_id is the session's campaign id
+(S01A = LT, S01B = HT), so each session's answers are labelled on their own.
+
+Signals are shaped like the real ones (tonic EDA with SCRs, pulsatile PPG with heart-rate
+variability, 1/f EEG with alpha and 50 Hz mains, slow room-climate drift), so peak
+detection, filtering and spectra do the same work as on campaign data. Every session is
+generated from its own seed derived from (seed, participant, condition): the same
+arguments always give the same files, and adding sessions does not change existing ones.
+
+Usage:
+    python synthetic_data.py --output ../datasets/synthetic/raw --sessions 10 --minutes 20
+"""
+
+import argparse
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from activity_index import campaign_file, condition_campaign, load_campaign_schedule, participant_number
+from eeg_features import channels as eeg_channels
+from env_processing import keep_columns, sessions as env_sessions
+from perception_survey_responses import perception_columns
+from timebase import local_format, local_tz, utc_format
+
+# Campaign day of each condition and the local start time of sessions not in the campaign file
+condition_days = {"LT": "2024-08-07", "HT": "2024-08-29"}
+session_time = "09:30"
+
+conditions = ["HT", "LT"]
+
+# Session letter of each condition in the campaign ids (S01A cold, S01B hot)
+condition_letters = {"LT": "A", "HT": "B"}
+emotibit_rates = {"eda": 15, "ppg": 25, "thr": 7.5, "motion": 25}
+eeg_fs = 256
+env_interval_s = 10
+
+# Activity timeline of a session not in the campaign file, as fractions of its length; 'No Activity' fills the gaps
+schedule = [("No Activity", 0.10), ("Reading", 0.15), ("No Activity", 0.05), ("Writing", 0.15),
+            ("No Activity", 0.05), ("Discussion", 0.15), ("No Activity", 0.05), ("Call", 0.15),
+            ("No Activity", 0.15)]
+
+
+def session_keys(n_sessions):
+    """(participant, condition) of the first n sessions: P01 HT, P01 LT, P02 HT, ..."""
+    return [(f"P{i // 2 + 1:02d}", conditions[i % 2]) for i in range(n_sessions)]
+
+
+def session_rng(seed, participant, condition):
+    """Generator of one session, independent of how many other sessions are generated."""
+    return np.random.default_rng([seed, int(participant.lstrip("PS")), conditions.index(condition)])
+
+
+@lru_cache(maxsize=None)
+def campaign_sessions(path=campaign_file):
+    """
+    {(participant number, condition): (session start, [(activity, start, end), ...])} of
+    the campaign file, in UTC and in time order; empty when the file is missing.
+    """
+    if not os.path.exists(path):
+        return {}
+    by_campaign = {name: condition for condition, name in condition_campaign.items()}
+    sessions = {}
+    for record in pd.read_csv(path).to_dict("records"):
+        key = (participant_number(record["Participant_ID"]), by_campaign[record["Campaign"].lower()])
+        sessions[key] = (pd.Timestamp(record["DateTime"]).tz_convert("UTC"), [])
+    for row in load_campaign_schedule(path).sort_values("start").itertuples(index=False):
+        sessions[(row.participant, by_campaign[row.campaign])][1].append((row.activity, row.start, row.end))
+    return sessions
+
+
+def session_start(participant, condition):
+    """Start of a session as in the campaign file, else 09:30 local on the campaign day of its condition."""
+    known = campaign_sessions().get((participant_number(participant), condition))
+    if known is not None:
+        return known[0]
+    return pd.Timestamp(f"{condition_days[condition]} {session_time}").tz_localize(local_tz).tz_convert("UTC")
+
+
+def session_plan(participant, condition, seconds):
+    """(recording start, [(activity, start, end), ...]) of a session recorded for `seconds`, in UTC."""
+    start = session_start(participant, condition)
+    known = campaign_sessions().get((participant_number(participant), condition))
+    if known is not None and known[1]:
+        windows = known[1]
+        # Sessions last about an hour; a shorter recording starts a tenth of its length before the first activity
+        return max(start, windows[0][1] - pd.Timedelta(seconds=0.1 * seconds)), windows
+    bounds = start + pd.to_timedelta(np.cumsum([0] + [fraction for _, fraction in schedule]) * seconds, unit="s")
+    return start, [(activity, lo, hi) for (activity, _), lo, hi in zip(schedule, bounds[:-1], bounds[1:])
+                   if activity != "No Activity"]
+
+
+def activity_labels(times, windows):
+    """Activity of each sample at times (epoch s, sorted); the end of a window is inclusive, as in the schedule."""
+    times = np.asarray(times, dtype=float)
+    labels = np.full(len(times), "No Activity", dtype=object)
+    for activity, start, end in windows:
+        lo = np.searchsorted(times, start.timestamp(), side="left")
+        hi = np.searchsorted(times, end.timestamp(), side="right")
+        labels[lo:hi] = activity
+    return labels
+
+
+def _pink_noise(rng, n, scale=1.0):
+    """1/f noise: white noise shaped in the frequency domain."""
+    spectrum = rng.normal(size=n // 2 + 1) + 1j * rng.normal(size=n // 2 + 1)
+    spectrum /= np.sqrt(np.maximum(np.arange(n // 2 + 1), 1))
+    noise = np.fft.irfft(spectrum, n)
+    return scale * noise / (noise.std() or 1)
+
+
+def eda_signal(rng, seconds, fs=emotibit_rates["eda"]):
+    """Tonic level drifting around 0.3 µS with phasic SCRs (~3 per minute) and sensor noise."""
+    n = int(seconds * fs)
+    t = np.arange(n) / fs
+    tonic = 0.3 + 0.05 * np.sin(2 * np.pi * t / 600 + rng.uniform(0, 2 * np.pi)) + np.cumsum(rng.normal(0, 2e-4, n))
+    phasic = np.zeros(n)
+    for onset in rng.uniform(0, seconds, rng.poisson(seconds / 20)):
+        dt = t - onset
+        rise = dt > 0
+        phasic[rise] += rng.uniform(0.02, 0.2) * (np.exp(-dt[rise] / 4.0) - np.exp(-dt[rise] / 0.75))
+    return tonic + phasic + rng.normal(0, 0.002, n)
+
+
+def ppg_signals(rng, seconds, fs=emotibit_rates["ppg"]):
+    """Infrared, red and green PPG: a pulse wave at ~70 bpm with respiratory HRV, DC levels as on the EmotiBit."""
+    n = int(seconds * fs)
+    t = np.arange(n) / fs
+    hr = rng.uniform(60, 80) / 60 + 0.08 * np.sin(2 * np.pi * 0.25 * t) + np.cumsum(rng.normal(0, 2e-4, n))
+    phase = 2 * np.pi * np.cumsum(hr) / fs
+    pulse = np.sin(phase) + 0.4 * np.sin(2 * phase + 0.8) + 0.1 * np.sin(3 * phase + 1.6)
+    drift = np.cumsum(rng.normal(0, 1.0, n))
+    return {
+        "pgi": 153000 + 600 * pulse + drift + rng.normal(0, 30, n),
+        "pgr": 107000 + 300 * pulse + 0.5 * drift + rng.normal(0, 30, n),
+        "pgg": 7200 + 80 * pulse + 0.1 * drift + rng.normal(0, 5, n),
+    }
+
+
+def motion_signals(rng, seconds, fs=emotibit_rates["motion"]):
+    """Accelerometer (g, gravity on z), gyroscope (deg/s) and magnetometer axes with small movements."""
+    n = int(seconds * fs)
+    signals = {}
+    for axis, gravity in zip("xyz", (0.0, 0.0, 1.0)):
+        signals[f"ac{axis}"] = gravity + 0.02 * _pink_noise(rng, n) + rng.normal(0, 0.005, n)
+        signals[f"gy{axis}"] = 2.0 * _pink_noise(rng, n) + rng.normal(0, 0.5, n)
+        signals[f"mg{axis}"] = rng.uniform(-40, 40) + rng.normal(0, 1.0, n)
+    return signals
+
+
+def raw_emotibit_rows(seconds, seed=0, start_ts=None, participant="P01", condition="HT"):
+    """Raw EmotiBit logger rows (ts, data) of one session: one JSON packet per second."""
+    rng = session_rng(seed, participant, condition)
+    start_ts = session_plan(participant, condition, seconds)[0].timestamp() if start_ts is None else start_ts
+    seconds = int(seconds)
+    eda = eda_signal(rng, seconds).reshape(seconds, -1)
+    edl = (26500 + 50 * np.cumsum(rng.normal(0, 0.05, eda.size))).reshape(seconds, -1)
+    ppg = {key: values.reshape(seconds, -1) for key, values in ppg_signals(rng, seconds).items()}
+    motion = {key: values.reshape(seconds, -1) for key, values in motion_signals(rng, seconds).items()}
+    thr = (33.0 + 0.2 * np.sin(np.arange(seconds // 2 + 1) / 300) + rng.normal(0, 0.02, seconds // 2 + 1))
+
+    rows = []
+    for i in range(seconds):
+        packet = {"eda": np.round(eda[i], 4).tolist(), "edl": np.round(edl[i], 1).tolist()}
+        packet.update({key: np.round(values[i], 1).tolist() for key, values in ppg.items()})
+        if i % 2 == 0:
+            packet["thr"] = np.round(np.full(15, thr[i // 2]) + rng.normal(0, 0.01, 15), 3).tolist()
+        packet.update({key: np.round(values[i], 4).tolist() for key, values in motion.items()})
+        rows.append((start_ts + i, json.dumps(packet)))
+    return pd.DataFrame(rows, columns=["ts", "data"])
+
+
+def muse_eeg_frame(seconds, seed=0, start_ts=None, participant="P01", condition="HT", fs=eeg_fs):
+    """Muse export of one session: 1/f background, alpha and 50 Hz mains per channel, with activity labels."""
+    rng = session_rng(seed, participant, condition)
+    rng = np.random.default_rng(rng.integers(2 ** 63))  # separate stream from the EmotiBit signals
+    start, windows = session_plan(participant, condition, seconds)
+    start_ts = start.timestamp() if start_ts is None else start_ts
+    n = int(seconds * fs)
+    t = np.arange(n) / fs
+    frame = {"ts": start_ts + t}
+    for ch in eeg_channels:
+        alpha = rng.uniform(3, 8) * np.sin(2 * np.pi * rng.uniform(9, 11) * t + rng.uniform(0, 2 * np.pi))
+        mains = 2.0 * np.sin(2 * np.pi * 50 * t)
+        frame[ch] = np.round(_pink_noise(rng, n, scale=15.0) + alpha + mains + rng.normal(0, 2, n), 3)
+    frame["Activity"] = activity_labels(frame["ts"], windows)
+    frame["user"] = participant
+    frame["usernames"] = f"muse_{participant.lower()}"
+    return pd.DataFrame(frame)
+
+
+def env_frame(seconds, seed=0, start=None, condition="HT", interval=env_interval_s):
+    """
+    Room sensors of one session (all keep_columns), one row every interval seconds, with
+    Time as local wall-clock strings as the logger writes them.
+    """
+    rng = np.random.default_rng([seed, 99, conditions.index(condition)])
+    start = session_plan("P01", condition, seconds)[0] if start is None else start
+    n = int(seconds // interval) + 1
+    times = start + pd.to_timedelta(np.arange(n) * interval, unit="s")
+    air = (29.0 if condition == "HT" else 22.0) + 0.5 * np.sin(np.arange(n) / 180) + rng.normal(0, 0.05, n)
+    frame = {
+        "Time": times.tz_convert(local_tz).strftime(local_format),
+        "AirTemperature": air,
+        "Relative Humidity": 50 + 5 * np.sin(np.arange(n) / 360) + rng.normal(0, 0.3, n),
+        "Air velocity": np.abs(rng.normal(0.1, 0.03, n)),
+        "Luxmetro_1": 500 + rng.normal(0, 10, n),
+        "Net_Rad_1": rng.normal(5, 1, n),
+    }
+    for column, offset in zip([c for c in keep_columns if c.startswith("RTD/")], (-1.0, -0.3, 0.0, 0.2, -0.8, 0.5)):
+        frame[column] = air + offset + rng.normal(0, 0.05, n)
+    return pd.DataFrame(frame)[keep_columns].round(3)
+
+
+def survey_times(participant, condition, seconds):
+    """Initial survey at the session start, a round as each activity begins and one after the last (six in all)."""
+    windows = session_plan(participant, condition, seconds)[1]
+    times = [session_start(participant, condition)] + [lo for _, lo, _ in windows] + [windows[-1][2]]
+    while len(times) < 6:
+        times.append(times[-1] + pd.Timedelta(minutes=20))
+    return times[:6]
+
+
+def survey_frame(keys, seconds, seed=0):
+    """Survey export: an initial survey and five perception rounds for every (participant, condition) session."""
+    rng = np.random.default_rng([seed, 7])
+    rows = []
+    for participant, condition in keys:
+        user_id = f"S{participant_number(participant):02d}{condition_letters[condition]}"
+        for time in survey_times(participant, condition, seconds):
+            row = {"user_id": user_id, "session_start": time.strftime(utc_format)}
+            row.update({column: int(rng.integers(-2, 3)) for column in perception_columns[2:]})
+            rows.append(row)
+    return pd.DataFrame(rows, columns=perception_columns)
+
+
+def write_dataset(root, n_sessions, minutes=10, seed=0):
+    """
+    Raw inputs of n participant-sessions under root (emotibit/, eeg/, env/, survey/), laid
+    out as the pipeline config expects. Returns {kind: directory or file}.
+    """
+    paths = {kind: os.path.join(root, kind) for kind in ("emotibit", "eeg", "env", "survey")}
+    for directory in paths.values():
+        os.makedirs(directory, exist_ok=True)
+    seconds = int(minutes * 60)
+    keys = session_keys(n_sessions)
+
+    for participant, condition in keys:
+        name = f"{participant}_{condition}_synthetic.csv"
+        raw_emotibit_rows(seconds, seed, participant=participant, condition=condition).to_csv(
+            os.path.join(paths["emotibit"], name), index=False)
+        muse_eeg_frame(seconds, seed, participant=participant, condition=condition).to_csv(
+            os.path.join(paths["eeg"], name), index=False)
+
+    # One env file per session day and condition (HT_1.csv, LT_1.csv, ...), matched by env_processing's patterns
+    for participant, condition in keys:
+        pattern = env_sessions[condition]
+        name = pattern.replace("*", f"_{participant.lstrip('P')}")
+        env_frame(seconds, seed, session_plan(participant, condition, seconds)[0], condition).to_csv(
+            os.path.join(paths["env"], name), index=False)
+
+    paths["survey"] = os.path.join(paths["survey"], "survey_responses.csv")
+    survey_frame(keys, seconds, seed).to_csv(paths["survey"], index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write seeded synthetic raw EmotiBit, EEG, environment and survey data.")
+    parser.add_argument("--output", required=True, help="Root directory of the raw inputs.")
+    parser.add_argument("--sessions", type=int, default=2, help="Number of participant-sessions (HT/LT alternating).")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of each session.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generators.")
+    args = parser.parse_args()
+
+    paths = write_dataset(args.output, args.sessions, args.minutes, args.seed)
+    for kind, path in paths.items():
+        print(f"{kind:<9} {path}")
+
+
+if __name__ == "__main__":
+    main()
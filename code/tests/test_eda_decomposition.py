@@ -0,0 +1,23 @@
+"""Tonic/phasic decomposition and SCR detection on a response of known onset and amplitude."""
+
+import numpy as np
+import pytest
+
+from eda_decomposition import decompose, detect_scrs
+
+
+def test_scr_onset_and_amplitude():
+    fs, onset = 15, 20.0
+    t = np.arange(60 * fs) / fs
+    after = np.clip(t - onset, 0, None)
+    response = np.where(t >= onset, (1 - np.exp(-after / 0.75)) * np.exp(-after / 5), 0.0)
+    response *= 0.5 / response.max()
+    eda = 2 + 0.005 * t + response                  # drifting tonic level plus one 0.5 µS SCR
+
+    tonic, phasic = decompose(eda, fs)
+    scrs = detect_scrs(phasic, fs)
+    assert len(scrs) == 1
+    assert scrs["onset_time"].iloc[0] == pytest.approx(onset, abs=0.5)
+    assert scrs["amplitude"].iloc[0] == pytest.approx(0.5, rel=0.1)
+    # Before the response the tonic level follows the baseline (a lower envelope, so slightly below it)
+    np.testing.assert_allclose(tonic[t < onset - 5], 2 + 0.005 * t[t < onset - 5], atol=0.05)
@@ -0,0 +1,68 @@
+"""EEG store: window/activity lookups against the stream, with rows that have no time."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from activity_index import ActivitySegments
+from eeg_store import EEGStore, session_store, write_eeg_store
+from eeg_features import channels
+
+
+def eeg_frame(n=2560, fs=256, start=1723023000.0):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"timestamp": start + np.arange(n) / fs})
+    for ch in channels:
+        df[ch] = rng.normal(0, 10, n).astype(np.float32)
+    df["Activity"] = np.repeat(["No Activity", "Reading", "No Activity", "Writing"], n // 4)
+    return df
+
+
+def test_activity_frame_matches_stream(tmp_path):
+    df = eeg_frame()
+    df.to_parquet(tmp_path / "P01_HT_eeg.parquet", index=False)
+    store = session_store(str(tmp_path / "P01_HT_eeg.parquet"), "P01", "HT")
+    reading = df[df["Activity"] == "Reading"]
+    np.testing.assert_array_equal(store.activity_frame("Reading", channels)[channels].to_numpy(),
+                                  reading[channels].to_numpy())
+    assert len(store.activity("No Activity")) == 2
+
+
+def test_nat_rows_left_out(tmp_path):
+    df = eeg_frame()
+    df.loc[[5, 700, 701], "timestamp"] = np.nan
+    segments = ActivitySegments.from_labels(df["Activity"])
+    write_eeg_store(df, str(tmp_path / "s"), segments=segments)
+    store = EEGStore(str(tmp_path / "s"))
+
+    kept = df.dropna(subset=["timestamp"]).reset_index(drop=True)
+    assert len(store) == len(kept) and store.header["dropped_rows"] == 3
+    assert np.all(np.diff(store.timestamps) > 0)
+
+    # Windows are found by binary search over the whole index
+    start, end = kept["timestamp"].iloc[1000], kept["timestamp"].iloc[1500]
+    t, signals = store.window(start, end)
+    assert len(t) == 501
+    np.testing.assert_array_equal(signals.T, kept.loc[1000:1500, channels].to_numpy())
+
+    # Activity runs are shifted past the dropped rows
+    for activity in ("Reading", "Writing"):
+        np.testing.assert_array_equal(store.activity_frame(activity, channels)[channels].to_numpy(),
+                                      kept.loc[kept["Activity"] == activity, channels].to_numpy())
+
+
+def test_unsorted_timestamps_put_in_order(tmp_path):
+    df = eeg_frame()
+    # Blocks written out of order (e.g. a logger flushing late), with one row timed exactly like its neighbour
+    order = np.r_[0:600, 1200:1300, 600:1200, 1300:len(df)]
+    df.loc[801, "timestamp"] = df.loc[800, "timestamp"]
+    shuffled = df.iloc[order].reset_index(drop=True)
+    write_eeg_store(shuffled, str(tmp_path / "s"), segments=ActivitySegments.from_labels(shuffled["Activity"]))
+    store = EEGStore(str(tmp_path / "s"))
+
+    assert store.header["reordered_rows"] == 700 and store.header["dropped_rows"] == 0
+    assert np.all(np.diff(store.timestamps) >= 0)
+    np.testing.assert_array_equal(store.window(None, None)[1].T, df[channels].to_numpy())
+    for activity in ("No Activity", "Reading", "Writing"):
+        np.testing.assert_array_equal(store.activity_frame(activity, channels)[channels].to_numpy(),
+                                      df.loc[df["Activity"] == activity, channels].to_numpy())
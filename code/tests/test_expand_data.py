@@ -0,0 +1,48 @@
+"""expand_data against the original per-row loop (kept in benchmark_expand_data as the reference)."""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_expand_data import expand_data_rowwise, make_raw_rows
+from emotibitDataWrangling import expand_data, expected_rates, round_decimals
+
+streams = ["EDA", "PPG", "Temp", "Motion"]
+
+
+def assert_matches_rowwise(df):
+    for name, records, frame in zip(streams, expand_data_rowwise(df, expected_rates), expand_data(df, expected_rates)):
+        # Missing optional keys were None in the records; expand_stream writes NaN
+        reference = pd.DataFrame(records, columns=frame.columns).astype(float)
+        pd.testing.assert_frame_equal(frame, reference, check_dtype=False, atol=0, rtol=0, obj=name)
+
+
+def test_random_packets_bit_identical():
+    assert_matches_rowwise(make_raw_rows(300, seed=3))
+
+
+def test_decimal_ties_bit_identical():
+    # Logged values have a few decimals; x * 100 of these lands on the wrong side of .5 for np.round
+    ties = [0.285, 2.675, -9999.985, -9999.965, 8191.975, -2097114.995, 0.125, 1.005]
+    keys = ("eda", "edl", "pgi", "pgr", "pgg", "thr", "acx", "acy", "acz", "gyx", "gyy", "gyz", "mgx", "mgy", "mgz")
+    rows = [{"ts": 1723016400.0 + i, "data": json.dumps({key: np.roll(ties, i).tolist() for key in keys})}
+            for i in range(len(ties))]
+    assert_matches_rowwise(pd.DataFrame(rows))
+
+
+def test_missing_optional_and_corrupted_packets():
+    rows = [
+        {"ts": 1723016400.0, "data": json.dumps({"eda": [0.1, 0.2, 0.3], "pgi": [1.0, 2.0], "pgg": [3.0, 4.0]})},
+        {"ts": 1723016401.0, "data": '{"eda": [0.1, 0.2'},
+        {"ts": 1723016402.0, "data": json.dumps({"eda": [0.4, 0.5], "edl": [26500.125, 26500.135], "thr": [33.0]})},
+    ]
+    assert_matches_rowwise(pd.DataFrame(rows))
+
+
+@pytest.mark.parametrize("values", [np.array([0.285, 2.675, -9999.985, np.nan, 1e7 + 0.005]),
+                                    np.random.default_rng(0).normal(0, 1000, 10000)])
+def test_round_decimals_matches_round(values):
+    expected = np.array([round(v, 2) for v in values.tolist()])
+    np.testing.assert_array_equal(round_decimals(values, 2), expected)
@@ -0,0 +1,43 @@
+"""HRV metrics of synthetic RR series with known time-domain values and band powers."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hrv import hrv_metrics
+
+
+def beat_table(rr):
+    """Beat table (as detect_beats returns) of one channel with the given RR intervals (s)."""
+    t = np.cumsum(rr)
+    rr = np.concatenate([[np.nan], np.diff(t)])
+    return pd.DataFrame({
+        "channel": pd.Categorical(["PGI"] * len(t)), "sample": np.arange(len(t)), "timestamp": t,
+        "rr": rr, "quality": np.isnan(rr).astype(np.int8),
+    })
+
+
+def oscillating_rr(freq, duration, mean=0.85, amplitude=0.04):
+    """RR intervals (s) modulated by a sinusoid of freq Hz over duration seconds."""
+    rr, t = [], 0.0
+    while t < duration:
+        rr.append(mean + amplitude * np.sin(2 * np.pi * freq * t))
+        t += rr[-1]
+    return np.array(rr)
+
+
+def test_time_domain():
+    metrics = hrv_metrics(beat_table(np.tile([0.8, 0.9], 100)))
+    assert metrics["SDNN"] == pytest.approx(50, rel=1e-3)
+    assert metrics["RMSSD"] == pytest.approx(100)
+    assert metrics["pNN50"] == 100
+    assert metrics["N Intervals"] == 199
+
+
+@pytest.mark.parametrize("freq, band", [(0.1, "LF"), (0.01, "VLF"), (0.005, "VLF")])
+def test_band_power_of_long_segment(freq, band):
+    # 20 minutes: LF/HF come from 300 s windows, VLF from the whole segment; a sinusoid of
+    # 40 ms amplitude has a power of 40^2 / 2 ms^2
+    metrics = hrv_metrics(beat_table(oscillating_rr(freq, 1200)))
+    assert metrics[band] == pytest.approx(800, rel=0.05)
+    assert sum(metrics[name] for name in ["VLF", "LF", "HF"] if name != band) < 0.02 * metrics[band]
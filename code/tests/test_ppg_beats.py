@@ -0,0 +1,15 @@
+"""Quality flags of RR intervals (clean_rr)."""
+
+import numpy as np
+
+from ppg_beats import clean_rr, quality_flags
+
+
+def test_clean_rr_flags():
+    rr = np.array([np.nan, 0.8, 0.8, 0.8, 0.1, 0.8, 0.8, 1.3, 0.8, 0.8, np.nan, 2.5, 0.8])
+    codes = np.array([0] * 10 + [1] * 3)
+    expected = np.zeros(len(rr), dtype=np.int8)
+    expected[[0, 10]] = quality_flags["first"]     # first beat of each channel
+    expected[[4, 11]] = quality_flags["range"]     # 600 and 24 BPM
+    expected[7] = quality_flags["ectopic"]         # 60% above the local median
+    np.testing.assert_array_equal(clean_rr(rr, codes), expected)
@@ -0,0 +1,62 @@
+"""resample_data and interpolate_grid against the original per-column interp1d resampler."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import interp1d
+
+from benchmark_resample import make_expanded_stream, resample_data_interp1d
+from emotibitDataWrangling import expected_rates, interpolate_grid, resample_data
+
+
+@pytest.mark.parametrize("stream", list(expected_rates))
+@pytest.mark.parametrize("seconds", [1, 60, 900])
+def test_resample_data_identical_to_interp1d(stream, seconds):
+    df = make_expanded_stream(stream, seconds, seed=seconds)
+    rate = expected_rates[stream]
+    pd.testing.assert_frame_equal(resample_data(df, rate), resample_data_interp1d(df, rate), check_exact=True)
+
+
+def test_resample_data_duplicates_and_non_numeric():
+    df = pd.DataFrame({
+        "timestamp": [3.0, 0.0, 1.0, 1.0, 2.5, 0.5],
+        "x": [3.0, 0.0, 1.0, 1.0, 2.5, 0.5],
+        "flag": ["a", "b", "c", "d", "e", "f"],
+    })
+    # The reference's np.issubdtype check raises on pandas string columns, so it gets the numeric ones
+    expected = resample_data_interp1d(df[["timestamp", "x"]], 4)
+    pd.testing.assert_frame_equal(resample_data(df, 4), expected, check_exact=True)
+
+
+def test_interpolate_grid_matches_interp1d_per_column():
+    rng = np.random.default_rng(1)
+    t = np.sort(rng.uniform(0, 100, 500))
+    values = rng.normal(0, 1, (500, 3))
+    grid = np.arange(-2.0, 103.0, 0.1)  # extrapolates at both ends
+    out = interpolate_grid(t, values, grid)
+    for j in range(values.shape[1]):
+        expected = interp1d(t, values[:, j], kind="linear", fill_value="extrapolate", assume_sorted=True)(grid)
+        np.testing.assert_array_equal(out[:, j], expected)
+
+
+def test_empty_frame_returned_as_is():
+    df = pd.DataFrame(columns=["timestamp", "x"], dtype=float)
+    assert resample_data(df, 15) is df
+
+
+def test_nearest_mode():
+    df = pd.DataFrame({"timestamp": [0.0, 1.0, 2.0, 10.0, 11.0], "x": [0.0, 1.0, 2.0, 10.0, 11.0]})
+    nearest = resample_data(df, 2, method="nearest")
+    np.testing.assert_array_equal(nearest["x"].to_numpy()[:5], [0.0, 0.0, 1.0, 1.0, 2.0])
+
+
+def test_gap_aware_mode():
+    df = pd.DataFrame({"timestamp": [0.0, 1.0, 2.0, 10.0, 11.0], "x": [0.0, 1.0, 2.0, 10.0, 11.0]})
+    gapped = resample_data(df, 1, max_gap=2.0)
+    assert gapped["x"].isna().tolist() == [False] * 3 + [True] * 7 + [False] * 2
+
+
+def test_unknown_method():
+    df = pd.DataFrame({"timestamp": [0.0, 1.0], "x": [0.0, 1.0]})
+    with pytest.raises(ValueError):
+        resample_data(df, 2, method="cubic")
@@ -0,0 +1,55 @@
+"""Survey join of align_session: only the session's own answers, within the survey tolerance."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from activity_index import participant_number
+from time_align import align_session, time_col
+from timebase import to_epoch_ns
+
+
+def eda_session(tmp_path, start, minutes):
+    t = pd.Timestamp(start).timestamp() + np.arange(0, minutes * 60, 60.0)
+    path = tmp_path / "P01_HT_eda.csv"
+    pd.DataFrame({"timestamp": t, "EDA": np.linspace(0.2, 0.4, len(t))}).to_csv(path, index=False)
+    return {"eda": str(path)}
+
+
+def surveys(rows):
+    survey = pd.DataFrame(rows, columns=["user", "time", "Label"])
+    survey[time_col] = to_epoch_ns(survey.pop("time"))
+    survey["participant_number"] = survey.pop("user").map(participant_number)
+    return survey.sort_values(time_col, ignore_index=True)
+
+
+def test_survey_from_own_session_only(tmp_path):
+    survey = surveys([
+        ("P01", "2024-08-07 08:10:00", "LT_survey"),            # the other session, three weeks earlier
+        ("P01", "2024-08-29 07:40:00", "HT_survey_1"),
+        ("P01", "2024-08-29 08:00:00", "HT_survey_2"),
+        ("P02", "2024-08-29 07:30:00", "other_participant"),
+    ])
+    aligned = align_session(eda_session(tmp_path, "2024-08-29 07:35:00+00:00", 30), survey=survey, participant="P01")
+    labels = aligned.set_index(pd.to_datetime(aligned[time_col], utc=True))["survey_Label"]
+
+    assert pd.isna(labels.loc["2024-08-29 07:35:00+00:00"])  # before the session's first survey
+    assert labels.loc["2024-08-29 07:45:00+00:00"] == "HT_survey_1"
+    assert labels.loc["2024-08-29 08:04:00+00:00"] == "HT_survey_2"
+
+
+def test_survey_tolerance(tmp_path):
+    survey = surveys([("P01", "2024-08-29 06:00:00", "early")])
+    aligned = align_session(eda_session(tmp_path, "2024-08-29 06:30:00+00:00", 120), survey=survey, participant="P01")
+    stale = pd.to_datetime(aligned[time_col], utc=True) > pd.Timestamp("2024-08-29 07:00:00+00:00")
+    assert aligned.loc[~stale, "survey_Label"].eq("early").all()
+    assert aligned.loc[stale, "survey_Label"].isna().all()
+
+
+@pytest.mark.parametrize("participant", ["anonymous", ""])
+def test_participant_without_number_skips_survey(tmp_path, participant):
+    assert participant_number(participant) is None
+    survey = surveys([("P01", "2024-08-29 07:40:00", "HT_survey_1")])
+    aligned = align_session(eda_session(tmp_path, "2024-08-29 07:35:00+00:00", 10), survey=survey,
+                            participant=participant)
+    assert "survey_Label" not in aligned.columns
@@ -0,0 +1,30 @@
+"""parse_times and detect_format on mixed-resolution and unparseable timestamp strings."""
+
+import pandas as pd
+import pytest
+
+from timebase import detect_format, parse_times
+
+
+def mixed_seconds(n=300):
+    # Whole-second rows alternating with '.500' rows, as written by loggers that drop zero fractions
+    return [f"2024-08-29 09:{30 + i // 120:02d}:{(i // 2) % 60:02d}" + (".500" if i % 2 else "") for i in range(n)]
+
+
+def test_detect_format_tie_prefers_format_parsing_all():
+    assert detect_format(pd.Series(mixed_seconds()).iloc[:100]) == "ISO8601"
+
+
+@pytest.mark.parametrize("fmt", [None, "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"])
+def test_parse_times_mixed_fractions(fmt):
+    values = mixed_seconds()
+    times = parse_times(values, fmt=fmt)
+    assert times.notna().all()
+    assert times.iloc[1] - times.iloc[0] == pd.Timedelta(milliseconds=500)
+    assert times.is_monotonic_increasing
+
+
+def test_parse_times_warns_about_unparsed():
+    with pytest.warns(UserWarning, match="1 distinct"):
+        times = parse_times(mixed_seconds(4) + ["garbage", "garbage", None])
+    assert times.isna().sum() == 3
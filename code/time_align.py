@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Multi-modal time alignment of the EmotiBit, EEG, environment and survey streams.
+
+Every stream is put on one time base, int64 nanoseconds since the Unix epoch (UTC), and
+joined onto a master clock with sorted-merge joins (binary search on the sorted times):
+
+- asof_join:   the last (or next / nearest) row of the other stream, within a tolerance;
+               for slow streams such as the environment sensors and the surveys.
+- window_join: aggregates (mean, std, ...) of the other stream over each master interval,
+               computed from prefix sums; for faster streams such as EEG or PPG.
+
+Neither join builds a cross-product: the cost is O((n + m) log m) per stream and session.
+
+Usage (one aligned table per participant/condition, EDA as the master clock):
+    python time_align.py --phys ../datasets/transformed/phys/ --env ../datasets/transformed/env/ \
+        --output ../datasets/aligned/ --workers 8
+"""
+
+import argparse
+import os
+import re
+from functools import partial
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from activity_index import participant_number
+from batch_runner import run_batch
+from build_cache import BuildManifest
+from instrumentation import instrumented
+from stream_store import formats, default_format, stream_path, read_stream, write_stream
+from timebase import local_tz, local_format, utc_format, to_epoch_ns
+
+time_col = "t_ns"
+
+# Time column, string format (None for epoch seconds) and timezone of naive values, per kind of stream
+time_sources = {
+    "emotibit": ("timestamp", None, "UTC"),
+    "eeg": ("timestamp", None, "UTC"),
+    "env": ("datetime", utc_format, "UTC"),                  # env_processing output
+    "survey": ("session_start", local_format, local_tz),     # perception_survey_responses output
+}
+
+
+def with_time_base(df, source_col, fmt=None, tz="UTC", unit="s"):
+    """df with a t_ns column, sorted by it (only sorted again when needed); rows without a time are dropped."""
+    t = to_epoch_ns(df[source_col], fmt=fmt, tz=tz, unit=unit)
+    df = df.assign(**{time_col: t})
+    df = df[t != np.iinfo(np.int64).min]  # NaT
+    if not df[time_col].is_monotonic_increasing:
+        df = df.sort_values(time_col, kind="stable")
+    return df.reset_index(drop=True)
+
+
+def uniform_clock(start_ns, end_ns, rate):
+    """Master clock at `rate` Hz covering [start_ns, end_ns]."""
+    step = int(round(1e9 / rate))
+    return pd.DataFrame({time_col: np.arange(start_ns, end_ns + 1, step, dtype=np.int64)})
+
+
+def _groups(master, other, by):
+    """(master row positions, other row positions) per shared key; a single group without `by`."""
+    if by is None:
+        yield np.arange(len(master)), np.arange(len(other))
+        return
+    other_groups = other.groupby(by, sort=False).indices
+    for key, master_rows in master.groupby(by, sort=False).indices.items():
+        yield master_rows, other_groups.get(key, np.empty(0, dtype=np.intp))
+
+
+def _asof_positions(master_t, other_t, direction, tolerance):
+    """Index into other_t of the matching row for every master time, -1 where there is none."""
+    n = len(other_t)
+    if n == 0:
+        return np.full(len(master_t), -1, dtype=np.intp)
+    backward = np.searchsorted(other_t, master_t, side="right") - 1
+    forward = np.searchsorted(other_t, master_t, side="left")
+    if direction == "backward":
+        pos = backward
+    elif direction == "forward":
+        pos = np.where(forward < n, forward, -1)
+    elif direction == "nearest":
+        back_gap = np.where(backward >= 0, master_t - other_t[np.maximum(backward, 0)], np.iinfo(np.int64).max)
+        fwd_gap = np.where(forward < n, other_t[np.minimum(forward, n - 1)] - master_t, np.iinfo(np.int64).max)
+        pos = np.where(fwd_gap < back_gap, forward, backward)
+        pos = np.where((back_gap == np.iinfo(np.int64).max) & (fwd_gap == np.iinfo(np.int64).max), -1, pos)
+    else:
+        raise ValueError(f"Unknown direction '{direction}', expected 'backward', 'forward' or 'nearest'.")
+    if tolerance is not None:
+        matched = pos >= 0
+        gap = np.abs(master_t - other_t[np.where(matched, pos, 0)])
+        pos = np.where(matched & (gap <= tolerance), pos, -1)
+    return pos
+
+
+def asof_join(master, other, columns=None, direction="backward", tolerance=None, by=None, prefix=""):
+    """
+    Add to master the columns of the other row that is the last at or before (backward), the
+    first at or after (forward) or the closest (nearest) to each master time. tolerance is in
+    ns; unmatched rows get missing values. With by, rows are only matched within equal keys.
+    Both frames must be sorted by t_ns.
+    """
+    columns = [c for c in (columns or other.columns) if c != time_col and c not in (by or [])]
+    pos = np.full(len(master), -1, dtype=np.intp)
+    master_t, other_t = master[time_col].to_numpy(), other[time_col].to_numpy()
+    for master_rows, other_rows in _groups(master, other, by):
+        found = _asof_positions(master_t[master_rows], other_t[other_rows], direction, tolerance)
+        pos[master_rows] = np.where(found >= 0, other_rows[np.maximum(found, 0)] if len(other_rows) else -1, -1)
+
+    joined = {prefix + c: other[c].array.take(pos, allow_fill=True) for c in columns}
+    return master.assign(**joined)
+
+
+def _window_aggregate(master_t, other_t, values, before, after, agg):
+    """One aggregate of values over [t - before, t + after) for every master time, from prefix sums."""
+    lo = np.searchsorted(other_t, master_t - before, side="left")
+    hi = np.searchsorted(other_t, master_t + after, side="left")
+    valid = ~np.isnan(values)
+    count = np.concatenate([[0], np.cumsum(valid)])
+    n = count[hi] - count[lo]
+    if agg == "count":
+        return n
+
+    if agg in ("first", "last"):
+        # Position of the first/last valid value within [lo, hi)
+        valid_pos = np.flatnonzero(valid)
+        if not len(valid_pos):
+            return np.full(len(master_t), np.nan)
+        k = np.searchsorted(valid_pos, lo) if agg == "first" else np.searchsorted(valid_pos, hi) - 1
+        result = values[valid_pos[np.clip(k, 0, len(valid_pos) - 1)]]
+    elif agg in ("mean", "sum", "std"):
+        # Centred prefix sums keep the precision of long sessions
+        offset = values[valid].mean() if valid.any() else 0.0
+        centred = np.where(valid, values - offset, 0.0)
+        s1 = np.concatenate([[0.0], np.cumsum(centred)])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_centred = (s1[hi] - s1[lo]) / n
+            if agg == "mean":
+                result = mean_centred + offset
+            elif agg == "sum":
+                result = (s1[hi] - s1[lo]) + n * offset
+            else:
+                s2 = np.concatenate([[0.0], np.cumsum(centred ** 2)])
+                result = np.sqrt(np.clip((s2[hi] - s2[lo]) / n - mean_centred ** 2, 0, None))
+    else:
+        raise ValueError(f"Unknown aggregation '{agg}', expected mean, std, sum, count, first or last.")
+    return np.where(n > 0, result, np.nan)
+
+
+def window_join(master, other, columns, before=0, after=None, aggs=("mean",), by=None, prefix=""):
+    """
+    Aggregate other rows with t in [t - before, t + after) onto each master time (ns). By
+    default the window is the master interval [t, next t). aggs: mean, std, sum, count,
+    first, last; missing values are ignored. With by, rows are only aggregated within equal
+    keys. Both frames must be sorted by t_ns.
+    """
+    master_t, other_t = master[time_col].to_numpy(), other[time_col].to_numpy()
+    if after is None:
+        step = np.diff(master_t)
+        after = int(np.median(step)) if len(step) else 0
+
+    names = [(c, agg, f"{prefix}{c}_{agg}" if len(aggs) > 1 else prefix + c) for c in columns for agg in aggs]
+    joined = {name: np.full(len(master), np.nan) for _, _, name in names}
+    for master_rows, other_rows in _groups(master, other, by):
+        for c, agg, name in names:
+            values = other[c].to_numpy(dtype=float)[other_rows]
+            joined[name][master_rows] = _window_aggregate(master_t[master_rows], other_t[other_rows], values,
+                                                          before, after, agg)
+    return master.assign(**joined)
+
+
+# Alignment of one participant/condition
+
+# EmotiBit/EEG stream suffixes in the transformed phys tree
+phys_streams = ["eda", "ppg", "temp", "motion", "eeg"]
+session_re = re.compile(r'^(P\d+)_([A-Za-z0-9]+)_(' + "|".join(phys_streams) + r')(\.[a-z]+)$')
+format_preference = [".parquet", ".arrow", ".csv"]
+
+# A survey answer applies until the next one, for at most survey_tolerance_s
+align_params = {"version": "2", "env_tolerance_s": 300, "survey_tolerance_s": 3600}
+manifest_name = ".aligned_manifest.json"
+
+
+def find_sessions(phys_root):
+    """Map (participant, condition) -> {stream: path} from the transformed phys tree."""
+    sessions = {}
+    for path in sorted(glob(os.path.join(phys_root, "*", "*_*_*.*"))):
+        m = session_re.match(os.path.basename(path))
+        if not m or m.group(4) not in format_preference:
+            continue
+        streams = sessions.setdefault((m.group(1), m.group(2).upper()), {})
+        current = streams.get(m.group(3))
+        if current is None or format_preference.index(m.group(4)) < format_preference.index(os.path.splitext(current)[1]):
+            streams[m.group(3)] = path
+    return sessions
+
+
+@instrumented()
+def align_session(paths, master="eda", rate=None, env=None, survey=None, participant=None):
+    """
+    One frame on the master clock: the master stream itself (or a uniform clock at `rate` Hz
+    over its span), the other phys streams averaged over each master interval, and the
+    environment and survey values as of each master time.
+    """
+    def load(stream):
+        source, fmt, tz = time_sources["eeg" if stream == "eeg" else "emotibit"]
+        return with_time_base(read_stream(paths[stream]), source, fmt, tz).drop(columns=[source])
+
+    base = load(master)
+    if rate is not None:
+        base = uniform_clock(base[time_col].iloc[0], base[time_col].iloc[-1], rate).pipe(
+            window_join, base, [c for c in base.columns if c != time_col], prefix=f"{master}_")
+    else:
+        base = base[[time_col] + [c for c in base.columns if c != time_col]]
+        base = base.rename(columns={c: f"{master}_{c}" for c in base.columns if c != time_col})
+
+    for stream in phys_streams:
+        if stream == master or stream not in paths:
+            continue
+        other = load(stream)
+        numeric = [c for c in other.columns if c != time_col and pd.api.types.is_numeric_dtype(other[c])]
+        base = window_join(base, other, numeric, prefix=f"{stream}_")
+
+    if env is not None:
+        base = asof_join(base, env, direction="backward", tolerance=align_params["env_tolerance_s"] * 10**9,
+                         prefix="env_")
+    number = participant_number(participant) if participant is not None else None
+    if survey is not None and number is not None:
+        own = session_surveys(survey[survey["participant_number"] == number], base[time_col].to_numpy())
+        base = asof_join(base, own.drop(columns=["participant_number"]), direction="backward",
+                         tolerance=align_params["survey_tolerance_s"] * 10**9, prefix="survey_")
+    return base
+
+
+def session_surveys(survey, master_t):
+    """
+    Survey rows answered on the local day(s) of the session spanning master_t (ns). The
+    surveys carry no condition, and the participant's other session is on another day.
+    """
+    if not len(master_t):
+        return survey.iloc[0:0]
+    first, last = pd.to_datetime(master_t[[0, -1]], utc=True).tz_convert(local_tz).normalize()
+    days = pd.to_datetime(survey[time_col], utc=True).dt.tz_convert(local_tz).dt.normalize()
+    return survey[(days >= first) & (days <= last)]
+
+
+def load_env(env_dir, condition):
+    path = os.path.join(env_dir, f"env_{condition}.csv")
+    if not os.path.exists(path):
+        return None, []
+    source, fmt, tz = time_sources["env"]
+    return with_time_base(pd.read_csv(path), source, fmt, tz).drop(columns=[source]), [path]
+
+
+def load_survey(path, id_col="user_id"):
+    if path is None:
+        return None
+    source, fmt, tz = time_sources["survey"]
+    survey = with_time_base(pd.read_csv(path), source, fmt, tz).drop(columns=[source])
+    survey["participant_number"] = survey[id_col].map(participant_number)
+    return survey.drop(columns=[id_col])
+
+
+def aligned_path(output_dir, participant, condition, fmt=default_format):
+    return stream_path(os.path.join(output_dir, participant, f"{participant}_{condition}_aligned"), fmt)
+
+
+def process_session(job, output_dir, env_dir=None, survey_path=None, master="eda", rate=None, fmt=default_format):
+    (participant, condition), paths = job
+    env, _ = load_env(env_dir, condition) if env_dir else (None, [])
+    aligned = align_session(paths, master=master, rate=rate, env=env, survey=load_survey(survey_path),
+                            participant=participant)
+    output = aligned_path(output_dir, participant, condition, fmt)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    return write_stream(aligned, output)
+
+
+def align_cohort(phys_root, output_dir, env_dir=None, survey_path=None, master="eda", rate=None,
+                 workers=1, force=False, fmt=default_format):
+    sessions = {key: paths for key, paths in find_sessions(phys_root).items() if master in paths}
+    manifest = BuildManifest(os.path.join(output_dir, manifest_name))
+    params = {**align_params, "master": master, "rate": rate}
+
+    def inputs(key, paths):
+        extra = [os.path.join(env_dir, f"env_{key[1]}.csv")] if env_dir else []
+        extra += [survey_path] if survey_path else []
+        return list(paths.values()) + [p for p in extra if os.path.exists(p)]
+
+    jobs = [
+        (key, paths) for key, paths in sessions.items()
+        if force or not manifest.is_current(aligned_path(output_dir, *key, fmt), inputs(key, paths), params)
+    ]
+    print(f"{len(sessions) - len(jobs)} of {len(sessions)} session(s) already aligned, "
+          f"processing {len(jobs)} with {workers} worker(s)...")
+
+    def checkpoint(outcome):
+        (key, paths), output, error, _ = outcome
+        if error is None:
+            manifest.record(output, inputs(key, paths), params)
+            manifest.save()
+
+    return run_batch(partial(process_session, output_dir=output_dir, env_dir=env_dir, survey_path=survey_path,
+                             master=master, rate=rate, fmt=fmt),
+                     jobs, workers=workers, label=lambda job: "{}_{}".format(*job[0]), on_done=checkpoint)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align the EmotiBit, EEG, environment and survey streams per session.")
+    parser.add_argument("--phys", default="../datasets/transformed/phys/", help="Root of the per-participant streams.")
+    parser.add_argument("--env", default=None, help="Directory with env_HT.csv / env_LT.csv.")
+    parser.add_argument("--survey", default=None, help="Processed perception survey CSV.")
+    parser.add_argument("--output", default="../datasets/aligned/", help="Directory for the aligned tables.")
+    parser.add_argument("--master", choices=phys_streams, default="eda", help="Stream that provides the master clock.")
+    parser.add_argument("--rate", type=float, default=None, help="Uniform master clock in Hz instead of the master's samples.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of sessions aligned in parallel.")
+    parser.add_argument("--force", action="store_true", help="Realign every session, ignoring the manifest.")
+    parser.add_argument("--format", choices=sorted(formats), default=default_format, help="Output storage format.")
+    args = parser.parse_args()
+
+    align_cohort(args.phys, args.output, env_dir=args.env, survey_path=args.survey, master=args.master,
+                 rate=args.rate, workers=args.workers, force=args.force, fmt=args.format)
+
+
+if __name__ == "__main__":
+    main()
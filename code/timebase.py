@@ -0,0 +1,143 @@
+"""
+Shared timestamp normalization.
+
+Timestamps are parsed once, with an explicit format, into native datetime64[ns, UTC]
+values (or int64 epoch nanoseconds). Repeated strings, which are common in
+environmental logs sampled faster than their time resolution, are parsed only once.
+Strings are only produced again when a CSV is written (write_csv).
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+local_tz = "Europe/Berlin"
+
+# Tried in order when no format is given; month-first before day-first as in pandas' inference
+candidate_formats = [
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+]
+
+# Output formats of the CSV writers
+utc_format = "%Y-%m-%dT%H:%M:%SZ"
+local_format = "%Y-%m-%d %H:%M:%S"
+
+
+def detect_format(samples, candidates=candidate_formats):
+    """
+    Candidate format that parses the most sample strings; garbage rows are tolerated. When
+    no single candidate parses every sample (e.g. whole-second rows mixed with '.500' rows,
+    which tie between the '%S' and '%S.%f' formats), 'ISO8601' is returned instead if it
+    parses more of them.
+    """
+    samples = pd.Series(samples).dropna().astype(str)
+    if samples.empty:
+        return candidates[0]
+    best, best_count = None, 0
+    for fmt in candidates:
+        count = int(pd.to_datetime(samples, format=fmt, errors="coerce", utc="%z" in fmt).notna().sum())
+        if count > best_count:
+            best, best_count = fmt, count
+        if count == len(samples):
+            return fmt
+    if best is None:
+        raise ValueError(f"No known timestamp format matches e.g. '{samples.iloc[0]}'; pass the format explicitly.")
+    if _parsed_count(samples, "ISO8601") > best_count:
+        return "ISO8601"
+    return best
+
+
+def _parsed_count(samples, fmt):
+    try:
+        return int(pd.to_datetime(samples, format=fmt, errors="coerce", utc=True).notna().sum())
+    except (ValueError, TypeError):
+        return 0
+
+
+def parse_times(values, fmt=None, tz="UTC"):
+    """
+    datetime64[ns, UTC] Series from timestamp strings (or datetimes). Naive values are
+    interpreted in tz; nonexistent and ambiguous local times (DST changes) become NaT.
+    Strings that do not match fmt are parsed again as ISO 8601 (e.g. '.500' rows among
+    whole-second ones); those that still fail become NaT, with a warning giving their
+    count. Each distinct string is parsed only once.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        times = pd.DatetimeIndex(values)
+    else:
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques).astype(str)
+        if fmt is None:
+            fmt = detect_format(uniques.iloc[:100])
+        parsed = pd.DatetimeIndex(pd.to_datetime(uniques, format=fmt, errors="coerce", utc="%z" in fmt))
+        parsed = _reparse_failed(uniques, parsed)
+        times = parsed.take(codes, allow_fill=True, fill_value=pd.NaT) if len(parsed) else pd.DatetimeIndex(
+            np.full(len(codes), np.datetime64("NaT", "ns")))
+    if times.tz is None:
+        times = times.tz_localize(tz, ambiguous="NaT", nonexistent="NaT")
+    return pd.Series(times.tz_convert("UTC").as_unit("ns"), index=values.index)
+
+
+def _reparse_failed(strings, parsed):
+    """parsed with the strings it left NaT retried as ISO 8601; warns about any still unparsed."""
+    failed = np.flatnonzero(parsed.isna())
+    if not len(failed):
+        return parsed
+    utc = parsed.tz is not None
+    values = parsed.as_unit("ns").asi8.copy()
+    try:
+        retried = pd.DatetimeIndex(pd.to_datetime(strings.iloc[failed], format="ISO8601", errors="coerce", utc=utc))
+    except (ValueError, TypeError):
+        retried = None
+    if retried is not None and (retried.tz is not None) == utc:
+        ok = np.asarray(retried.notna())
+        values[failed[ok]] = retried[ok].as_unit("ns").asi8
+        failed = failed[~ok]
+    if len(failed):
+        warnings.warn(f"{len(failed)} distinct timestamp string(s) could not be parsed (e.g. '{strings.iloc[failed[0]]}') "
+                      f"and became NaT.", stacklevel=3)
+    parsed = pd.DatetimeIndex(values.view("datetime64[ns]"))
+    return parsed.tz_localize("UTC") if utc else parsed
+
+
+def to_epoch_ns(values, fmt=None, tz="UTC", unit="s"):
+    """int64 epoch nanoseconds from numeric epoch values in `unit`, datetimes or strings; NaT is int64 min."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        scale = pd.Timedelta(1, unit=unit).value
+        values = values.to_numpy(dtype=float)
+        # NaN -> NaT explicitly: casting NaN to int64 is undefined (int64 min on x86 only)
+        ns = np.full(len(values), np.iinfo(np.int64).min, dtype=np.int64)
+        known = ~np.isnan(values)
+        ns[known] = np.round(values[known] * scale).astype(np.int64)
+        return ns
+    return pd.DatetimeIndex(parse_times(values, fmt=fmt, tz=tz)).asi8
+
+
+def from_epoch_ns(values, tz="UTC"):
+    """datetime64[ns, tz] Series from int64 epoch nanoseconds."""
+    return pd.Series(pd.to_datetime(np.asarray(values, dtype=np.int64), unit="ns", utc=True)).dt.tz_convert(tz)
+
+
+def write_csv(df, path, date_format=utc_format, **kwargs):
+    """to_csv with datetime columns formatted (in their own timezone) only here, at write time."""
+    df.to_csv(path, date_format=date_format, **kwargs)
+    return path
@@ -0,0 +1,188 @@
+"""
+Sliding-window (time-resolved) versions of the trial-level features.
+
+Windows are strided views over the signal arrays (no copies). Every feature is computed
+for all windows at once with array operations instead of a Python loop per window:
+
+- eda_window_features:    EDA Peaks, EDA Mean, EDA Std Dev      (extract_eda_features)
+- ppg_window_features:    HR, HRV                                (extract_ppg_features, from the beat table)
+- motion_window_features: Velocity Mean, Jerk Std Dev, Gyro Energy Mean (compute_motion_features)
+- eeg_window_features:    time/frequency features and optional band power per channel
+                          (extract_features, band_power)
+
+Window and hop lengths are given in seconds. Every result starts with the sample range
+of each window ('start', 'stop'), the start time when time_col is given, and the
+Activity at the window centre when the data is annotated.
+
+Peaks are detected once on the whole signal and counted per window, skipping the first
+and last sample of each window as find_peaks on the window itself would. Only peaks on
+a plateau cut by a window edge, or spaced by the PPG minimum distance across the edge,
+can differ from running the trial-level functions window by window. PPG beats come from
+the beat table of the whole signal (ppg_beats); a window uses the clean RR intervals
+between the beats inside it.
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import find_peaks, welch
+
+from eeg_features import trapezoid
+from instrumentation import instrumented, stage
+from ppg_beats import detect_beats
+
+
+def window_length(seconds, fs):
+    """Window or hop length in samples (at least one sample)."""
+    return max(int(round(seconds * fs)), 1)
+
+
+def window_starts(n_samples, window, hop):
+    """First sample of every complete window."""
+    if n_samples < window:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(0, n_samples - window + 1, hop, dtype=np.int64)
+
+
+def sliding_windows(signal, window, hop):
+    """Read-only (..., n_windows, window) view over the last axis of signal; no data is copied."""
+    return sliding_window_view(np.asarray(signal), window, axis=-1)[..., ::hop, :]
+
+
+def _window_frame(data, starts, window, time_col=None):
+    frame = pd.DataFrame({"start": starts, "stop": starts + window})
+    if time_col is not None:
+        frame["time"] = data[time_col].to_numpy()[starts]
+    if "Activity" in data.columns:
+        frame["Activity"] = data["Activity"].iloc[starts + window // 2].to_numpy()
+    return frame
+
+
+def _count_in_windows(positions, starts, lo, hi):
+    """Number of sorted positions p with start + lo <= p < start + hi, for every window."""
+    return np.searchsorted(positions, starts + hi) - np.searchsorted(positions, starts + lo)
+
+
+@instrumented()
+def eda_window_features(data, fs, window, hop, time_col=None):
+    w, h = window_length(window, fs), window_length(hop, fs)
+    eda = data['EDA'].to_numpy(dtype=float)
+    starts = window_starts(len(eda), w, h)
+    frame = _window_frame(data, starts, w, time_col)
+    if not len(starts):
+        return frame.assign(**{'EDA Peaks': [], 'EDA Mean': [], 'EDA Std Dev': []})
+
+    views = sliding_windows(eda, w, h)
+    peaks, _ = find_peaks(eda, height=0.05)
+    frame['EDA Peaks'] = _count_in_windows(peaks, starts, 1, w - 1)
+    frame['EDA Mean'] = views.mean(axis=-1)
+    frame['EDA Std Dev'] = views.std(axis=-1)
+    return frame
+
+
+@instrumented()
+def ppg_window_features(data, fs, window, hop, time_col=None, beats=None):
+    """HR and HRV per window from the clean RR intervals of the beat table (detected on the whole signal if not given)."""
+    w, h = window_length(window, fs), window_length(hop, fs)
+    n_samples = len(data)
+    starts = window_starts(n_samples, w, h)
+    frame = _window_frame(data, starts, w, time_col)
+    if not len(starts):
+        return frame.assign(HR=[], HRV=[])
+
+    if beats is None:
+        beats = detect_beats(data, fs, channels=['PGI'])
+    beats = beats[(beats['channel'] == 'PGI').to_numpy()]
+    peaks = beats['sample'].to_numpy()
+    if len(peaks) < 2:
+        return frame.assign(HR=0.0, HRV=0.0)
+    clean = (beats['quality'] == 0).to_numpy()
+    rr = np.where(clean, beats['rr'].to_numpy(), 0.0)
+
+    # Beats inside each window are peaks[lo:hi]; the RR intervals between them belong to beats lo + 1 .. hi - 1
+    lo = np.searchsorted(peaks, starts + 1)
+    hi = np.searchsorted(peaks, starts + w - 1)
+    first = np.minimum(lo + 1, len(peaks))
+    end = np.maximum(hi, first)
+
+    # Windowed count, sum and sum of squares of the clean RR intervals from cumulative sums
+    # (centred for numerical stability)
+    mean_rr = rr[clean].mean() if clean.any() else 0.0
+    centred = np.where(clean, rr - mean_rr, 0.0)
+    c0 = np.concatenate([[0], np.cumsum(clean)])
+    c1 = np.concatenate([[0.0], np.cumsum(centred)])
+    c2 = np.concatenate([[0.0], np.cumsum(centred ** 2)])
+    n_rr = c0[end] - c0[first]
+    divisor = np.maximum(n_rr, 1)
+    mean_centred = (c1[end] - c1[first]) / divisor
+    var = (c2[end] - c2[first]) / divisor - mean_centred ** 2
+
+    frame['HR'] = np.where(n_rr > 0, 60 / (mean_centred + mean_rr), 0.0)
+    frame['HRV'] = np.where(n_rr > 1, np.sqrt(np.clip(var, 0, None)), 0.0)
+    return frame
+
+
+@instrumented()
+def motion_window_features(data, fs, window, hop, time_col=None):
+    w, h = window_length(window, fs), window_length(hop, fs)
+    if w < 2:
+        raise ValueError("Motion windows need at least two samples to compute jerk.")
+    acc_magnitude = np.sqrt(data['ACC_x'].to_numpy(dtype=float)**2 + data['ACC_y'].to_numpy(dtype=float)**2
+                            + data['ACC_z'].to_numpy(dtype=float)**2)
+    gyro_energy = np.sqrt(data['GY_x'].to_numpy(dtype=float)**2 + data['GY_y'].to_numpy(dtype=float)**2
+                          + data['GY_z'].to_numpy(dtype=float)**2)
+    starts = window_starts(len(acc_magnitude), w, h)
+    frame = _window_frame(data, starts, w, time_col)
+    if not len(starts):
+        return frame.assign(**{'Velocity Mean': [], 'Jerk Std Dev': [], 'Gyro Energy Mean': []})
+
+    # Mean of the within-window cumulative sum: sample j contributes (w - j) / w times
+    velocity_weights = (w - np.arange(w)) / (w * fs)
+    frame['Velocity Mean'] = sliding_windows(acc_magnitude, w, h) @ velocity_weights
+    frame['Jerk Std Dev'] = sliding_windows(np.diff(acc_magnitude) * fs, w - 1, h).std(axis=-1)
+    frame['Gyro Energy Mean'] = sliding_windows(gyro_energy, w, h).mean(axis=-1)
+    return frame
+
+
+@instrumented()
+def eeg_window_features(data, channels, fs, window, hop, bands=None, nperseg=1024, time_col=None):
+    """Tidy rows (one per window and channel) of the extract_features set, plus band power if bands are given."""
+    w, h = window_length(window, fs), window_length(hop, fs)
+    signals = np.ascontiguousarray(data[channels].to_numpy(dtype=float).T)  # channel-major
+    starts = window_starts(signals.shape[1], w, h)
+    frame = _window_frame(data, starts, w, time_col)
+    n_windows = len(starts)
+
+    columns = ['mean', 'std_dev', 'min', 'max', 'range', 'mean_psd', 'max_psd', 'freq_with_max_psd']
+    columns += list(bands) if bands else []
+    if not n_windows:
+        return frame.assign(channel=[], **{c: [] for c in columns})
+
+    views = sliding_windows(signals, w, h)  # (channel, window, sample)
+    features = {
+        'mean': views.mean(axis=-1),
+        'std_dev': views.std(axis=-1),
+        'min': views.min(axis=-1),
+        'max': views.max(axis=-1),
+    }
+    features['range'] = features['max'] - features['min']
+
+    freqs = np.fft.rfftfreq(w, 1 / fs)
+    psd = np.abs(np.fft.rfft(views, axis=-1)) ** 2
+    features['mean_psd'] = psd.mean(axis=-1)
+    features['max_psd'] = psd.max(axis=-1)
+    features['freq_with_max_psd'] = freqs[psd.argmax(axis=-1)]
+
+    if bands:
+        with stage("welch", rows=signals.shape[1]):
+            welch_freqs, welch_psd = welch(views, fs, nperseg=min(nperseg, w), axis=-1)
+        for band, (low, high) in bands.items():
+            mask = (welch_freqs >= low) & (welch_freqs <= high)
+            features[band] = trapezoid(welch_psd[..., mask], welch_freqs[mask], axis=-1)
+
+    # (channel, window) -> rows ordered by window, then channel
+    rows = frame.loc[frame.index.repeat(len(channels))].reset_index(drop=True)
+    rows['channel'] = np.tile(channels, n_windows)
+    for name in columns:
+        rows[name] = features[name].T.reshape(-1)
+    return rows